@@ -1,65 +1,579 @@
 # agent.py
 import json
 import time
-from openai import OpenAI
-from config import API_KEY, BASE_URL, MODEL_NAME
-from cleaner import get_simplified_html
-
-client = OpenAI(api_key=API_KEY, base_url=BASE_URL)
-
-def get_ai_decision(task_description, page, page_html, last_action_desc="None"):
-    # 1. 清洗页面
-    obs_text, _, clean_len = get_simplified_html(page, page_html)
-    
-    # 2. 构造 Prompt (核心修改：增加防循环逻辑)
-    system_prompt = f"""
-    你是一个全能 Web Agent。
-    当前网页状态:
-    ===
-    {obs_text}
-    ===
-    
-    总任务: "{task_description}"
-    上一步操作: "{last_action_desc}"
-    
-    ⚠️ 必须严格遵守的决策逻辑:
-    1. **禁止回退 (Anti-Loop)**: 
-       - 如果上一步操作是 "key Enter" 或 "click search"，且当前 URL 已经发生变化（例如变成了 /search 或 /result），说明搜索已成功！
-       - 此时，即使任务里写着“去某某网站”，也**绝对不要**再使用 "goto" 跳回首页！请直接在当前页面寻找结果。
-    
-    2. **域名检查 (Domain Check)**:
-       - 如果任务要求去 "movie.douban.com"，而当前 URL 是 "search.douban.com"，这属于同一个网站的子页面，**视为已到达**，不需要再 goto。
-
-    3. **常规操作**:
-       - 输入检查: 如果 [输入框] 里的内容已正确，直接按 key Enter。
-       - 滚动: 如果找不到目标，使用 "scroll"。
-       - 结束: 找到答案后，输出 finish。
-    
-    输出 JSON:
-    {{
-        "action": "click" | "type" | "key" | "scroll" | "goto" | "finish",
-        "id": "目标ID",
-        "value": "内容",
-        "reasoning": "解释为什么（例如：URL已变，搜索成功，不再跳转，开始寻找海报...）"
-    }}
-    """
-    
-    start_time = time.time()
+import threading
+from config import MODEL_NAME, OBSERVATION_WINDOW, FAST_MODEL_NAME, ROUTE_HARD_ELEMENTS, ROUTE_VERIFY_FINISH, OBSERVATION_DIFF, DECISION_CACHE_MODE, HISTORY_WINDOW, STREAM_DECISIONS, OBSERVATION_ENCODING, PLAN_MODE
+from cleaner import get_observation, observation_elements, state_fingerprint, ObservationTracker
+from decision_cache import DecisionCache
+from llm_client import DecisionClient, LLMError, LLMBadResponse
+from tracing import span, current_span
+from executor import OK
+
+llm = DecisionClient()
+decision_cache = DecisionCache() if DECISION_CACHE_MODE != "off" else None
+
+# 决策失败 (LLM 出错、回放缺失) 时返回的动作，和 finish 区分开：
+# 调用方看到它就停止任务并记为失败，原因在 decision["status"]
+ABORT = "abort"
+
+# 最近操作过的元素记几个 (观测排序时给它们加分)
+RECENT_IDS_KEPT = 5
+
+# 分流：快模型先出决策，遇到难的步骤或不合格的输出再交给强模型 (MODEL_NAME)
+FAST, STRONG = "fast", "strong"
+VALID_ACTIONS = ("click", "type", "key", "scroll", "scroll_to", "goto", "finish")
+TARGETED_ACTIONS = ("click", "type", "scroll_to")  # 必须带一个当前页面上存在的 id (scroll_to 是区域 id)
+
+# 流式模式下，这几个字段到齐就可以开始执行动作
+HEAD_FIELDS = ("action", "id", "value")
+
+# 不同观测编码对应的格式说明，和 cleaner 的输出一一对应
+OBSERVATION_FORMAT_HELP = {
+    "verbose": """网页状态有两种:
+- 完整快照: 以 PAGE_INFO 开头，每行一个元素 "ID: 编号 | 类型: [输入框]/[按钮]/[未知] | <标签 Text=... CURRENT_VALUE=...>"。
+- 增量: 以 PAGE_DIFF 开头，只列出相对上一次观测的变化 (+ 新增 / - 消失 / ~ 变化)，未列出的元素保持不变；
+  "= " 开头的是页面上一直存在、之前没列出的元素。""",
+    "compact": """网页状态是紧凑表格:
+- 完整快照: 第一行 "PAGE|URL|标题"，第二行表头 "id|t|tag|text|value|hint"，之后每行一个元素。
+  t 是类型代码: I=输入框, B=按钮/链接, T=文本；value 是输入框当前内容 (过长会截断，以 … 结尾)；
+  hint 是 placeholder 或 aria-label；text 为 "^12" 表示和 ID 12 的文字相同。
+- 增量: 以 PAGE_DIFF 开头，只列出相对上一次观测的变化 (+ 新增行 / - 消失的 id / ~ 变化后的行)，未列出的元素保持不变；
+  "= " 开头的是页面上一直存在、之前没列出的行。""",
+}
+
+# 固定不变的 system 消息：所有任务、所有步骤完全相同，
+# 放在最前面，服务商的前缀缓存 (context cache) 才能命中。
+# 动态内容 (观测、目标、上一步) 一律放到后面的 user 轮次里。
+SYSTEM_PROMPT = """
+你是一个全能 Web Agent。每一轮你会收到上一步操作和当前网页状态，需要输出下一步操作。
+""" + OBSERVATION_FORMAT_HELP[OBSERVATION_ENCODING] + """
+
+⚠️ 必须严格遵守的决策逻辑:
+1. **禁止回退 (Anti-Loop)**:
+   - 如果上一步操作是 "key Enter" 或 "click search"，且当前 URL 已经发生变化（例如变成了 /search 或 /result），说明搜索已成功！
+   - 此时，即使任务里写着“去某某网站”，也**绝对不要**再使用 "goto" 跳回首页！请直接在当前页面寻找结果。
+
+2. **域名检查 (Domain Check)**:
+   - 如果任务要求去 "movie.douban.com"，而当前 URL 是 "search.douban.com"，这属于同一个网站的子页面，**视为已到达**，不需要再 goto。
+
+3. **常规操作**:
+   - 输入检查: 如果 [输入框] 里的内容已正确，直接按 key Enter。
+   - 滚动: 如果找不到目标，使用 "scroll"。
+   - 结束: 找到答案后，输出 finish。
+
+输出 JSON:
+{
+    "action": "click" | "type" | "key" | "scroll" | "goto" | "finish",
+    "id": "目标ID",
+    "value": "内容",
+    "reasoning": "解释为什么（例如：URL已变，搜索成功，不再跳转，开始寻找海报...）"
+}
+"""
+
+# 计划模式：允许一次输出多个动作
+PLAN_PROMPT = """
+4. **批量计划 (Plan)**: 如果接下来几步在当前页面上就能确定 (例如依次填用户名、密码再点登录)，可以一次输出多个动作:
+{
+    "plan": [
+        {"action": "type", "id": "3", "value": "standard_user"},
+        {"action": "type", "id": "4", "value": "secret_sauce"},
+        {"action": "click", "id": "5"}
+    ],
+    "reasoning": "..."
+}
+动作会按顺序执行；一旦出错、页面跳转或页面大幅变化，剩下的动作会被放弃，你会收到新的页面状态。
+只有一个动作时，仍然可以用上面的单动作格式。
+"""
+if PLAN_MODE:
+    SYSTEM_PROMPT += PLAN_PROMPT
+
+# 窗口模式：观测只含视口附近的元素，另有窗口外区域的索引
+WINDOW_PROMPT = """
+* **视口窗口 (Window)**: 网页状态只列出当前视口附近的元素。末尾的 VIEWPORT (compact 编码下为 "VIEW|起-止|全页高度") 是当前位置，
+  REGIONS 列出窗口外的标题/区块 (compact 编码下每行 "R编号|相对视口顶部的偏移px|文字")。
+  要找的东西不在列表里时，优先用 {"action": "scroll_to", "id": "R3"} 直接跳到相关区域，而不是反复 scroll。
+"""
+if OBSERVATION_WINDOW:
+    SYSTEM_PROMPT += WINDOW_PROMPT
+
+class AgentSession:
+    """
+    一个任务的决策状态。每个任务 (或 GUI 里的每条指令) 新建一个。
+    tracker: 上一步发给 LLM 的元素集合，用来只发增量
+    turns: 只追加的历史轮次 [(user, assistant), ...]，超出窗口时整块裁剪
+    """
+    def __init__(self):
+        self.tracker = ObservationTracker() if OBSERVATION_DIFF else None
+        self.turns = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.cached_prompt_tokens = 0
+        self.uncached_prompt_tokens = 0
+        self.total_tokens = 0
+        self.total_latency = 0
+        self.pending = None  # 最近一次 (可能还在流式收尾的) 决策
+        self.recent_ids = []  # 最近几步操作过的元素，排序时加分
+        self.checkpoint = None  # 最近一次决策之前的 (历史轮数, recent_ids, tracker 基线)，rollback() 用
+        self.llm_calls = 0  # 真正发出去的 LLM 请求数 (计划模式下一次调用可能对应多步动作)
+        self.seen_states = set()  # 见过的页面状态指纹，重复出现说明在原地打转
+        self.escalations = 0
+        self.tiers = {FAST: [0, 0, 0.0], STRONG: [0, 0, 0.0]}  # 档位 -> [调用次数, token, 耗时]
+
+    def trim_history(self):
+        """
+        超出 HISTORY_WINDOW 时一次裁到一半，而不是每步滑动一格：
+        滑动窗口每步都会改变前缀，缓存永远打不中；整块裁剪只在裁剪那一步失效。
+        返回是否发生了裁剪。
+        """
+        if len(self.turns) < HISTORY_WINDOW:
+            return False
+        self.turns = self.turns[-(HISTORY_WINDOW // 2):] if HISTORY_WINDOW > 1 else []
+        return True
+
+    def rollback(self):
+        """
+        撤销最近一次决策 (例如被打转检测否决、没有执行)：去掉它的历史轮次，恢复 recent_ids 和增量基线。
+        不撤销的话，下一次请求的历史里会有一个没执行过的动作，后面紧跟 "(元素没有变化)"，模型会以为那个动作没效果。
+        token 和耗时照常计入 (调用确实发生了)。
+        """
+        if self.pending:
+            self.pending.result()
+        if self.checkpoint is None:
+            return
+        turns, recent_ids, baseline = self.checkpoint
+        self.turns = self.turns[:turns]
+        self.recent_ids = recent_ids
+        if self.tracker:
+            self.tracker.restore(baseline)
+        self.checkpoint = None
+
+    def stats(self):
+        """汇总到 task_data 的统计字段 (会等最后一次决策收尾)"""
+        if self.pending:
+            self.pending.result()
+        return {
+            "total_tokens": self.total_tokens,
+            "total_latency": self.total_latency,
+            "llm_calls": self.llm_calls,
+            "cache_hits": self.cache_hits,
+            "cache_misses": self.cache_misses,
+            "cached_prompt_tokens": self.cached_prompt_tokens,
+            "uncached_prompt_tokens": self.uncached_prompt_tokens,
+            "fast_calls": self.tiers[FAST][0],
+            "fast_tokens": self.tiers[FAST][1],
+            "fast_latency": self.tiers[FAST][2],
+            "strong_calls": self.tiers[STRONG][0],
+            "strong_tokens": self.tiers[STRONG][1],
+            "strong_latency": self.tiers[STRONG][2],
+            "escalations": self.escalations,
+        }
+
+    def account_call(self, tier, usage, latency):
+        """记一次真正的模型调用 (升级前的快模型调用也算)"""
+        tokens = usage.total_tokens if usage else 0
+        self.llm_calls += 1
+        self.total_tokens += tokens
+        stats = self.tiers[tier]
+        stats[0] += 1
+        stats[1] += tokens
+        stats[2] += latency
+        if usage:
+            cached, uncached = split_prompt_tokens(usage)
+            self.cached_prompt_tokens += cached
+            self.uncached_prompt_tokens += uncached
+        return tokens
+
+def route_step(session, observation, page, last_status=None):
+    """
+    这一步该用哪一档模型，返回 (档位, 原因, 当前页面上所有元素 id)。id 用来校验快模型的输出。
+    没配置 FAST_MODEL_NAME 时一律用强模型 (不解析页面，id 集合为空)。以下情况直接上强模型:
+    上一步动作失败 (last_status 是 executor 返回的状态，不是 OK)、页面状态和之前某一步完全相同 (原地打转)、
+    页面元素很多 (要在大量结果里挑)。
+    """
+    if not FAST_MODEL_NAME:
+        return STRONG, None, set()
+    url, elements = observation_elements(page, observation)
+    valid_ids = {el['id'] for el in elements}
+    if isinstance(observation, dict):
+        valid_ids |= {r['id'] for r in observation.get('regions') or []}
+
+    state = state_fingerprint(url, elements, observation)
+    repeated = session is not None and state in session.seen_states
+    if session is not None:
+        session.seen_states.add(state)
+
+    if last_status not in (None, OK):
+        return STRONG, f"last action {last_status}", valid_ids
+    if repeated:
+        return STRONG, "repeated state", valid_ids
+    if len(elements) > ROUTE_HARD_ELEMENTS:
+        return STRONG, f"{len(elements)} elements", valid_ids
+    return FAST, None, valid_ids
+
+def validate_decision(decision, valid_ids):
+    """快模型的输出是否可以直接执行；不行就返回原因"""
+    for step in decision.get('plan') or [decision]:
+        action = step.get('action')
+        if action not in VALID_ACTIONS:
+            return f"invalid action {action!r}"
+        if action in TARGETED_ACTIONS and step.get('id') not in valid_ids:
+            return f"unknown id {step.get('id')!r}"
+        if action == "finish" and ROUTE_VERIFY_FINISH:
+            return "finish needs confirmation"
+    return None
+
+def get_ai_decision(task_description, page, observation, last_action_desc="None", session=None):
+    """阻塞版本：等完整决策返回 (decision, tokens, latency, clean_len)"""
+    return start_ai_decision(task_description, page, observation, last_action_desc, session).result()
+
+def start_ai_decision(task_description, page, observation, last_action_desc="None", session=None, on_reasoning=None,
+                      tier=None, last_status=None):
+    """
+    发起一次决策，返回 PendingDecision。
+    流式模式下 pending.head() 在 action/id/value 到齐时就返回，调用方可以马上执行动作，
+    reasoning 继续在后台线程里流式生成 (on_reasoning 收到目前为止的完整 reasoning 文本)。
+    tier: 强制用某一档模型 (例如检测到原地打转时直接上强模型)，None = 按 route_step 分流。
+    last_status: 上一步 execute_plan 返回的 status (第一步为 None)，分流时用来判断上一步是否失败。
+    页面相关的读取都在调用线程里完成，后台线程只碰网络。
+    """
+    # 0. 上一次决策还在流式收尾时先等它结束，历史轮次要按顺序追加
+    if session and session.pending:
+        session.pending.result()
+
+    # 1. 裁剪历史。被裁掉的轮次里可能有增量的基线快照，所以这一步要重新发完整快照
+    tracker = session.tracker if session else None
+    if session and session.trim_history() and tracker:
+        tracker.reset()
+    if session:
+        session.checkpoint = (len(session.turns), list(session.recent_ids), tracker.checkpoint() if tracker else None)
+
+    # 2. 清洗页面 (observation: 注入脚本返回的 JSON，或 html 模式下的 page.content())
+    recent_ids = session.recent_ids if session else ()
+    obs_text, _, clean_len, _ = get_observation(page, observation, tracker, task_description, recent_ids)
+
+    # 3. 构造多轮消息: 固定 system + 历史轮次 + 本轮
+    step_prompt = build_step_prompt(obs_text, last_action_desc)
+    messages = build_messages(task_description, session.turns if session else [], step_prompt)
+    request = DecisionRequest(session, step_prompt, messages, clean_len)
+    pending = PendingDecision()
+    if session: session.pending = pending
+
+    # 4. 选档位 (缓存的 key 里要带上这一档的模型)
+    request.tier, reason, request.valid_ids = route_step(session, observation, page, last_status)
+    if tier and tier != request.tier:
+        request.tier, reason = tier, "loop detected"
+
+    # 5. 查缓存 (record / replay 模式)。key 带分流选中的模型：快模型和强模型的决策不共用缓存，
+    # 存的是这一档最终采用的决策 (快模型不合格、升级到强模型时存强模型的输出)
+    if decision_cache:
+        url, elements = observation_elements(page, observation)
+        state = state_fingerprint(url, elements, observation)
+        model = FAST_MODEL_NAME if request.tier == FAST else MODEL_NAME
+        request.cache_key = decision_cache.make_key(model, task_description, state, last_action_desc)
+        content = decision_cache.get(request.cache_key)
+        if content is not None:
+            if session: session.cache_hits += 1
+            pending.resolve(request.complete(content, None, from_cache=True))
+            return pending
+
+        if session: session.cache_misses += 1
+        if DECISION_CACHE_MODE == "replay":
+            print("Replay Miss: 缓存中没有这一步的决策")
+            pending.resolve(request.fail("replay_miss", "缓存中没有这一步的决策"))
+            return pending
+
+    # 6. 调用 LLM
+    if reason:
+        print(f"🧭 直接使用强模型: {reason}")
+    if STREAM_DECISIONS:
+        threading.Thread(target=_run_decision, args=(request, pending, on_reasoning), daemon=True).start()
+    else:
+        _run_decision(request, pending, None)
+    return pending
+
+def _run_decision(request, pending, on_reasoning):
+    """调用模型拿到完整决策；快模型的输出不合格就升级到强模型重来一次"""
+    try:
+        content, usage = _call_model(request, pending, on_reasoning)
+        if request.tier == FAST:
+            problem = _check_content(content, request.valid_ids)
+            # 流式模式下头部已经放行执行的，不能再换决策
+            if problem and not pending.head_ready():
+                print(f"🧭 快模型输出不合格 ({problem})，升级到强模型")
+                if request.session: request.session.escalations += 1
+                request.tier = STRONG
+                content, usage = _call_model(request, pending, on_reasoning)
+        pending.resolve(request.complete(content, usage))
+    except LLMError as e:
+        print(f"LLM Error ({e.status}): {e}")
+        pending.resolve(request.fail(e.status, str(e)))
+    except Exception as e:
+        # 流式模式下这里跑在后台线程，不 resolve 的话下一次决策和 stats() 会永远卡在 result() 上
+        print(f"LLM Error (llm_error): {type(e).__name__}: {e}")
+        pending.resolve(request.fail(LLMError.status, f"{type(e).__name__}: {e}"))
+
+def _check_content(content, valid_ids):
     try:
-        response = client.chat.completions.create(
-            model=MODEL_NAME,
-            messages=[{"role": "user", "content": system_prompt}],
+        return validate_decision(parse_decision(content), valid_ids)
+    except Exception as e:
+        return f"bad json: {e}"
+
+def _call_model(request, pending, on_reasoning):
+    """按 request.tier 调用一次模型，返回 (content, usage)"""
+    model = FAST_MODEL_NAME if request.tier == FAST else MODEL_NAME
+    # 流式模式下在后台线程里运行，父 span 要显式传
+    with span("llm", parent=request.trace_parent, model=model, tier=request.tier, stream=STREAM_DECISIONS) as s:
+        content, usage = _request_model(request, pending, on_reasoning, model)
+        if usage:
+            cached, _ = split_prompt_tokens(usage)
+            s.set(prompt_tokens=usage.prompt_tokens, cached_tokens=cached, completion_tokens=usage.completion_tokens)
+    return content, usage
+
+def _request_model(request, pending, on_reasoning, model):
+    """
+    流式模式下头部字段一完整就放行执行器；快模型的头部要先通过校验，不合格的不放行 (随后会升级)。
+    """
+    start = time.time()
+    if not STREAM_DECISIONS:
+        response = llm.complete(
+            model=model,
+            messages=request.messages,
             response_format={"type": "json_object"},
             temperature=0.0
         )
-        content = response.choices[0].message.content
-        decision = json.loads(content)
-        
-        if 'id' in decision and isinstance(decision['id'], int):
-            decision['id'] = str(decision['id'])
-            
-        return decision, response.usage.total_tokens, time.time() - start_time, clean_len
-        
-    except Exception as e:
-        print(f"LLM Error: {e}")
-        return {"action": "finish", "reasoning": "Error"}, 0, 0, 0
\ No newline at end of file
+        request.account(response.usage, time.time() - start)
+        return response.choices[0].message.content, response.usage
+
+    parser = StreamingFields()
+    usage = None
+    stream = llm.stream(
+        model=model,
+        messages=request.messages,
+        response_format={"type": "json_object"},
+        temperature=0.0,
+        stream=True,
+        stream_options={"include_usage": True},
+    )
+    for chunk in stream:
+        if chunk.usage:
+            usage = chunk.usage
+        if not chunk.choices or not chunk.choices[0].delta.content:
+            continue
+        parser.feed(chunk.choices[0].delta.content)
+        if not pending.head_ready() and parser.head_complete(HEAD_FIELDS):
+            head = normalize_decision(parser.fields)
+            if request.tier != FAST or validate_decision(head, request.valid_ids) is None:
+                pending.set_head(head)
+        if on_reasoning and "reasoning" in parser.partial:
+            on_reasoning(parser.partial["reasoning"])
+    request.account(usage, time.time() - start)
+    return parser.buffer, usage
+
+class DecisionRequest:
+    """一次决策调用的上下文，负责调用结束后的记账 (历史、缓存、token 统计)"""
+    def __init__(self, session, step_prompt, messages, clean_len):
+        self.session = session
+        self.step_prompt = step_prompt
+        self.messages = messages
+        self.clean_len = clean_len
+        self.cache_key = None
+        self.start_time = time.time()
+        self.tier = STRONG
+        self.valid_ids = set()
+        self.tokens = 0  # 本次决策所有模型调用的 token 之和 (包括升级前的快模型)
+        self.trace_parent = current_span()
+
+    def account(self, usage, latency):
+        if self.session:
+            self.tokens += self.session.account_call(self.tier, usage, latency)
+        elif usage:
+            self.tokens += usage.total_tokens
+
+    def complete(self, content, usage, from_cache=False):
+        try:
+            decision = parse_decision(content)
+        except Exception as e:
+            error = LLMBadResponse(f"{e}: {content[:100]!r}")
+            print(f"LLM Error ({error.status}): {error}")
+            return self.fail(error.status, str(error))
+
+        latency = time.time() - self.start_time
+        tokens = self.tokens
+        if self.cache_key and not from_cache:
+            decision_cache.put(self.cache_key, content)
+
+        session = self.session
+        if session:
+            session.turns.append((self.step_prompt, content))
+            acted = [step.get('id') for step in decision.get('plan') or [decision] if isinstance(step, dict)]
+            session.recent_ids = (session.recent_ids + [i for i in acted if i])[-RECENT_IDS_KEPT:]
+            session.total_latency += latency
+        return decision, tokens, latency, self.clean_len
+
+    def fail(self, status, reason):
+        # 模型没看到这次观测 (或者输出无效)，下一步必须重新发完整快照
+        if self.session and self.session.tracker:
+            self.session.tracker.reset()
+        return {"action": ABORT, "status": status, "reasoning": reason}, 0, 0, 0
+
+class PendingDecision:
+    """
+    一次可能还在进行中的决策。
+    head(): action/id/value 到齐即返回 (非流式时等于完整决策)
+    result(): 等整个输出结束，返回 (decision, tokens, latency, clean_len)
+    """
+    def __init__(self):
+        self._head = None
+        self._result = None
+        self._head_event = threading.Event()
+        self._done_event = threading.Event()
+
+    def head_ready(self):
+        return self._head_event.is_set()
+
+    def set_head(self, head):
+        self._head = head
+        self._head_event.set()
+
+    def resolve(self, result):
+        self._result = result
+        if not self._head_event.is_set():
+            self.set_head(result[0])
+        self._done_event.set()
+
+    def head(self):
+        self._head_event.wait()
+        return dict(self._head)
+
+    def result(self):
+        self._done_event.wait()
+        return self._result
+
+class StreamingFields:
+    """
+    增量解析模型输出的顶层 JSON 对象。
+    fields: 值已经完整的字段；partial: 正在输出中的字符串字段 (目前为止的文本)；
+    keys: 已经出现过的所有键 (包括值还没完整的)。
+    """
+    _decoder = json.JSONDecoder()
+
+    def __init__(self):
+        self.buffer = ""
+        self.pos = 0
+        self.fields = {}
+        self.partial = {}
+        self.keys = []
+
+    def feed(self, text):
+        self.buffer += text
+        self._scan()
+
+    def head_complete(self, names):
+        """
+        头部字段全部到齐，或者模型在 action 之后开始输出别的字段 (说明它跳过了某些头部字段)。
+        action 之前出现的字段 (例如先写 reasoning) 不算。计划模式下整个 plan 数组完整即可。
+        """
+        if "plan" in self.fields:
+            return True
+        if "action" not in self.fields:
+            return False
+        if all(n in self.fields for n in names):
+            return True
+        after_action = self.keys[self.keys.index("action") + 1:]
+        return any(k not in names for k in after_action)
+
+    def _skip(self, chars):
+        while self.pos < len(self.buffer) and self.buffer[self.pos] in chars:
+            self.pos += 1
+
+    def _scan(self):
+        buf = self.buffer
+        while True:
+            self._skip(" \t\r\n{,")
+            if self.pos >= len(buf) or buf[self.pos] != '"':
+                return
+            try:
+                key, end = self._decoder.raw_decode(buf, self.pos)
+            except ValueError:
+                return  # 键还没输出完
+            colon = buf.find(":", end)
+            if colon < 0:
+                return
+            if key not in self.keys:
+                self.keys.append(key)
+
+            start = colon + 1
+            while start < len(buf) and buf[start] in " \t\r\n":
+                start += 1
+            if start >= len(buf):
+                return
+            try:
+                value, value_end = self._decoder.raw_decode(buf, start)
+            except ValueError:
+                # 值还没输出完，字符串值先记下已经收到的部分
+                if buf[start] == '"':
+                    self.partial[key] = _decode_partial_string(buf[start + 1:])
+                return
+            # 数字 / true / null 要看到后面的分隔符才算完整
+            if not isinstance(value, (str, list, dict)) and value_end >= len(buf):
+                return
+            self.fields[key] = value
+            self.partial.pop(key, None)
+            if isinstance(value, str):
+                self.partial[key] = value
+            self.pos = value_end
+
+def _decode_partial_string(raw):
+    """把半截 JSON 字符串尽量解码成可读文本"""
+    raw = raw.rstrip("\\")
+    try:
+        return json.loads('"' + raw + '"')
+    except ValueError:
+        return raw
+
+def parse_decision(content):
+    return normalize_decision(json.loads(content))
+
+def normalize_decision(decision):
+    decision = dict(decision)
+    if 'id' in decision and isinstance(decision['id'], int):
+        decision['id'] = str(decision['id'])
+    if isinstance(decision.get('plan'), list):
+        decision['plan'] = [normalize_decision(step) for step in decision['plan'] if isinstance(step, dict)]
+    return decision
+
+def split_prompt_tokens(usage):
+    """
+    返回 (命中前缀缓存的 prompt token, 未命中的 prompt token)。
+    DeepSeek 用 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+    OpenAI 兼容接口用 prompt_tokens_details.cached_tokens。
+    """
+    hit = getattr(usage, "prompt_cache_hit_tokens", None)
+    miss = getattr(usage, "prompt_cache_miss_tokens", None)
+    if hit is not None and miss is not None:
+        return hit, miss
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    return cached, usage.prompt_tokens - cached
+
+def build_messages(task_description, turns, step_prompt):
+    """
+    任务目标固定在窗口内第一轮 user 消息的开头：同一任务内这段前缀不变，
+    只有整块裁剪历史时才会变化一次。
+    """
+    goal_header = f'总任务: "{task_description}"\n\n'
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    for user_content, assistant_content in turns:
+        messages.append({"role": "user", "content": user_content})
+        messages.append({"role": "assistant", "content": assistant_content})
+    messages.append({"role": "user", "content": step_prompt})
+    messages[1]["content"] = goal_header + messages[1]["content"]
+    return messages
+
+def build_step_prompt(obs_text, last_action_desc):
+    return f"""上一步操作: "{last_action_desc}"
+当前网页状态:
+===
+{obs_text}
+===
+请输出下一步操作的 JSON。"""
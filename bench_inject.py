@@ -0,0 +1,101 @@
+# bench_inject.py
+"""
+注入脚本的微基准：在一个很大的合成页面上反复注入，比较每次注入在页面里花的时间。
+用法: python bench_inject.py [--items 3000] [--repeat 20]
+
+对比三种脚本 (每种用一个全新的页面，互不影响):
+  legacy        旧写法: 每个元素 getBoundingClientRect + getComputedStyle，同一个循环里改 border/title/value
+  overlay       当前注入脚本，高亮画在覆盖层里
+  no-highlight  当前注入脚本，不画高亮 (无头模式默认)
+计时用页面内的 performance.now()，不含 Playwright 往返。
+"""
+import json
+import argparse
+import statistics
+from playwright.sync_api import sync_playwright
+from injector import build_inject_js
+
+SELECTOR = 'a, button, input, textarea, select, [role="button"], [role="link"]'
+
+# 改写前的注入脚本 (读写交替、直接改页面元素样式)，只用来做对比
+LEGACY_INJECT_JS = """
+() => {
+    let index = 0;
+    const records = [];
+    document.querySelectorAll(%s).forEach(el => {
+        const rect = el.getBoundingClientRect();
+        const style = window.getComputedStyle(el);
+        if (rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none') {
+            const id = (index++).toString();
+            el.setAttribute('data-agent-id', id);
+            if (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA') el.setAttribute('value', el.value);
+            el.style.border = "2px solid red";
+            el.setAttribute('title', `ID: ${id}`);
+            records.push({ id: id, text: (el.textContent || '').trim().slice(0, 50), y: Math.round(rect.top) });
+        }
+    });
+    return records.length;
+}
+""" % json.dumps(SELECTOR)
+
+# 在页面里计时：把脚本源码 eval 成函数再调用
+TIMED_JS = """
+(src) => {
+    const f = (0, eval)('(' + src + ')');
+    const start = performance.now();
+    f();
+    return performance.now() - start;
+}
+"""
+
+
+def synthetic_page(items):
+    """结果列表式的长页面：卡片里有标题链接、描述、按钮，每 10 张卡片一个输入框"""
+    cards = []
+    for i in range(items):
+        extra = f'<input type="text" placeholder="备注 {i}">' if i % 10 == 0 else ""
+        cards.append(
+            f'<div class="card" style="padding:8px;margin:4px;border:1px solid #ddd">'
+            f'<h3><a href="#item-{i}">结果标题 {i}</a></h3>'
+            f'<p>这是第 {i} 条结果的描述文字，<span>标签 {i % 7}</span></p>'
+            f'<button type="button">加入收藏</button>{extra}</div>'
+        )
+    return (f'<html><head><title>合成页面 ({items} 项)</title></head><body>'
+            f'<nav><a href="#">首页</a><a href="#">分类</a></nav>'
+            f'<main>{"".join(cards)}</main></body></html>')
+
+
+def run(browser, html, script, repeat):
+    page = browser.new_page()
+    page.set_content(html)
+    timings = [page.evaluate(TIMED_JS, script) for _ in range(repeat)]
+    page.close()
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="注入脚本微基准")
+    parser.add_argument("--items", type=int, default=3000, help="合成页面的卡片数 (每张约 3 个可交互元素)")
+    parser.add_argument("--repeat", type=int, default=20, help="每种脚本注入几次")
+    args = parser.parse_args()
+
+    html = synthetic_page(args.items)
+    variants = [
+        ("legacy", LEGACY_INJECT_JS),
+        ("overlay", build_inject_js(SELECTOR, highlight=True)),
+        ("no-highlight", build_inject_js(SELECTOR, highlight=False)),
+    ]
+    with sync_playwright() as p:
+        browser = p.chromium.launch(headless=True)
+        print(f"合成页面: {args.items} 张卡片 | 每种脚本注入 {args.repeat} 次 (毫秒)")
+        print(f"{'脚本':<14}{'首次':>10}{'中位数':>10}{'p95':>10}")
+        for name, script in variants:
+            timings = run(browser, html, script, args.repeat)
+            steady = sorted(timings[1:] or timings)
+            p95 = steady[min(len(steady) - 1, int(len(steady) * 0.95))]
+            print(f"{name:<14}{timings[0]:>10.1f}{statistics.median(steady):>10.1f}{p95:>10.1f}")
+        browser.close()
+
+
+if __name__ == "__main__":
+    main()
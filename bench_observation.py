@@ -0,0 +1,58 @@
+# bench_observation.py
+"""
+比较 verbose / compact 两种观测编码每个页面花多少 token。
+用法: python bench_observation.py [页面.html ...]   (默认跑 fixtures/*.html)
+页面可以是已经注入过 data-agent-id 的保存页 (page.content())，也可以是原始 HTML，
+后者按 interactive_agent.py 的选择器在本地打标 (不判断可见性)。
+"""
+import os
+import sys
+import glob
+from bs4 import BeautifulSoup
+from cleaner import parse_html_elements, format_elements, estimate_tokens
+
+# 和 interactive_agent.py 的注入选择器一致
+SELECTOR = 'a, button, input, textarea, select, [role="button"], [role="link"], h3, span, div[role="textbox"]'
+
+try:
+    import tiktoken
+    _encoder = tiktoken.get_encoding("cl100k_base")
+    count_tokens = lambda text: len(_encoder.encode(text))
+    TOKENIZER = "tiktoken/cl100k_base"
+except ImportError:
+    count_tokens = estimate_tokens
+    TOKENIZER = "estimate_tokens (未安装 tiktoken)"
+
+
+def load_elements(path):
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+    if "data-agent-id" not in html:
+        soup = BeautifulSoup(html, "html.parser")
+        for i, tag in enumerate(soup.select(SELECTOR)):
+            tag["data-agent-id"] = str(i)
+            if tag.name in ("input", "textarea") and not tag.get("value"):
+                tag["value"] = ""
+        html = str(soup)
+    title = BeautifulSoup(html, "html.parser").title
+    return (title.get_text(strip=True) if title else ""), parse_html_elements(html)
+
+
+def main(paths):
+    print(f"Tokenizer: {TOKENIZER}")
+    print(f"{'页面':<28}{'元素':>6}{'verbose':>10}{'compact':>10}{'节省':>8}")
+    total_verbose = total_compact = 0
+    for path in paths:
+        title, elements = load_elements(path)
+        url = "file://" + path
+        verbose = count_tokens("\n".join(format_elements(url, title, elements, "verbose")))
+        compact = count_tokens("\n".join(format_elements(url, title, elements, "compact")))
+        total_verbose += verbose
+        total_compact += compact
+        print(f"{os.path.basename(path):<28}{len(elements):>6}{verbose:>10}{compact:>10}{1 - compact / verbose:>8.0%}")
+    if total_verbose:
+        print(f"{'合计':<28}{'':>6}{total_verbose:>10}{total_compact:>10}{1 - total_compact / total_verbose:>8.0%}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or sorted(glob.glob("fixtures/*.html")))
@@ -0,0 +1,354 @@
+# benchmark.py
+"""
+离线基准：fixtures/ 下的保存页由本地 HTTP 服务提供，决策来自本地 mock LLM (按脚本返回 + 可配置延迟)，
+浏览器不解析外网域名。结果不受网络和模型服务负载影响，可以跨提交对比。
+
+用法:
+    python benchmark.py [--repeat 3] [--latency 0.3] [--jitter 0] [--output bench.json] [--compare 旧结果.json]
+
+每个任务 (重复 repeat 次取中位数) 报告: 成功率、步数、总耗时、各阶段的独占耗时
+(inject / content / clean / llm / act / settle)、token、Python 进程峰值内存、任务结束时的页面 JS 堆。
+任务走 run_experiment.execute_task，和批量实验是同一条代码路径；阶段计时靠在几个入口函数外面包一层计时器。
+"""
+import os
+import re
+import sys
+import json
+import time
+import argparse
+import functools
+import threading
+import statistics
+import subprocess
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from playwright.sync_api import sync_playwright, Page
+import agent
+import executor
+import run_experiment
+from settle import PageSettler
+from mock_llm_server import MockLLMServer
+from config import (HEADLESS_MODE, OBSERVATION_MODE, OBSERVATION_DIFF, OBSERVATION_WINDOW, OBSERVATION_ENCODING,
+                    OBSERVATION_TOKEN_BUDGET, STREAM_DECISIONS, PLAN_MODE, EXPERIMENT_LOAD_PROFILE)
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+STAGES = ("inject", "content", "clean", "llm", "act", "settle")
+
+# 外网域名一律解析失败，保存页里残留的外链、统计脚本不会真的发出去
+OFFLINE_ARGS = ["--host-resolver-rules=MAP * ~NOTFOUND, EXCLUDE 127.0.0.1"]
+
+# 离线任务：path 是 fixtures/ 下的起始页；script 是 mock LLM 依次返回的决策，
+# target 是元素上的文字 (text / value / placeholder / aria)，mock 在观测里找到对应的 id
+BENCH_TASKS = [
+    {
+        "id": 1,
+        "name": "SauceDemo (Login & Add Cart)",
+        "path": "saucedemo_login.html",
+        "goal": "1. 登录(用户名: standard_user, 密码: secret_sauce). 2. 找到 'Sauce Labs Backpack' 并点击 'Add to cart'. 3. 点击右上角的购物车图标.",
+        "max_steps": 8,
+        "script": [
+            ("type", "Username", "standard_user"),
+            ("type", "Password", "secret_sauce"),
+            ("click", "Login", ""),
+            ("click", "Add to cart", ""),
+            ("click", "Shopping Cart", ""),
+            ("finish", None, ""),
+        ],
+    },
+    {
+        "id": 2,
+        "name": "Douban Movie Search",
+        "path": "douban_home.html",
+        "goal": "在搜索框输入 '肖申克的救赎' 并回车。在结果页中点击第一个电影标题(通常是带有海报的那个)。",
+        "max_steps": 6,
+        "script": [
+            ("type", "搜索电影", "肖申克的救赎"),
+            ("key", "搜索电影", "Enter"),
+            ("click", "The Shawshank Redemption", ""),
+            ("finish", None, ""),
+        ],
+    },
+    {
+        "id": 3,
+        "name": "Baidu Search",
+        "path": "baidu_home.html",
+        "goal": "在搜索框输入 'DeepSeek'，然后按回车",
+        "max_steps": 4,
+        "script": [
+            ("type", "搜索输入框", "DeepSeek"),
+            ("key", "搜索输入框", "Enter"),
+            ("finish", None, ""),
+        ],
+    },
+]
+
+# 观测里的一行元素: verbose "ID: 3 | ..."，compact "3|I|..."，增量里前面可能带 "+ " / "~ "
+ELEMENT_LINE = re.compile(r"^(?:[+~] )?(?:ID: )?([\w-]+) ?\|")
+
+
+def find_id(messages, target):
+    """从最新的观测往前找包含 target 的元素行 (增量观测里没变的元素只出现在更早的快照里)"""
+    for message in reversed(messages):
+        if message["role"] != "user":
+            continue
+        for line in message["content"].splitlines():
+            match = ELEMENT_LINE.match(line)
+            if match and target in line[match.end():]:
+                return match.group(1)
+    return None
+
+
+def scripted_responses(tasks):
+    """mock LLM 的回复函数：按目标认出任务，按历史里已有的决策数决定走到脚本第几步"""
+    by_goal = {task["goal"]: task["script"] for task in tasks}
+
+    def respond(body):
+        messages = body.get("messages", [])
+        goal = re.search(r'总任务: "(.*?)"\n', messages[1]["content"], re.S) if len(messages) > 1 else None
+        script = by_goal.get(goal.group(1) if goal else None, [])
+        step = sum(1 for m in messages if m["role"] == "assistant")
+        if step >= len(script):
+            return {"reasoning": "脚本已走完", "action": "finish"}
+        action, target, value = script[step]
+        decision = {"reasoning": f"脚本第 {step + 1} 步", "action": action, "value": value}
+        if target:
+            decision["id"] = find_id(messages, target) or "?"
+        return decision
+
+    return respond
+
+
+class StageTimer:
+    """
+    给入口函数包一层计时，按阶段累计独占时间 (嵌套的子阶段耗时从父阶段里扣掉，
+    例如 observe 里的 settle 只算 settle)。每个线程一个调用栈，流式决策的后台线程也能正确计时。
+    """
+
+    def __init__(self):
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.totals = {}
+        self.originals = []
+
+    def wrap(self, owner, name, stage):
+        original = getattr(owner, name)
+        timer = self
+
+        @functools.wraps(original)
+        def timed(*args, **kwargs):
+            stack = timer._stack()
+            frame = [0.0]  # 子阶段累计耗时
+            stack.append(frame)
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                elapsed = time.perf_counter() - start
+                stack.pop()
+                if stack:
+                    stack[-1][0] += elapsed
+                with timer.lock:
+                    timer.totals[stage] = timer.totals.get(stage, 0.0) + elapsed - frame[0]
+
+        setattr(owner, name, timed)
+        self.originals.append((owner, name, original))
+
+    def hook(self, owner, name, before):
+        """调用前先执行 before(*args) (不计时)"""
+        original = getattr(owner, name)
+
+        @functools.wraps(original)
+        def hooked(*args, **kwargs):
+            before(*args)
+            return original(*args, **kwargs)
+
+        setattr(owner, name, hooked)
+        self.originals.append((owner, name, original))
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def reset(self):
+        with self.lock:
+            self.totals = {}
+
+    def snapshot(self):
+        with self.lock:
+            return {stage: self.totals.get(stage, 0.0) for stage in STAGES}
+
+    def restore(self):
+        for owner, name, original in reversed(self.originals):
+            setattr(owner, name, original)
+        self.originals = []
+
+
+def instrument(timer, heap):
+    """按阶段挂计时器。run_experiment 是 from ... import 进来的名字，要在它自己的命名空间里替换"""
+    timer.wrap(run_experiment, "observe", "inject")
+    timer.wrap(Page, "content", "content")
+    timer.wrap(agent, "get_observation", "clean")
+    timer.wrap(agent, "_call_model", "llm")
+    timer.wrap(executor, "_perform", "act")
+    timer.wrap(PageSettler, "wait", "settle")
+
+    def sample_heap(page, *args):
+        # 关页面之前读一次 JS 堆 (只有 Chromium 有 performance.memory)
+        try:
+            heap.append(page.evaluate("() => performance.memory ? performance.memory.usedJSHeapSize : 0"))
+        except:
+            pass
+    timer.hook(Page, "close", sample_heap)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Windows 没有 resource 模块
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 单位是 KB，macOS 是字节
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, directory=FIXTURES, **kwargs)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve_fixtures():
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), FixtureHandler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd, "http://127.0.0.1:%d" % httpd.server_address[1]
+
+
+def run_once(browser, task, site, timer, heap):
+    timer.reset()
+    del heap[:]
+    context = browser.new_context()
+    start = time.perf_counter()
+    try:
+        data = run_experiment.execute_task(dict(task, url=f"{site}/{task['path']}"), context)
+    finally:
+        context.close()
+    wall = time.perf_counter() - start
+    stages = timer.snapshot()
+    return {
+        "success": bool(data and data["success"]),
+        "steps": data["steps_taken"] if data else 0,
+        "wall": wall,
+        **stages,
+        "other": max(0.0, wall - sum(stages.values())),
+        "tokens": data["total_tokens"] if data else 0,
+        "js_heap_mb": heap[-1] / 1024 / 1024 if heap else None,
+        "py_peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def summarize(runs):
+    """重复运行的中位数；success 记成功率"""
+    summary = {"runs": len(runs), "success_rate": sum(r["success"] for r in runs) / len(runs)}
+    for key in ("steps", "wall") + STAGES + ("other", "tokens", "js_heap_mb", "py_peak_rss_mb"):
+        values = [r[key] for r in runs if r[key] is not None]
+        summary[key] = statistics.median(values) if values else None
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except:
+        return "unknown"
+
+
+def print_table(results):
+    print(f"\n{'任务':<30}{'成功':>6}{'步数':>6}{'总耗时':>9}" + "".join(f"{s:>9}" for s in STAGES)
+          + f"{'other':>9}{'tokens':>9}{'JS堆MB':>9}")
+    for name, r in results.items():
+        heap = f"{r['js_heap_mb']:.1f}" if r["js_heap_mb"] is not None else "-"
+        print(f"{name:<30}{r['success_rate']:>6.0%}{r['steps']:>6.0f}{r['wall']:>9.2f}"
+              + "".join(f"{r[s]:>9.3f}" for s in STAGES) + f"{r['other']:>9.3f}{r['tokens']:>9.0f}{heap:>9}")
+
+
+def print_comparison(results, baseline):
+    """和另一次基准结果逐项比较 (正数 = 变慢 / 变多)"""
+    print(f"\n对比基线 {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    for name, r in results.items():
+        old = baseline.get("tasks", {}).get(name)
+        if not old:
+            print(f"  {name}: 基线里没有这个任务")
+            continue
+        parts = []
+        for key in ("wall",) + STAGES + ("tokens",):
+            if old.get(key) is None or r.get(key) is None:
+                continue
+            delta = r[key] - old[key]
+            ratio = f" ({delta / old[key]:+.0%})" if old[key] else ""
+            parts.append(f"{key} {delta:+.3f}{ratio}" if key != "tokens" else f"tokens {delta:+.0f}{ratio}")
+        print(f"  {name}: " + " | ".join(parts))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="离线基准 (本地保存页 + mock LLM)")
+    parser.add_argument("--repeat", type=int, default=3, help="每个任务跑几次 (取中位数)")
+    parser.add_argument("--latency", type=float, default=0.3, help="mock LLM 每次调用的固定延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="mock LLM 的随机额外延迟上限 (秒)")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果 JSON 的保存路径")
+    parser.add_argument("--compare", help="另一次基准的结果 JSON，打印差异")
+    args = parser.parse_args()
+
+    # 决策缓存、轨迹回放会跳过 LLM，基准里一律关掉
+    agent.decision_cache = None
+    run_experiment.trajectory_store = None
+    run_experiment.TRAJECTORY_MODE = "off"
+
+    httpd, site = serve_fixtures()
+    server = MockLLMServer(scripted_responses(BENCH_TASKS), latency=args.latency, jitter=args.jitter)
+    agent.llm.base_url = server.start()
+    agent.llm.api_key = "mock"
+
+    timer = StageTimer()
+    heap = []
+    instrument(timer, heap)
+    results = {}
+    try:
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=HEADLESS_MODE, args=OFFLINE_ARGS)
+            for task in BENCH_TASKS:
+                runs = [run_once(browser, task, site, timer, heap) for _ in range(args.repeat)]
+                results[task["name"]] = summarize(runs)
+            browser.close()
+    finally:
+        timer.restore()
+        server.stop()
+        httpd.shutdown()
+
+    print_table(results)
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "observation_mode": OBSERVATION_MODE, "observation_diff": OBSERVATION_DIFF,
+            "observation_window": OBSERVATION_WINDOW, "observation_encoding": OBSERVATION_ENCODING,
+            "token_budget": OBSERVATION_TOKEN_BUDGET, "stream_decisions": STREAM_DECISIONS, "plan_mode": PLAN_MODE,
+            "load_profile": EXPERIMENT_LOAD_PROFILE, "llm_latency": args.latency, "llm_jitter": args.jitter,
+            "repeat": args.repeat,
+        },
+        "tasks": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n✅ 结果已保存: {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            print_comparison(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
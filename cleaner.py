@@ -1,13 +1,310 @@
 # cleaner.py
+import re
+import json
+import hashlib
 from bs4 import BeautifulSoup
+from tracing import span
+from config import OBSERVATION_TOKEN_BUDGET, OBSERVATION_ENCODING, REGION_INDEX_MAX
+
+# compact 编码: 表头 + 每个元素一行，类型用单字母代码
+COMPACT_HEADER = "id|t|tag|text|value|hint"
+COMPACT_TYPE_CODES = {"[输入框]": "I", "[按钮]": "B", "[未知]": "T"}
+COMPACT_VALUE_LIMIT = 30  # 超长的输入值截断
+
+def classify_element(tag_name, role=""):
+    """判断元素在 Prompt 里显示的类型"""
+    if tag_name in ['input', 'textarea']:
+        return "[输入框]"
+    elif tag_name in ['a', 'button', 'select'] or role in ['button', 'link']:
+        return "[按钮]"
+    return "[未知]"
+
+def parse_html_elements(html_content):
+    """
+    旧流程：从整页 HTML 里找出带 data-agent-id 的元素，
+    转成和注入脚本返回值一样的记录格式。
+    """
+    soup = BeautifulSoup(html_content, 'html.parser')
+    records = []
+    for tag in soup.find_all(attrs={"data-agent-id": True}):
+        # 注入脚本会把 title 改写成 "ID: n"，那不是页面自己的信息
+        title = tag.get('title', '')
+        if title.startswith('ID: '): title = ''
+        records.append({
+            "id": tag['data-agent-id'],
+            "tag": tag.name,
+            "type": tag.get('type', ''),
+            "role": tag.get('role', ''),
+            "name": tag.get('name', ''),
+            "text": tag.get_text(strip=True)[:50],
+            "value": tag.get('value', ''),
+            "placeholder": tag.get('placeholder', ''),
+            "aria": tag.get('aria-label', '') or title,
+        })
+    return records
+
+def format_element(el, encoding=OBSERVATION_ENCODING):
+    """单个元素 -> 一行描述；没有任何可读信息的非输入框返回 None"""
+    tag_name = el['tag']
+    element_type = classify_element(tag_name, el.get('role', ''))
+
+    # 读取值
+    current_value = el.get('value', '')
+    text = el.get('text', '')
+    placeholder = el.get('placeholder', '')
+    aria = el.get('aria', '')
+
+    if not (text or current_value or placeholder or aria) and element_type != "[输入框]":
+        return None
+
+    if encoding == "compact":
+        if len(current_value) > COMPACT_VALUE_LIMIT:
+            current_value = current_value[:COMPACT_VALUE_LIMIT] + "…"
+        hint = placeholder or ("" if text else aria)
+        fields = [el['id'], COMPACT_TYPE_CODES[element_type], tag_name, text, current_value, hint]
+        return "|".join(_compact_field(f) for f in fields)
+
+    desc = f"ID: {el['id']} | 类型: {element_type} | <{tag_name}"
+
+    info = ""
+    if text: info += f" Text='{text}'"
+    if current_value: info += f" CURRENT_VALUE='{current_value}'"
+    if placeholder: info += f" Placeholder='{placeholder}'"
+    # 纯图标按钮没有文字，用 aria-label / title 补上
+    if aria and not text: info += f" Aria='{aria}'"
+
+    return desc + info + ">"
+
+def _compact_field(value):
+    # 字段里的 | 和换行会破坏表格结构
+    return str(value).replace("|", "/").replace("\n", " ")
+
+def format_page_info(current_url, page_title, encoding=OBSERVATION_ENCODING):
+    if encoding == "compact":
+        return [f"PAGE|{_compact_field(current_url)}|{_compact_field(page_title)}", COMPACT_HEADER]
+    return [f"PAGE_INFO: URL='{current_url}' | TITLE='{page_title}'", "-" * 30]
+
+def section_break(encoding=OBSERVATION_ENCODING):
+    """分隔页面信息和元素列表的行；compact 编码下就是表头"""
+    return COMPACT_HEADER if encoding == "compact" else "-" * 30
+
+def dedupe_compact_rows(lines):
+    """
+    compact 编码下，和前面某一行 text 完全相同的行改写成 ^id 引用。
+    结果页里"查看详情"、"加入购物车"这类文字会重复几十次。
+    行首可能带 diff 前缀 (+ / ~ / = )。
+    """
+    first_seen = {}
+    output = []
+    for line in lines:
+        prefix = line[:2] if line[:2] in ("+ ", "~ ", "= ") else ""
+        fields = line[len(prefix):].split("|")
+        if len(fields) != 6 or line.startswith("PAGE") or line == COMPACT_HEADER:
+            output.append(line)
+            continue
+        text = fields[3]
+        if len(text) > 3:
+            if text in first_seen:
+                fields[3] = "^" + first_seen[text]
+            else:
+                first_seen[text] = fields[0]
+        output.append(prefix + "|".join(fields))
+    return output
+
+def format_elements(current_url, page_title, elements, encoding=OBSERVATION_ENCODING):
+    """把元素记录格式化成给 LLM 看的文本，返回行列表"""
+    lines = format_page_info(current_url, page_title, encoding)
+    for el in elements:
+        desc = format_element(el, encoding)
+        if desc: lines.append(desc)
+    if encoding == "compact":
+        lines = dedupe_compact_rows(lines)
+    return lines
+
+def estimate_tokens(text):
+    """粗略估算 token 数：中日韩字符按 1 个算，其余按 4 个字符 1 个算"""
+    cjk = sum(1 for c in text if ord(c) >= 0x2e80)
+    return cjk + (len(text) - cjk) // 4 + 1
+
+def goal_terms(goal):
+    """
+    从任务目标里抽关键词：引号里的短语 (权重最高)、英文单词、中文二元组。
+    中文没有空格，用相邻两个字的组合做近似分词。
+    """
+    terms = {}
+    for phrase in re.findall(r"['\"‘“「](.+?)['\"’”」]", goal):
+        terms[phrase.lower()] = 3.0
+    for word in re.findall(r"[a-zA-Z0-9_]{2,}", goal):
+        terms.setdefault(word.lower(), 1.0)
+    for run in re.findall(r"[\u4e00-\u9fff]+", goal):
+        for k in range(len(run) - 1):
+            terms.setdefault(run[k:k + 2], 0.5)
+    return terms
+
+def score_element(el, terms, recent_ids, viewport_height):
+    """相关度 = 与目标的词面重合 + 元素类型 + 离视口的距离 + 最近是否操作过"""
+    haystack = " ".join(el.get(k, '') for k in ('text', 'value', 'placeholder', 'aria')).lower()
+    score = 3 * sum(w for term, w in terms.items() if term in haystack)
+
+    element_type = classify_element(el['tag'], el.get('role', ''))
+    if element_type == "[输入框]":
+        score += 3
+    elif element_type == "[按钮]":
+        score += 2
+
+    y = el.get('y')
+    if y is not None and viewport_height:
+        if 0 <= y < viewport_height:
+            score += 2
+        elif -viewport_height <= y < 2 * viewport_height:
+            score += 1
+
+    if el['id'] in recent_ids:
+        score += 2
+    return score
+
+def rank_elements(elements, goal, recent_ids=(), viewport_height=None, budget=OBSERVATION_TOKEN_BUDGET,
+                  encoding=OBSERVATION_ENCODING):
+    """
+    按相关度挑元素，总 token 不超过预算，保留下来的仍按文档顺序输出。
+    返回 (保留的元素, 丢弃的个数)
+    """
+    if not budget:
+        return elements, 0
+
+    terms = goal_terms(goal or "")
+    candidates = []
+    for index, el in enumerate(elements):
+        desc = format_element(el, encoding)
+        if desc:
+            candidates.append((score_element(el, terms, recent_ids, viewport_height), index, estimate_tokens(desc)))
+
+    # 分数相同时文档靠前的优先
+    candidates.sort(key=lambda c: (-c[0], c[1]))
+    kept, used = set(), 0
+    for _, index, cost in candidates:
+        if used + cost > budget:
+            continue
+        kept.add(index)
+        used += cost
+    return [el for index, el in enumerate(elements) if index in kept], len(candidates) - len(kept)
+
+def format_regions(observation, encoding=OBSERVATION_ENCODING, limit=REGION_INDEX_MAX):
+    """
+    窗口模式下附在观测末尾：当前窗口在整页中的位置，以及窗口外的区域索引
+    (离视口最近的 limit 条，按页面顺序)。非窗口模式返回空列表。
+    """
+    regions = observation.get('regions')
+    if regions is None:
+        return []
+    top = observation.get('scroll_y', 0)
+    bottom = top + (observation.get('viewport_height') or 0)
+    total = observation.get('page_height', bottom)
+
+    nearest = sorted(regions, key=lambda r: min(abs(r['y'] - top), abs(r['y'] - bottom)))[:limit]
+    nearest.sort(key=lambda r: r['y'])
+    if encoding == "compact":
+        lines = [f"VIEW|{top}-{bottom}|{total}"]
+        lines += [f"{r['id']}|{r['y'] - top:+d}|{_compact_field(r['text'])}" for r in nearest]
+        return lines
+
+    lines = [f"VIEWPORT: 当前显示 {top}-{bottom}px / 全页 {total}px"]
+    if nearest:
+        lines.append("REGIONS (窗口外的区域，可以用 scroll_to 跳过去):")
+    for r in nearest:
+        where = f"上方 {top - r['y']}px" if r['y'] < top else f"下方 {r['y'] - top}px"
+        lines.append(f"{r['id']} | {where} | {r['text']}")
+    return lines
+
+def _strip_fragment(url):
+    return url.split('#', 1)[0]
+
+class ObservationTracker:
+    """
+    记住上一步页面上的全部元素，之后每步只发增量：新增 / 消失 / 变化的元素，
+    以及 URL、标题的变化。依赖注入脚本给出的稳定 data-agent-id。
+    增量按页面上的全部元素算 (不受 token 预算影响)，预算只决定列出哪些行：
+    排序变化让元素进出预算不算 DOM 变化，之前没列出、这次进了预算的元素单独标成 "= 补充列出"。
+    以下情况退回完整快照：第一步、发生跳转 (URL 去掉 # 后不同)、增量比快照还长。
+    """
+
+    def __init__(self, encoding=OBSERVATION_ENCODING):
+        self.encoding = encoding
+        self.reset()
+
+    def reset(self):
+        """丢掉基线，下一次一定输出完整快照 (例如 LLM 调用失败、模型没看到上一次增量)"""
+        self.url = None
+        self.title = None
+        self.lines = None  # id -> 格式化后的行 (页面上的全部元素)
+        self.shown = set()  # 模型已经见过 (列出过) 且仍在页面上的元素 id
+
+    def checkpoint(self):
+        """当前基线，配合 restore() 撤销一次 render (例如那次决策被否决、模型的历史里不会有它)"""
+        return self.url, self.title, self.lines, set(self.shown)
+
+    def restore(self, checkpoint):
+        self.url, self.title, self.lines, self.shown = checkpoint[0], checkpoint[1], checkpoint[2], set(checkpoint[3])
+
+    def render(self, current_url, page_title, elements, kept=None):
+        """
+        elements: 页面上的全部元素；kept: 预算内要列出的元素 (None = 全部)。
+        返回 (行列表, 是否完整快照)
+        """
+        encoding = self.encoding
+        current = {}
+        for el in elements:
+            desc = format_element(el, encoding)
+            if desc: current[el['id']] = desc
+        kept_ids = current.keys() if kept is None else {el['id'] for el in kept} & current.keys()
+        kept_ids = [i for i in current if i in kept_ids]  # 保持文档顺序
+        full = format_page_info(current_url, page_title, encoding) + [current[i] for i in kept_ids]
+        if encoding == "compact":
+            full = dedupe_compact_rows(full)
+
+        previous, previous_url, previous_title, shown = self.lines, self.url, self.title, self.shown
+        self.url, self.title, self.lines = current_url, page_title, current
+
+        if previous is None or _strip_fragment(current_url) != _strip_fragment(previous_url):
+            self.shown = set(kept_ids)
+            return full, True
+
+        changed_ids = {i for i in current if i in previous and previous[i] != current[i]}
+        # 新增: 预算内的新元素；消失: 模型见过、已经不在页面上的；变化: 模型见过或这次列出的
+        added = [i for i in kept_ids if i not in previous]
+        removed = [i for i in previous if i not in current and i in shown]
+        changed = [i for i in current if i in changed_ids and (i in shown or i in kept_ids)]
+        # 一直在页面上、但之前因为预算没列出，这次排进来了
+        listed = [i for i in kept_ids if i in previous and i not in shown and i not in changed_ids]
+        self.shown = ({i for i in shown if i in current} | set(kept_ids))
+
+        header = f"PAGE_DIFF: +{len(added)} 新增 | -{len(removed)} 消失 | ~{len(changed)} 变化"
+        if listed:
+            header += f" | ={len(listed)} 补充列出"
+        lines = [header]
+        if current_url != previous_url:
+            lines.append(f"URL_CHANGED: '{previous_url}' -> '{current_url}'")
+        if page_title != previous_title:
+            lines.append(f"TITLE_CHANGED: '{previous_title}' -> '{page_title}'")
+        lines.append(section_break(encoding))
+        lines += [f"+ {current[i]}" for i in added]
+        lines += [f"- {i}" if encoding == "compact" else f"- ID: {i}" for i in removed]
+        lines += [f"~ {current[i]}" for i in changed]
+        lines += [f"= {current[i]}" for i in listed]
+        if not (added or removed or changed or listed):
+            lines.append("(元素没有变化)")
+        if encoding == "compact":
+            lines = dedupe_compact_rows(lines)
+
+        if len("\n".join(lines)) >= len("\n".join(full)):
+            return full, True
+        return lines, False
 
 def get_simplified_html(page, html_content):
     """
     接收 page 对象以获取 URL 和 Title，
     接收 html_content 以解析 DOM
     """
-    soup = BeautifulSoup(html_content, 'html.parser')
-    
     # 1. 获取全局状态 (解决死循环的关键)
     try:
         current_url = page.url
@@ -15,43 +312,68 @@ def get_simplified_html(page, html_content):
     except:
         current_url = "Unknown"
         page_title = "Unknown"
-    
-    lines = []
-    lines.append(f"PAGE_INFO: URL='{current_url}' | TITLE='{page_title}'")
-    lines.append("-" * 30)
 
     # 2. 提取带有 ID 的元素
-    elements = soup.find_all(attrs={"data-agent-id": True})
-    
-    for tag in elements:
-        tag_id = tag['data-agent-id']
-        tag_name = tag.name
-        
-        # 判断类型
-        element_type = "[未知]"
-        if tag_name in ['input', 'textarea']:
-            element_type = "[输入框]"
-        elif tag_name in ['a', 'button', 'select'] or tag.get('role') in ['button', 'link']:
-            element_type = "[按钮]"
-            
-        # 读取值
-        current_value = tag.get('value', '')
-        text = tag.get_text(strip=True)[:50]
-        placeholder = tag.get('placeholder', '')
-        aria = tag.get('aria-label', '') or tag.get('title', '')
-        
-        desc = f"ID: {tag_id} | 类型: {element_type} | <{tag_name}"
-        
-        info = ""
-        if text: info += f" Text='{text}'"
-        if current_value: info += f" CURRENT_VALUE='{current_value}'"
-        if placeholder: info += f" Placeholder='{placeholder}'"
-        
-        desc += info + ">"
-        
-        if not info and element_type != "[输入框]":
-            continue
-            
-        lines.append(desc)
-        
-    return "\n".join(lines), len(html_content), len(lines)
\ No newline at end of file
+    lines = format_elements(current_url, page_title, parse_html_elements(html_content))
+    return "\n".join(lines), len(html_content), len(lines)
+
+def observation_elements(page, observation):
+    """任意模式的观测 -> (URL, 元素记录列表)"""
+    if isinstance(observation, dict):
+        return observation.get('url', page.url), observation.get('elements', [])
+    return page.url, parse_html_elements(observation)
+
+def state_fingerprint(url, elements, observation=None):
+    """
+    页面状态指纹: URL + 全部元素 (去掉随滚动变化的 y) + 窗口模式的滚动位置和区域索引。
+    模型分流 (重复状态)、打转检测 (loop_guard)、决策缓存的 key 都用这一个定义，同一个页面在三处的判断一致。
+    """
+    elements = [{k: v for k, v in el.items() if k != 'y'} for el in elements]
+    extra = {k: observation.get(k) for k in ("scroll_y", "regions")} if isinstance(observation, dict) else {}
+    raw = json.dumps([url, elements, extra], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def get_observation(page, observation, tracker=None, goal=None, recent_ids=(), encoding=OBSERVATION_ENCODING):
+    """
+    observation 可以是注入脚本返回的 JSON payload (dom 模式)，
+    也可以是 page.content() 的 HTML 字符串 (html 模式)。
+    元素先按与 goal 的相关度裁剪到 token 预算以内；传入 tracker 时输出相对上一步的增量。
+    返回 (文本, 原始大小, 行数, 是否完整快照)
+    """
+    with span("clean") as clean_span:
+        viewport_height = None
+        if isinstance(observation, dict):
+            current_url = observation.get('url', 'Unknown')
+            page_title = observation.get('title', 'Unknown')
+            elements = observation.get('elements', [])
+            viewport_height = observation.get('viewport_height')
+            raw_len = len(json.dumps(observation, ensure_ascii=False))
+        else:
+            try:
+                current_url = page.url
+                page_title = page.title()
+            except:
+                current_url = "Unknown"
+                page_title = "Unknown"
+            with span("parse", chars=len(observation)) as s:
+                elements = parse_html_elements(observation)
+                s.set(elements=len(elements))
+            raw_len = len(observation)
+
+        if tracker is not None:
+            encoding = tracker.encoding
+        kept, dropped = rank_elements(elements, goal, recent_ids, viewport_height, encoding=encoding)
+
+        if tracker is None:
+            lines, is_full = format_elements(current_url, page_title, kept, encoding), True
+        else:
+            # 增量按全部元素算，预算只影响列出哪些行 (排序变化不会被当成元素消失)
+            lines, is_full = tracker.render(current_url, page_title, elements, kept)
+        if dropped:
+            lines.append(f"OMITTED: 另有 {dropped} 个与任务关系不大的元素未列出 (需要时可以 scroll 或换个目标元素)")
+        if isinstance(observation, dict):
+            lines += format_regions(observation, encoding)
+        text = "\n".join(lines)
+        clean_span.set(raw_chars=raw_len, kept=len(kept), dropped=dropped, lines=len(lines), chars=len(text),
+                       full=is_full, encoding=encoding)
+    return text, raw_len, len(lines), is_full
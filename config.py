@@ -3,10 +3,119 @@ import os
 
 # === API 配置 (DeepSeek) ===
 API_KEY = "sk-b38bca71114c41c38dd6415277d6dcf7"  # ⚠️ 把你的 Key 填在这里
-BASE_URL = "https://api.deepseek.com"
+# 设置环境变量 AGENT_BASE_URL 可以指向别的兼容服务 (例如 mock_llm_server.py)
+BASE_URL = os.environ.get("AGENT_BASE_URL", "https://api.deepseek.com")
 MODEL_NAME = "deepseek-chat"
 
 # === 实验配置 ===
-RESULT_FILE = "experiment_results.csv"
+RESULT_FILE = "experiment_results.csv"  # 结果库导出的 CSV (和以前的格式一致)
+RESULT_DB = "experiment_results.db"  # 结果库 (SQLite)：每步、每个任务完成时立刻写入，支持断点续跑
+TASK_MAX_STEPS = 8  # 任务套件 (JSONL) 里没写 max_steps 时的默认步数上限
 HEADLESS_MODE = False  # 设置为 False，你可以看到浏览器自动操作
 ACTION_TIMEOUT = 5000  # 动作超时时间 (毫秒)，5秒点不到就报错，不傻等
+NAVIGATION_TIMEOUT = 30000  # 页面跳转 (goto、任务的首次加载) 的超时 (毫秒)；豆瓣这类慢站点 10 秒内常常加载不完
+MAX_CONCURRENCY = 4  # 并行实验的 worker 数量 (每个 worker 一个独立浏览器)
+
+# === 页面稳定等待 (替代固定 sleep) ===
+SETTLE_QUIET_MS = 300   # 网络和 DOM 连续安静多久才算"稳定"
+SETTLE_POLL_MS = 50     # 轮询间隔
+SETTLE_MAX_INFLIGHT = 2 # 允许常驻的长连接/轮询请求数 (文档请求必须为 0)
+SETTLE_BOUNDS = {       # 每类动作最多等多久 (毫秒)，都由 ACTION_TIMEOUT 推出
+    "inject": ACTION_TIMEOUT // 10,
+    "type": ACTION_TIMEOUT // 5,
+    "scroll": ACTION_TIMEOUT // 5,
+    "scroll_to": ACTION_TIMEOUT // 5,
+    "click": ACTION_TIMEOUT,
+    "key": ACTION_TIMEOUT,
+    "goto": ACTION_TIMEOUT * 2,
+}
+
+# === 观测提取 ===
+# "dom": 注入脚本直接返回元素 JSON (不再传整页 HTML、不再跑 BeautifulSoup)
+# "html": 旧流程，page.content() + BeautifulSoup 解析
+OBSERVATION_MODE = "dom"
+OBSERVATION_DIFF = True  # 第二步起只发相对上一步的增量 (新增/消失/变化的元素)
+# 窗口模式: 只上报视口上下各 WINDOW_MARGIN 个视口高度以内的元素，另附窗口外标题/地标的索引 (可 scroll_to)
+OBSERVATION_WINDOW = False
+WINDOW_MARGIN = 0.5
+REGION_INDEX_MAX = 15  # 区域索引最多列多少条 (离视口近的优先)
+# 在覆盖层里给打标元素画红框和编号: True / False / "auto" (有界面时才画，无头模式下省掉这部分开销)
+HIGHLIGHT_ELEMENTS = "auto"
+# DOM 没变 (没有相关的变化、输入、滚动) 且 URL 没变时直接复用上一次的观测；有变化时只重新扫描变化过的子树
+REUSE_OBSERVATION = True
+MAX_DIRTY_ROOTS = 30  # 变化的子树超过这么多就不做增量了，直接全量注入
+
+# === LLM 决策缓存 ===
+# "off": 不用缓存; "record": 命中直接用，未命中调用 LLM 并记下来; "replay": 只读缓存，绝不联网
+DECISION_CACHE_MODE = "off"
+DECISION_CACHE_FILE = "decision_cache.json"
+DECISION_CACHE_MAX_ENTRIES = 5000  # 超出后按最近最少使用淘汰
+
+# === 多轮对话 ===
+HISTORY_WINDOW = 8  # 最多保留多少轮历史 (超出时一次裁掉一半，保持前缀稳定)
+STREAM_DECISIONS = False  # 流式输出决策：action/id/value 一到就执行，reasoning 在后台继续生成
+
+# === 观测排序与 token 预算 ===
+OBSERVATION_TOKEN_BUDGET = 1500  # 每步观测最多多少 token (估算)，按与目标的相关度保留元素；0 = 不限制
+# 观测编码: "verbose" 每行 "ID: 12 | 类型: [按钮] | <a Text='...'>"；"compact" 表头 + 每元素一行 (省 token)
+OBSERVATION_ENCODING = "verbose"
+
+# === 动作执行 ===
+EXECUTOR_FAST_TYPE = True  # 普通输入框直接在页面里赋值 + 触发 input/change 事件，一次往返完成
+
+# === 批量计划 ===
+PLAN_MODE = False  # 允许模型一次返回多个动作 (例如填用户名 → 填密码 → 点登录)
+PLAN_MAX_MUTATED_NODES = 30  # 计划中某一步增删的 DOM 节点超过这个数，视为页面大变，停下来重新规划
+
+# === 轨迹录制与回放 ===
+# "off": 不用; "record": 成功的任务存成轨迹; "replay": 有匹配轨迹时直接回放 (不调 LLM)，同时继续录制
+TRAJECTORY_MODE = "off"
+TRAJECTORY_FILE = "trajectories.json"
+
+# === LLM 客户端 ===
+LLM_DEADLINE = 60  # 单次决策的总期限 (秒)，包括所有重试
+LLM_MAX_RETRIES = 3  # 超时 / 429 / 5xx / 断连时最多重试几次
+LLM_BACKOFF_BASE = 0.5  # 退避基数 (秒)，第 n 次重试最多等 base * 2^n，再加随机抖动
+LLM_BACKOFF_MAX = 8
+LLM_HEDGE_AFTER = 0  # 非流式请求超过这么多秒还没返回，就再并行发一份 (0 = 关闭)
+LLM_MAX_CONNECTIONS = 16  # 连接池大小 (所有 worker 共用)
+
+# === 模型分流 ===
+# 快模型先出决策；上一步失败、页面状态重复、元素很多时直接用 MODEL_NAME，
+# 快模型的输出不合格 (未知动作、页面上没有的 id) 时升级到 MODEL_NAME 重新决策。留空 = 不分流
+FAST_MODEL_NAME = ""
+ROUTE_HARD_ELEMENTS = 80  # 页面元素超过这个数，视为难步骤
+ROUTE_VERIFY_FINISH = True  # 快模型说 finish 时交给强模型确认 (误判完成直接拉低成功率)
+
+# === 页面加载档位 (load_profile.py) ===
+# "full": 什么都不拦; "visual": 只拦视频和统计 (要截图); "text-only": 再拦图片、字体 (只读文本 DOM)
+EXPERIMENT_LOAD_PROFILE = "text-only"
+INTERACTIVE_LOAD_PROFILE = "visual"
+GUI_LOAD_PROFILE = "visual"
+# URL 里包含这些片段的请求 (统计、广告、埋点) 除 full 外一律拦截
+LOAD_PROFILE_PATTERNS = [
+    "google-analytics.com", "googletagmanager.com", "doubleclick.net", "googlesyndication.com",
+    "hm.baidu.com", "cpro.baidu.com", "hmma.baidu.com", "cnzz.com", "umeng.com",
+    "connect.facebook.net", "hotjar.com", "segment.io", "mixpanel.com", "/beacon", "/collect?",
+]
+
+# === GUI 截图流 ===
+SCREEN_JPEG_QUALITY = 60  # JPEG 质量 (1-100)
+SCREEN_MAX_FPS = 4  # 最多每秒推几帧到界面
+SCREEN_MAX_WIDTH = 1280  # 帧的最大宽度 (像素)
+
+# === GUI 多会话 (session_manager.py) ===
+GUI_WORKERS = 2  # 浏览器 worker 线程数 (每个一个浏览器)，多个会话按亲和性分到这些 worker 上
+GUI_SESSION_IDLE_TIMEOUT = 600  # 会话空闲超过这么多秒就关闭它的 context 回收
+
+# === 追踪 (tracing.py) ===
+# 每个阶段 (inject / content / parse / clean / llm / act / settle) 的耗时和属性逐行写进这个 JSONL 文件；留空 = 关闭
+TRACE_FILE = os.environ.get("AGENT_TRACE_FILE", "")
+
+# === 打转检测 (loop_guard.py) ===
+# 页面状态反复出现、动作连续没效果、同一状态下重复做过的动作时怎么办:
+# "hint": 附上纠正提示重新决策; "escalate": 同上并改用强模型 (MODEL_NAME); "abort": 直接结束 (status = loop_detected); "off": 不检测
+LOOP_POLICY = "hint"
+LOOP_MAX_VISITS = 3  # 同一个页面状态第几次出现算打转
+LOOP_MAX_NOOPS = 2  # 连续几个动作执行成功但页面纹丝不动算打转 (滚动除外)
+LOOP_MAX_HINTS = 2  # 每个任务最多给几次纠正提示，之后还在打转就以 loop_detected 结束
@@ -0,0 +1,71 @@
+# decision_cache.py
+import os
+import json
+import time
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from config import DECISION_CACHE_FILE, DECISION_CACHE_MAX_ENTRIES
+
+
+class DecisionCache:
+    """
+    持久化的 LLM 决策缓存 (JSON 文件)，按 LRU 淘汰，线程安全 (并行实验会共用一个实例)。
+    key = hash(模型 (分流选中的那一档), 任务目标, 页面状态指纹 (cleaner.state_fingerprint), 上一步操作)，value = 模型原始输出。
+    不能用发给模型的观测文本：增量模式下不同页面可能得到同样的 PAGE_DIFF (例如 "元素没有变化")。
+    """
+
+    SAVE_INTERVAL = 1.0  # 秒；写盘节流，进程退出时再补一次
+
+    def __init__(self, path=DECISION_CACHE_FILE, max_entries=DECISION_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.dirty = False
+        self.last_save = 0
+
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.entries.update(json.load(f))
+            except Exception as e:
+                print(f"⚠️ 决策缓存读取失败，忽略: {e}")
+        atexit.register(self.save)
+
+    @staticmethod
+    def make_key(model, goal, state, last_action):
+        raw = json.dumps([model, goal, state, last_action], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            content = self.entries.get(key)
+            if content is not None:
+                self.entries.move_to_end(key)
+            return content
+
+    def put(self, key, content):
+        with self.lock:
+            self.entries[key] = content
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+            self.dirty = True
+            if time.time() - self.last_save >= self.SAVE_INTERVAL:
+                self._save_locked()
+
+    def save(self):
+        with self.lock:
+            self._save_locked()
+
+    def _save_locked(self):
+        if not self.dirty:
+            return
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f, ensure_ascii=False)
+        os.replace(tmp, self.path)  # 原子替换，写到一半崩溃也不会损坏旧文件
+        self.dirty = False
+        self.last_save = time.time()
@@ -0,0 +1,207 @@
+# executor.py
+from playwright.sync_api import TimeoutError as PlaywrightTimeoutError
+from config import ACTION_TIMEOUT, NAVIGATION_TIMEOUT, EXECUTOR_FAST_TYPE, PLAN_MAX_MUTATED_NODES
+from settle import MUTATED_NODES_JS
+from tracing import span
+
+# === 执行结果状态 ===
+OK = "ok"
+NOT_FOUND = "not_found"   # data-agent-id 对应的元素已经不在页面上
+NOT_INPUT = "not_input"   # 要求输入但目标不是输入框，已退化为点击
+TIMEOUT = "timeout"       # Playwright 在 ACTION_TIMEOUT 内没完成动作
+INVALID = "invalid"       # 决策本身不合法 (未知动作、缺少 ID)
+ERROR = "error"           # 其他执行异常
+
+SCROLL_STEP = 500
+
+# 一次往返完成 "定位 + 校验"，简单的输入直接在页面里做完。
+# 原生 value setter + input 事件：React 等受控组件也能感知到变化。
+RESOLVE_JS = """
+([id, action, value, fastType]) => {
+    const el = document.querySelector(`[data-agent-id="${CSS.escape(id)}"]`);
+    if (!el) return { found: false };
+    const tag = el.tagName.toLowerCase();
+    const editable = tag === 'input' || tag === 'textarea';
+    const plain = tag === 'textarea' || ['', 'text', 'search', 'email', 'password', 'tel', 'url', 'number'].includes(el.type);
+    if (action === 'type' && fastType && editable && plain && !el.disabled && !el.readOnly) {
+        const proto = tag === 'textarea' ? HTMLTextAreaElement.prototype : HTMLInputElement.prototype;
+        el.focus();
+        Object.getOwnPropertyDescriptor(proto, 'value').set.call(el, value);
+        el.dispatchEvent(new Event('input', { bubbles: true }));
+        el.dispatchEvent(new Event('change', { bubbles: true }));
+        return { found: true, tag: tag, editable: true, done: true };
+    }
+    return { found: true, tag: tag, editable: editable, done: false };
+}
+"""
+
+SCROLL_TO_JS = """
+([attr, id]) => {
+    const el = document.querySelector(`[${attr}="${CSS.escape(id)}"]`);
+    if (!el) return false;
+    el.scrollIntoView({ block: 'start' });
+    return true;
+}
+"""
+
+
+def outcome(status, desc, error=None):
+    return {"status": status, "desc": desc, "error": error}
+
+
+def _selector(target_id):
+    return f'[data-agent-id="{target_id}"]'
+
+
+def _resolve(page, target_id, action, value=""):
+    return page.evaluate(RESOLVE_JS, [str(target_id), action, value or "", EXECUTOR_FAST_TYPE])
+
+
+def execute_action(page, decision, settler=None):
+    """
+    执行一个决策 (finish 由调用方处理)，动作完成后等页面稳定。
+    返回 {"status": OK/NOT_FOUND/..., "desc": 给下一步 Prompt 用的描述, "error": 异常信息}
+    """
+    action = decision.get('action')
+    target_id = decision.get('id')
+    val = decision.get('value') or ""
+
+    # 动作本身和之后的 settle 分成两个 span
+    with span("act", action=action, id=target_id) as s:
+        try:
+            result = _perform(page, action, target_id, val)
+        except PlaywrightTimeoutError as e:
+            result = outcome(TIMEOUT, f"Action timed out: {action} {target_id}", str(e).splitlines()[0])
+        except Exception as e:
+            result = outcome(ERROR, f"Action Failed: {action} {target_id}", str(e).splitlines()[0])
+        s.set(status=result["status"])
+
+    if result["status"] in (OK, NOT_INPUT) and settler:
+        settler.wait(action)
+    return result
+
+
+def _perform(page, action, target_id, val):
+    if action == "goto":
+        if not val:
+            return outcome(INVALID, "goto without url")
+        # 帮模型补全 https
+        url = val if val.startswith("http") else "https://" + val
+        page.goto(url, timeout=NAVIGATION_TIMEOUT)
+        return outcome(OK, f"Navigated to {url}")
+
+    if action == "scroll":
+        direction = -SCROLL_STEP if val == "up" else SCROLL_STEP
+        page.evaluate(f"window.scrollBy(0, {direction})")
+        return outcome(OK, f"Scrolled {'up' if direction < 0 else 'down'}")
+
+    if action == "scroll_to":
+        # 目标是窗口外区域索引里的 R 编号，也接受普通元素 ID
+        attr = "data-agent-region" if str(target_id or "").startswith("R") else "data-agent-id"
+        found = page.evaluate(SCROLL_TO_JS, [attr, str(target_id or "")])
+        if not found:
+            return outcome(NOT_FOUND, f"Region not found: {target_id}")
+        return outcome(OK, f"Scrolled to {target_id}")
+
+    if action == "key":
+        key = val or "Enter"
+        if not target_id:
+            page.keyboard.press(key)
+            return outcome(OK, f"Pressed key {key}")
+        if not _resolve(page, target_id, action)["found"]:
+            # 元素没了就按在当前焦点上，和以前的行为一致
+            page.keyboard.press(key)
+            return outcome(OK, f"Pressed key {key} (element {target_id} gone, sent to focus)")
+        page.locator(_selector(target_id)).first.press(key, timeout=ACTION_TIMEOUT)
+        return outcome(OK, f"Pressed key {key} on {target_id}")
+
+    if action not in ("click", "type"):
+        return outcome(INVALID, f"Unknown action {action}")
+    if not target_id:
+        return outcome(INVALID, f"{action} without id")
+
+    info = _resolve(page, target_id, action, val)
+    if not info["found"]:
+        return outcome(NOT_FOUND, f"Element not found: {target_id}")
+    if info["done"]:
+        return outcome(OK, f"Typed '{val}' into {target_id}")
+
+    loc = page.locator(_selector(target_id)).first
+    if action == "click":
+        loc.click(timeout=ACTION_TIMEOUT)
+        return outcome(OK, f"Clicked {target_id}")
+
+    if not info["editable"]:
+        # 防呆: 目标不是输入框，点一下 (可能会弹出真正的输入框)
+        loc.click(timeout=ACTION_TIMEOUT)
+        return outcome(NOT_INPUT, f"Clicked {target_id} (fallback: <{info['tag']}> is not an input)")
+    loc.fill(val, timeout=ACTION_TIMEOUT)
+    return outcome(OK, f"Typed '{val}' into {target_id}")
+
+
+def plan_steps(decision):
+    """决策 -> 动作列表。计划模式下是 decision["plan"]，否则就是决策本身"""
+    plan = decision.get('plan')
+    if isinstance(plan, list) and plan:
+        return [step for step in plan if isinstance(step, dict)]
+    return [decision]
+
+
+def describe_step(step):
+    return f"{step.get('action')} | ID: {step.get('id')} | Val: {step.get('value')}"
+
+
+def execute_plan(page, steps, settler=None):
+    """
+    按顺序执行一组动作。遇到以下情况提前停下，剩下的动作交给下一次规划:
+    执行失败、页面跳转 (URL 变化)、一步之内 DOM 大幅变化、遇到 finish。
+    返回 {"status", "desc", "error", "executed": 实际执行的动作数, "finished": 是否遇到 finish}
+    """
+    descs = []
+    last = outcome(OK, "No action")
+    executed = 0
+    stop_reason = None
+
+    for index, step in enumerate(steps):
+        if step.get('action') == "finish":
+            return _plan_result(last, descs, executed, finished=True)
+
+        url_before = page.url
+        check_dom = index < len(steps) - 1  # 最后一步之后不需要再判断
+        nodes_before = _mutated_nodes(page) if check_dom else 0
+
+        last = execute_action(page, step, settler)
+        executed += 1
+        descs.append(last['desc'])
+        if last['status'] != OK:
+            stop_reason = last['status']
+            break
+        if not check_dom:
+            break
+        if page.url != url_before:
+            stop_reason = "navigation"
+            break
+        if _mutated_nodes(page) - nodes_before > PLAN_MAX_MUTATED_NODES:
+            stop_reason = "page changed"
+            break
+
+    result = _plan_result(last, descs, executed, finished=False)
+    if stop_reason and executed < len(steps):
+        result['desc'] += f" (plan stopped after {executed}/{len(steps)}: {stop_reason})"
+    return result
+
+
+def _mutated_nodes(page):
+    try:
+        return page.evaluate(MUTATED_NODES_JS)
+    except Exception:
+        return 0
+
+
+def _plan_result(last, descs, executed, finished):
+    result = dict(last)
+    if len(descs) > 1:
+        result['desc'] = "; ".join(descs)
+    result['executed'] = executed
+    result['finished'] = finished
+    return result
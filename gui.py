@@ -1,178 +1,120 @@
 import gradio as gr
+import io
 import time
-import os
-import threading
 import queue
-from playwright.sync_api import sync_playwright
 # 确保你的 agent.py 和 config.py 在同一目录下
-from agent import get_ai_decision
-from config import ACTION_TIMEOUT
+from agent import start_ai_decision, AgentSession, ABORT
+from injector import build_inject_js, observe
+from executor import execute_plan, plan_steps, OK, NOT_FOUND
+from session_manager import SessionManager
+from PIL import Image
+from config import SCREEN_MAX_FPS
 
 print(f"Gradio Version: {gr.__version__}")
 
 # === 1. JS 注入代码 ===
-INJECT_JS = """
-() => {
-    let id_counter = 0;
-    document.querySelectorAll('a[target="_blank"]').forEach(el => el.removeAttribute('target'));
-    const elements = document.querySelectorAll('a, button, input, textarea, select, [role="button"], [role="link"], h3, span, div[role="textbox"], .rating_num');
-    elements.forEach(el => {
-        const rect = el.getBoundingClientRect();
-        const style = window.getComputedStyle(el);
-        if (rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none') {
-            el.setAttribute('data-agent-id', id_counter.toString());
-            if (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA') { el.setAttribute('value', el.value); }
-            el.style.border = "2px solid red";
-            el.style.backgroundColor = "rgba(255, 0, 0, 0.1)";
-            el.setAttribute('title', `ID: ${id_counter}`);
-            id_counter++;
-        }
-    });
-    return id_counter;
-}
-"""
-
-# === 2. 线程通信队列 ===
-# command_queue: Gradio -> Browser Thread (发送用户指令)
-# result_queue: Browser Thread -> Gradio (返回执行日志和截图)
-command_queue = queue.Queue()
-result_queue = queue.Queue()
-
-# === 3. 浏览器工作线程 (后台独立运行) ===
-def browser_worker():
-    """这是唯一一个允许接触 Playwright 对象的线程"""
-    print("🚀 浏览器后台线程已启动...")
-    
-    playwright = sync_playwright().start()
-    browser = playwright.chromium.launch(headless=False)
-    context = browser.new_context()
-    page = context.new_page()
-    page.set_viewport_size({"width": 1280, "height": 800})
-    
-    # 初始化页面
-    try:
-        page.goto("https://www.baidu.com")
-    except:
-        pass
-
-    last_action = "None (Start)"
-
-    while True:
-        # 1. 等待指令
-        try:
-            user_message = command_queue.get() 
-        except:
-            continue
-            
-        logs = ""
+INJECT_JS = build_inject_js(
+    'a, button, input, textarea, select, [role="button"], [role="link"], h3, span, div[role="textbox"], .rating_num',
+    prelude="document.querySelectorAll('a[target=\"_blank\"]').forEach(el => el.removeAttribute('target'));",
+    background="rgba(255, 0, 0, 0.1)",
+    highlight=True,  # 截图里要能看到编号
+)
+
+def throttle(fn, interval):
+    """限制回调频率：流式 token 很密，没必要每个都刷新 UI"""
+    last = [0.0]
+    def wrapper(*args):
+        now = time.time()
+        if now - last[0] >= interval:
+            last[0] = now
+            fn(*args)
+    return wrapper
+
+# === 2. 会话管理 ===
+# 每个 Gradio 会话 (按 session_hash 区分) 一个独立的浏览器 context 和结果通道，
+# 调度到 GUI_WORKERS 个浏览器 worker 线程上；Playwright 对象只在所属 worker 线程里使用
+
+# === 3. 单条指令的执行 (在会话所属的 worker 线程里运行) ===
+def run_command(session, user_message):
+    page, settler = session.page, session.settler
+    logs = ""
+    agent_session = AgentSession()  # 每条指令一段独立的对话
+    report = session.report
+
+    # 开始执行步骤
+    for step in range(20):
+        step_info = f"\n🔵 **Step {step+1}**"
+        logs += step_info + "\n"
         
-        # 定义截图辅助函数 (只在当前线程运行)
-        def capture_screen():
-            path = os.path.abspath("current_view.png")
-            try:
-                page.bring_to_front()
-                page.screenshot(path=path)
-                return path
-            except:
-                return None
-
-        # 2. 开始执行步骤
-        for step in range(20):
-            step_info = f"\n🔵 **Step {step+1}**"
-            logs += step_info + "\n"
-            
-            # 发送当前状态给 UI
-            result_queue.put(("running", logs, capture_screen()))
-            
-            try:
-                page.evaluate(INJECT_JS)
-                time.sleep(1.0)
-            except:
-                pass
-            
-            # 二次刷新状态
-            result_queue.put(("running", logs, capture_screen()))
-
-            html = page.content()
-            
-            # --- AI 决策核心 ---
-            try:
-                decision, tokens, latency, _ = get_ai_decision(user_message, page, html, last_action)
-            except Exception as e:
-                logs += f"❌ 决策错误: {str(e)}\n"
-                result_queue.put(("running", logs, capture_screen()))
-                break
-
-            action = decision.get('action')
-            target_id = decision.get('id')
-            val = decision.get('value')
-            reason = decision.get('reasoning')
-
-            logs += f"🧠 **思维**: {reason}\n🤖 **动作**: `{action}` | ID: `{target_id}` | Val: `{val}`\n"
-            result_queue.put(("running", logs, capture_screen()))
-
-            if action == "finish":
-                logs += "\n✅ **任务完成！**"
-                result_queue.put(("running", logs, capture_screen()))
-                break
-
-            # --- 执行动作 ---
-            try:
-                if action == "goto":
-                    url = val if val.startswith("http") else "https://" + val
-                    logs += f"🌍 跳转: {url}\n"
-                    page.goto(url)
-                    last_action = f"Navigated to {url}"
-                elif action == "scroll":
-                    direction = -500 if val == "up" else 500
-                    page.evaluate(f"window.scrollBy(0, {direction})")
-                    last_action = "Scrolled"
-                    time.sleep(1)
-                elif action == "key":
-                    if target_id:
-                        selector = f'[data-agent-id="{target_id}"]'
-                        if page.locator(selector).count() > 0:
-                            page.locator(selector).first.press(val)
-                    else:
-                        page.keyboard.press(val)
-                    last_action = f"Pressed key {val}"
-                    time.sleep(3)
-                elif target_id:
-                    selector = f'[data-agent-id="{target_id}"]'
-                    if page.locator(selector).count() == 0:
-                        logs += "⚠️ 元素找不到，跳过...\n"
-                        continue
-                    loc = page.locator(selector).first
-                    if action == "click":
-                        loc.click(timeout=5000)
-                        last_action = f"Clicked {target_id}"
-                    elif action == "type":
-                        tag_name = loc.evaluate("el => el.tagName.toLowerCase()")
-                        if tag_name not in ['input', 'textarea']:
-                            loc.click()
-                        else:
-                            loc.fill(val)
-                        last_action = f"Typed {val}"
-                    time.sleep(2)
-                
-                result_queue.put(("running", logs, capture_screen()))
-                
-            except Exception as e:
-                logs += f"⚠️ 执行警告: {str(e)[:100]}\n"
-                last_action = "Failed"
-                result_queue.put(("running", logs, capture_screen()))
-
-        # 3. 任务结束信号
-        result_queue.put(("done", logs, capture_screen()))
+        # 发送当前状态给 UI
+        report("running", logs)
+        
+        observation = observe(page, INJECT_JS, settler, session.cache)
+        
+        # 二次刷新状态
+        report("running", logs)
+        
+        # --- AI 决策核心 ---
+        # 流式模式下 reasoning 边生成边推到聊天面板 (后台线程调用，不带截图)
+        def on_reasoning(text):
+            session.results.put(("running", logs + f"🧠 **思维**: {text}\n"))
 
-# === 4. 启动后台线程 ===
-# daemon=True 意味着主程序关闭时，这个线程也会自动关闭
-t = threading.Thread(target=browser_worker, daemon=True)
-t.start()
+        try:
+            pending = start_ai_decision(user_message, page, observation, session.last_action, agent_session,
+                                        on_reasoning=throttle(on_reasoning, 0.3), last_status=session.last_status)
+            decision = pending.head()
+        except Exception as e:
+            logs += f"❌ 决策错误: {str(e)}\n"
+            report("running", logs)
+            break
+
+        if decision.get('action') == ABORT:
+            logs += f"❌ 决策失败 ({decision['status']}): {decision.get('reasoning')}\n"
+            report("running", logs)
+            break
+
+        steps = plan_steps(decision)
+
+        step_logs = logs
+        for s in steps:
+            logs += f"🤖 **动作**: `{s.get('action')}` | ID: `{s.get('id')}` | Val: `{s.get('value')}`\n"
+        session.results.put(("running", logs))
+
+        # --- 执行动作 (计划模式下可能是多个) ---
+        outcome = execute_plan(page, steps, settler)
+        session.last_action = outcome['desc']
+        session.last_status = outcome['status']
+
+        if outcome['finished']:
+            reason = pending.result()[0].get('reasoning')
+            logs = step_logs + f"🧠 **思维**: {reason}\n" + logs[len(step_logs):] + "\n✅ **任务完成！**"
+            report("running", logs)
+            break
+
+        if outcome['status'] == NOT_FOUND:
+            logs += "⚠️ 元素找不到，跳过...\n"
+        elif outcome['status'] != OK:
+            logs += f"⚠️ 执行警告 ({outcome['status']}): {outcome['desc']} {(outcome['error'] or '')[:100]}\n"
+        elif any(s.get('action') == "goto" for s in steps):
+            logs += f"🌍 {outcome['desc']}\n"
+
+        # 动作执行完，reasoning 也该生成完了：插回动作行之前
+        reason = pending.result()[0].get('reasoning')
+        logs = step_logs + f"🧠 **思维**: {reason}\n" + logs[len(step_logs):]
+        report("running", logs)
+
+    # 任务结束信号
+    logs += f"\n📉 {session.load_profile.summary()} (本会话累计)\n"
+    logs += f"📊 {manager.summary()}\n"
+    report("done", logs)
+
+# === 4. 启动浏览器 worker ===
+# worker 都是 daemon 线程，主程序关闭时自动退出
+manager = SessionManager(run_command).start()
 
 # === 5. UI 构建 ===
 with gr.Blocks(title="LightWeb Agent") as demo: 
-    gr.Markdown("# 🤖 LightWeb Agent 可视化控制台 (Thread-Safe版)")
+    gr.Markdown("# 🤖 LightWeb Agent 可视化控制台 (多会话版)")
     
     with gr.Row():
         with gr.Column(scale=1):
@@ -193,40 +135,57 @@ with gr.Blocks(title="LightWeb Agent") as demo:
             history = []
         return "", history + [{"role": "user", "content": user_message}]
 
-    def bot(history):
+    def bot(history, request: gr.Request):
         if not history:
             yield history, None
             return
 
         user_message = history[-1]["content"]
-        
+
+        # 1. 把指令交给本会话所属的浏览器 worker
+        session, ahead = manager.submit(request.session_hash, user_message)
+
         # 添加助手回复占位符
-        history.append({"role": "assistant", "content": "⏳ Agent 正在启动..."})
+        status = f"⏳ 排队中，前面还有 {ahead} 条指令..." if ahead else "⏳ Agent 正在启动..."
+        history.append({"role": "assistant", "content": status})
         yield history, None
-
-        # 1. 将指令放入队列，发送给后台线程
-        command_queue.put(user_message)
         
-        # 2. 循环读取后台线程的返回结果
+        # 2. 循环读取本会话的日志，顺便按帧率取最新截图 (screencast 在 worker 打开会话后才有)
+        seq = 0
         while True:
             try:
-                # 阻塞读取，直到有新消息
-                status, logs, screenshot = result_queue.get()
-                
-                # 更新 UI
-                history[-1]["content"] = logs
-                yield history, screenshot
-                
+                try:
+                    item = session.results.get(timeout=1.0 / SCREEN_MAX_FPS)
+                except queue.Empty:
+                    item = None
+                frame = session.screen.latest(after=seq) if session.screen else None
+
+                # 没有新截图时保持当前画面
+                image = gr.update()
+                if frame:
+                    seq, data = frame
+                    image = Image.open(io.BytesIO(data))
+                if item:
+                    history[-1]["content"] = item[1]
+                if item or frame:
+                    yield history, image
+
                 # 如果任务完成，退出循环
-                if status == "done":
+                if item and item[0] == "done":
                     break
             except Exception as e:
                 print(f"UI Error: {e}")
                 break
 
+    def leave(request: gr.Request):
+        # 页面关闭：会话马上可以回收，不用等空闲超时
+        manager.release(request.session_hash)
+
+    # 调度交给 SessionManager，Gradio 这边不限制并发，否则不同用户的指令会在 Gradio 队列里排成一列
     msg.submit(user, [msg, chatbot], [msg, chatbot]).then(
-        bot, [chatbot], [chatbot, browser_view]
+        bot, [chatbot], [chatbot, browser_view], concurrency_limit=None
     )
+    demo.unload(leave)
 
 if __name__ == "__main__":
     demo.queue() # 必须开启队列
@@ -0,0 +1,278 @@
+# injector.py
+import json
+from tracing import span
+from config import (OBSERVATION_MODE, OBSERVATION_WINDOW, WINDOW_MARGIN, HIGHLIGHT_ELEMENTS, HEADLESS_MODE,
+                    REUSE_OBSERVATION)
+
+# 注入脚本模板：给可见元素打 data-agent-id，把元素记录直接作为一个 JSON 返回，
+# Python 端不用再解析 HTML。
+# 先一次性读完所有几何信息和属性，再统一写入：读写交替会让浏览器每读一次就重排一次。
+# 高亮画在一个独立的绝对定位覆盖层里，不改页面元素自己的样式 (否则会让布局在两步之间漂移)。
+# 借助 settle.py 的脏区域记录：上次注入后什么都没变就直接返回 {unchanged: true}，
+# 只有部分子树变化时只重新扫描那些子树，其余元素沿用上次读到的属性。
+_INJECT_TEMPLATE = """
+(reuse) => {
+    const st = window.__agentSettle;
+    if (st) st.flush();
+    const cache = window.__agentCache;
+    const sameDoc = !!(st && cache && cache.href === location.href);
+    if (reuse && sameDoc && !st.dirty) return { unchanged: true };
+    __PRELUDE__
+    // 编号在同一个文档里保持稳定：已经有编号的元素沿用旧编号，新元素从计数器继续往后排，
+    // 这样两步之间可以按 ID 做增量对比。
+    if (window.__agentNextId === undefined) window.__agentNextId = 0;
+    const selector = __SELECTOR__;
+    const vh = window.innerHeight;
+    const scrollX = window.scrollX, scrollY = window.scrollY;
+    // 窗口模式: 只上报视口上下各 margin 个视口高度以内的元素 (null = 整页)
+    const margin = __WINDOW_MARGIN__;
+    const inWindow = rect => margin === null || (rect.bottom >= -margin * vh && rect.top <= vh + margin * vh);
+    // checkVisibility 不需要为每个元素算一遍完整的 computed style
+    const visible = el => el.checkVisibility
+        ? el.checkVisibility({ visibilityProperty: true })
+        : (s => s.visibility !== 'hidden' && s.display !== 'none')(window.getComputedStyle(el));
+
+    // ---- 第一遍：只读 ----
+    // 增量: 上次的候选元素里没落在变化子树中的直接复用，变化子树重新查询。
+    // 没有缓存、变化太多、窗口模式下滚动过 (进出窗口的元素变了) 时全量扫描。
+    const incremental = sameDoc && !st.overflow && !(margin !== null && st.scrolled);
+    const owner = new Map();  // id -> 元素，用来发现克隆节点带过来的重复编号
+    let candidates, roots = [], known = new Map();
+    if (incremental) {
+        roots = [...st.roots].filter(r => r.isConnected);
+        const dirty = el => roots.some(r => r.contains(el));
+        // 变化发生在元素内部 (例如 <button><span>文字</span></button> 里的 span)：元素还在，但旧记录的文字已经过期
+        const stale = el => roots.some(r => el.contains(r));
+        const seen = new Set();
+        candidates = [];
+        for (const el of cache.elements) {
+            if (!el.isConnected || dirty(el)) continue;
+            seen.add(el);
+            candidates.push(el);
+            if (cache.records.has(el) && !stale(el)) known.set(el, cache.records.get(el));
+            const id = el.getAttribute('data-agent-id');
+            if (id !== null && !owner.has(id)) owner.set(id, el);
+        }
+        for (const root of roots) {
+            const found = root.matches(selector) ? [root, ...root.querySelectorAll(selector)] : root.querySelectorAll(selector);
+            for (const el of found) {
+                if (!seen.has(el)) { seen.add(el); candidates.push(el); }
+            }
+        }
+        candidates.sort((a, b) => a.compareDocumentPosition(b) & Node.DOCUMENT_POSITION_FOLLOWING ? -1 : 1);
+    } else {
+        candidates = [...document.querySelectorAll(selector)];
+    }
+
+    const keep = [];      // 窗口外但仍可见、保留旧编号的元素
+    const items = [];     // 要上报的元素 [el, id 或 null, rect]
+    for (const el of candidates) {
+        if (el.closest('[data-agent-overlay]')) continue;
+        const rect = el.getBoundingClientRect();
+        if (rect.width <= 0 || rect.height <= 0 || !visible(el)) continue;
+        let id = el.getAttribute('data-agent-id');
+        // 页面克隆节点时会把属性一起复制，撞号就重新分配
+        if (id !== null && owner.has(id) && owner.get(id) !== el) id = null;
+        if (!inWindow(rect)) {
+            // 窗口外的元素不上报，但保留已有编号，滚回来时 ID 不变
+            if (id !== null) { owner.set(id, el); keep.push(el); }
+            continue;
+        }
+        if (id !== null) owner.set(id, el);
+        items.push([el, id, rect]);
+    }
+
+    const regionItems = [];
+    if (margin !== null) {
+        // 窗口外区域的索引: 标题和地标 (nav / main / footer ...)，带文档内的绝对位置，给 scroll_to 用
+        const texts = new Set();
+        for (const el of document.querySelectorAll(__REGION_SELECTOR__)) {
+            const rect = el.getBoundingClientRect();
+            if (rect.height <= 0 || inWindow(rect)) continue;
+            const heading = /^H[1-6]$/.test(el.tagName) ? el : el.querySelector('h1, h2, h3, h4');
+            const text = (el.getAttribute('aria-label') || (heading ? heading.textContent : '') || el.tagName.toLowerCase())
+                .replace(/\\s+/g, ' ').trim().slice(0, 40);
+            if (!text || texts.has(text)) continue;
+            texts.add(text);
+            regionItems.push([el, text, Math.round(rect.top + scrollY)]);
+        }
+    }
+    const pageHeight = document.documentElement.scrollHeight;
+
+    const records = items.map(([el, id, rect]) => {
+        let base = known.get(el);
+        if (!base) {
+            const tag = el.tagName.toLowerCase();
+            // 旧版本会把 title 改成 "ID: n"，这种值不是页面自己的信息
+            const title = el.getAttribute('title') || '';
+            base = {
+                tag: tag,
+                type: el.getAttribute('type') || '',
+                role: el.getAttribute('role') || '',
+                name: el.getAttribute('name') || '',
+                text: (el.textContent || '').replace(/\\s+/g, ' ').trim().slice(0, 50),
+                attrValue: el.getAttribute('value') || '',
+                placeholder: el.getAttribute('placeholder') || '',
+                aria: el.getAttribute('aria-label') || (title.startsWith('ID: ') ? '' : title)
+            };
+            known.set(el, base);
+        }
+        const isInput = base.tag === 'input' || base.tag === 'textarea';
+        return {
+            id: id,
+            tag: base.tag,
+            type: base.type,
+            role: base.role,
+            name: base.name,
+            text: base.text,
+            // 输入框的值可能被脚本直接改掉 (不产生 DOM 变化)，每次都重新读
+            value: isInput ? el.value : base.attrValue,
+            placeholder: base.placeholder,
+            aria: base.aria,
+            y: Math.round(rect.top)  // 相对视口顶部，用于排序时判断离视口多远
+        };
+    });
+
+    // ---- 第二遍：只写 ----
+    const tagged = new Set(keep);
+    items.forEach(([el, id], i) => {
+        if (id === null) {
+            id = records[i].id = (window.__agentNextId++).toString();
+            el.setAttribute('data-agent-id', id);
+        }
+        tagged.add(el);
+        __WRITE_VALUE__
+    });
+    // 已经不可见的旧元素摘掉编号，免得 [data-agent-id] 选中过期节点 (增量时只需要看扫描过的部分)
+    const stale = incremental
+        ? [...candidates, ...roots.flatMap(r => [r, ...r.querySelectorAll('[data-agent-id]')])]
+        : document.querySelectorAll('[data-agent-id]');
+    for (const el of stale) {
+        if (!tagged.has(el) && el.hasAttribute('data-agent-id')) el.removeAttribute('data-agent-id');
+    }
+
+    const payload = { url: location.href, title: document.title, count: records.length, viewport_height: vh,
+                      incremental: incremental, elements: records };
+    if (margin !== null) {
+        if (window.__agentNextRegion === undefined) window.__agentNextRegion = 0;
+        payload.regions = regionItems.map(([el, text, y]) => {
+            let id = el.getAttribute('data-agent-region');
+            if (id === null) {
+                id = 'R' + (window.__agentNextRegion++);
+                el.setAttribute('data-agent-region', id);
+            }
+            return { id: id, text: text, y: y };
+        });
+        payload.scroll_y = Math.round(scrollY);
+        payload.page_height = pageHeight;
+    }
+    window.__agentCache = { href: location.href, elements: candidates, records: known };
+
+    // 覆盖层：每次整体重建，一次 innerHTML 写入 (settle 的 MutationObserver 会忽略它)
+    let overlay = document.querySelector('[data-agent-overlay]');
+    if (!__HIGHLIGHT__) {
+        if (overlay) overlay.remove();
+    } else {
+        if (!overlay) {
+            overlay = document.createElement('div');
+            overlay.setAttribute('data-agent-overlay', '');
+            overlay.style.cssText = 'position:absolute;left:0;top:0;width:0;height:0;overflow:visible;pointer-events:none;z-index:2147483647;';
+            document.documentElement.appendChild(overlay);
+        }
+        overlay.innerHTML = items.map(([, , rect], i) =>
+            `<div style="position:absolute;left:${rect.left + scrollX}px;top:${rect.top + scrollY}px;` +
+            `width:${rect.width}px;height:${rect.height}px;box-sizing:border-box;border:2px solid red;__BACKGROUND__">` +
+            `<div style="position:absolute;left:-2px;top:-16px;padding:0 3px;font:11px/14px monospace;color:#fff;background:red;">` +
+            `${records[i].id}</div></div>`
+        ).join('');
+    }
+    // 注入自己产生的变化不算，清空脏标记
+    if (st) st.clean();
+    return payload;
+}
+"""
+
+
+# 窗口外区域索引收录的元素：标题和 ARIA 地标
+REGION_SELECTOR = ('h1, h2, h3, h4, header, nav, main, aside, footer, section[aria-label], '
+                   '[role="navigation"], [role="main"], [role="region"][aria-label], [role="complementary"], '
+                   '[role="contentinfo"]')
+
+
+def build_inject_js(selector, prelude="", background=None, window=OBSERVATION_WINDOW, margin=WINDOW_MARGIN,
+                    highlight=None):
+    """
+    生成注入脚本。
+    selector: 需要打标的元素 CSS 选择器 (各入口关注的元素不同)
+    prelude: 打标前先执行的 JS 片段 (例如去掉 target=_blank)
+    background: 可选的高亮底色
+    window: 只上报视口附近 (上下各 margin 个视口高度) 的元素，另附窗口外区域的索引
+    highlight: 是否在覆盖层里画红框和编号；None 表示按 HIGHLIGHT_ELEMENTS 配置
+    """
+    if highlight is None:
+        highlight = (not HEADLESS_MODE) if HIGHLIGHT_ELEMENTS == "auto" else HIGHLIGHT_ELEMENTS
+    # html 模式要从 page.content() 里读输入框的当前值，只能写回 value 属性
+    write_value = ("if (['input', 'textarea'].includes(records[i].tag) && el.getAttribute('value') !== el.value) "
+                   "el.setAttribute('value', el.value);")
+    return (_INJECT_TEMPLATE
+            .replace("__PRELUDE__", prelude)
+            .replace("__SELECTOR__", json.dumps(selector))
+            .replace("__WINDOW_MARGIN__", json.dumps(margin) if window else "null")
+            .replace("__REGION_SELECTOR__", json.dumps(REGION_SELECTOR))
+            .replace("__WRITE_VALUE__", write_value if OBSERVATION_MODE == "html" else "")
+            .replace("__HIGHLIGHT__", "true" if highlight else "false")
+            .replace("__BACKGROUND__", f"background:{background};" if background else ""))
+
+
+class ObservationCache:
+    """
+    一个页面最近一次的观测。注入脚本报告 DOM 没变时直接复用，省掉整次提取。
+    hits: 复用次数；incremental: 只重新扫描了变化子树的次数；full: 全量注入次数
+    """
+
+    def __init__(self):
+        self.payload = None
+        self.hits = 0
+        self.incremental = 0
+        self.full = 0
+
+    def stats(self):
+        return {"observe_reused": self.hits, "observe_incremental": self.incremental, "observe_full": self.full}
+
+
+def observe(page, inject_js, settler=None, cache=None):
+    """
+    注入并拿到当前观测。
+    dom 模式: 返回注入脚本给出的 JSON payload (一次往返)；传入 cache 时，
+              页面自上次注入以来没有相关变化 (且 URL 没变) 就直接返回上一次的 payload
+    html 模式 (或注入失败): 返回 page.content()，交给 BeautifulSoup 解析
+    """
+    reuse = bool(REUSE_OBSERVATION and cache is not None and cache.payload and OBSERVATION_MODE == "dom")
+    with span("inject", reuse=reuse) as s:
+        try:
+            payload = page.evaluate(inject_js, reuse)
+        except Exception as e:
+            payload = None
+            s.set(error=type(e).__name__)
+        if isinstance(payload, dict):
+            s.set(unchanged=bool(payload.get('unchanged')), incremental=bool(payload.get('incremental')),
+                  elements=payload.get('count'))
+
+    if OBSERVATION_MODE == "html" or not isinstance(payload, dict):
+        if cache is not None: cache.payload = None
+        if settler: settler.wait("inject")
+        with span("content") as s:
+            html = page.content()
+            s.set(chars=len(html))
+        return html
+
+    if cache is not None:
+        if payload.get('unchanged'):
+            cache.hits += 1
+            return cache.payload
+        if payload.get('incremental'):
+            cache.incremental += 1
+        else:
+            cache.full += 1
+        cache.payload = payload
+    return payload
@@ -0,0 +1,233 @@
+# llm_client.py
+import time
+import queue
+import random
+import asyncio
+import threading
+import httpx
+import openai
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient
+from config import (API_KEY, BASE_URL, LLM_DEADLINE, LLM_MAX_RETRIES, LLM_BACKOFF_BASE, LLM_BACKOFF_MAX,
+                    LLM_HEDGE_AFTER, LLM_MAX_CONNECTIONS)
+
+# === 错误分类 ===
+# 和 "finish" 完全无关：调用方据此把任务记成失败，并在结果表的 status 列里写明原因
+
+class LLMError(Exception):
+    """所有 LLM 调用失败的基类。status 写进 task_data['status']"""
+    status = "llm_error"
+    retryable = False
+
+class LLMTimeout(LLMError):
+    """超过单次调用的总期限 (含所有重试)"""
+    status = "llm_timeout"
+    retryable = True
+
+class LLMRateLimited(LLMError):
+    """429"""
+    status = "llm_rate_limited"
+    retryable = True
+
+class LLMUnavailable(LLMError):
+    """5xx、连接失败"""
+    status = "llm_unavailable"
+    retryable = True
+
+class LLMRequestError(LLMError):
+    """4xx (鉴权、参数错误等)，重试也没用"""
+    status = "llm_request_error"
+
+class LLMBadResponse(LLMError):
+    """模型返回了，但内容不是合法的决策 JSON"""
+    status = "llm_bad_response"
+
+
+def classify_error(e):
+    """把 openai / asyncio 的异常映射到上面的分类"""
+    if isinstance(e, LLMError):
+        return e
+    if isinstance(e, (openai.APITimeoutError, asyncio.TimeoutError)):
+        return LLMTimeout(str(e) or "timeout")
+    if isinstance(e, openai.RateLimitError):
+        error = LLMRateLimited(str(e))
+        error.retry_after = _retry_after(e)
+        return error
+    if isinstance(e, (openai.InternalServerError, openai.APIConnectionError)):
+        return LLMUnavailable(str(e))
+    if isinstance(e, openai.APIStatusError):
+        if e.status_code >= 500:
+            return LLMUnavailable(str(e))
+        return LLMRequestError(str(e))
+    return LLMError(f"{type(e).__name__}: {e}")
+
+def _retry_after(e):
+    try:
+        return float(e.response.headers.get("retry-after"))
+    except:
+        return None
+
+def backoff_delay(attempt, error=None):
+    """指数退避 + full jitter；429 带了 Retry-After 就按它来"""
+    retry_after = getattr(error, "retry_after", None)
+    if retry_after:
+        return min(retry_after, LLM_BACKOFF_MAX)
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+class DecisionClient:
+    """
+    所有 worker 线程共用的决策客户端。
+    内部跑一个后台 asyncio 事件循环 + 一个 AsyncOpenAI (httpx 连接池)，
+    同步代码通过 complete() / stream() 调用，并发请求复用同一批 keep-alive 连接。
+
+    每次调用有总期限 deadline (包括所有重试)；可重试的错误 (超时、429、5xx、断连)
+    按指数退避 + 抖动重试；hedge_after > 0 时，非流式请求超过这个时间还没返回，
+    再并行发一个相同的请求，谁先回来用谁。
+    """
+
+    def __init__(self, api_key=API_KEY, base_url=BASE_URL, deadline=LLM_DEADLINE, max_retries=LLM_MAX_RETRIES,
+                 hedge_after=LLM_HEDGE_AFTER, max_connections=LLM_MAX_CONNECTIONS):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.hedge_after = hedge_after
+        self.max_connections = max_connections
+        self.loop = None
+        self.client = None
+        self.lock = threading.Lock()
+        # 统计
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    def _ensure_loop(self):
+        """第一次调用时才启动事件循环线程 (import 本模块不产生副作用)"""
+        with self.lock:
+            if self.loop is not None:
+                return self.loop
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, daemon=True, name="llm-client").start()
+            self.loop = loop
+            asyncio.run_coroutine_threadsafe(self._create_client(), loop).result()
+            return loop
+
+    async def _create_client(self):
+        # 连接池要在事件循环里创建；重试由本类负责，SDK 自带的重试关掉
+        limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+        http_client = DefaultAsyncHttpxClient(limits=limits)
+        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0,
+                                  http_client=http_client)
+
+    def stats(self):
+        return {"llm_retries": self.retries, "llm_hedges": self.hedges, "llm_hedge_wins": self.hedge_wins}
+
+    # --- 同步接口 ---
+
+    def complete(self, **kwargs):
+        """阻塞直到拿到 ChatCompletion；失败抛 LLMError 子类"""
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self._complete(kwargs), loop)
+        return future.result()
+
+    def stream(self, **kwargs):
+        """
+        同步迭代流式输出的 chunk；失败抛 LLMError 子类。
+        只有第一个 chunk 到达之前的失败会重试 (之后重试会让调用方收到重复内容)。
+        """
+        loop = self._ensure_loop()
+        chunks = queue.Queue()
+        asyncio.run_coroutine_threadsafe(self._stream(kwargs, chunks), loop)
+        while True:
+            kind, payload = chunks.get()
+            if kind == "chunk":
+                yield payload
+            elif kind == "error":
+                raise payload
+            else:
+                return
+
+    # --- 事件循环里的实现 ---
+
+    async def _complete(self, kwargs):
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged(kwargs, deadline)
+            except Exception as e:
+                error = classify_error(e)
+            attempt = await self._before_retry(error, attempt, deadline)
+
+    async def _before_retry(self, error, attempt, deadline):
+        """决定是否重试：不能重试就抛出；能重试就退避等待，返回新的 attempt 计数"""
+        if not error.retryable or attempt >= self.max_retries:
+            raise error
+        delay = backoff_delay(attempt, error)
+        if time.monotonic() + delay >= deadline:
+            raise error if isinstance(error, LLMTimeout) else LLMTimeout(f"deadline exceeded after: {error}")
+        print(f"⚠️ LLM {error.status}，{delay:.1f}s 后重试 ({attempt + 1}/{self.max_retries})")
+        self.retries += 1
+        await asyncio.sleep(delay)
+        return attempt + 1
+
+    async def _attempt(self, kwargs, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise LLMTimeout("deadline exceeded")
+        return await asyncio.wait_for(self.client.chat.completions.create(**kwargs), remaining)
+
+    async def _hedged(self, kwargs, deadline):
+        primary = asyncio.ensure_future(self._attempt(kwargs, deadline))
+        if not self.hedge_after:
+            return await primary
+
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+        if done:
+            return primary.result()
+
+        # 长尾：再发一份，谁先成功用谁；两个都失败就抛出后失败的那个
+        self.hedges += 1
+        hedge = asyncio.ensure_future(self._attempt(kwargs, deadline))
+        pending = {primary, hedge}
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    if task is hedge:
+                        self.hedge_wins += 1
+                    return task.result()
+                error = task.exception()
+        raise error
+
+    async def _stream(self, kwargs, chunks):
+        deadline = time.monotonic() + self.deadline
+        attempt = 0
+        try:
+            while True:
+                received = False
+                try:
+                    stream = await self._attempt(dict(kwargs, stream=True), deadline)
+                    iterator = stream.__aiter__()
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise LLMTimeout("deadline exceeded while streaming")
+                        try:
+                            chunk = await asyncio.wait_for(iterator.__anext__(), remaining)
+                        except StopAsyncIteration:
+                            break
+                        received = True
+                        chunks.put(("chunk", chunk))
+                    chunks.put(("done", None))
+                    return
+                except Exception as e:
+                    error = classify_error(e)
+                if received:
+                    raise error
+                attempt = await self._before_retry(error, attempt, deadline)
+        except LLMError as e:
+            chunks.put(("error", e))
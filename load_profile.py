@@ -0,0 +1,87 @@
+# load_profile.py
+"""
+页面加载档位：用 Playwright 的请求路由拦掉 Agent 用不到的资源 (图片、字体、视频、统计脚本...)，
+每次跳转都能更快进入可交互状态。
+
+    profile = LoadProfile("text-only")
+    profile.apply(context)      # 在 context 上注册路由，之后这个 context 里的所有页面都生效
+    ...
+    profile.stats()             # 拦截了多少请求、估计省下多少字节
+
+注意 sync API 只在调用 Playwright 方法期间派发事件：等 LLM 的时候页面发出的请求会排队，
+直到下一次 Playwright 调用 (观测、动作、settle) 才放行，对 Agent 没有影响。
+"""
+import re
+from config import LOAD_PROFILE_PATTERNS
+
+# 档位 -> 拦截的资源类型。样式表一律放行：可见性判断 (display/visibility/尺寸) 依赖 CSS
+PROFILES = {
+    "full": (),
+    # GUI 要截图给人看，图片和字体都要留着，只拦视频和统计
+    "visual": ("media", "ping"),
+    # 批量实验只读文本 DOM
+    "text-only": ("image", "media", "font", "texttrack", "ping"),
+}
+
+# 被拦截的请求拿不到真实大小，按类型粗略估计 (字节)
+ESTIMATED_BYTES = {
+    "image": 40_000,
+    "media": 500_000,
+    "font": 60_000,
+    "texttrack": 5_000,
+    "ping": 500,
+    "script": 30_000,
+}
+DEFAULT_ESTIMATED_BYTES = 5_000
+
+
+class LoadProfile:
+    """一个档位的拦截规则 + 统计 (按资源类型计数)"""
+
+    def __init__(self, name):
+        if name not in PROFILES:
+            raise ValueError(f"未知的加载档位: {name} (可选: {', '.join(PROFILES)})")
+        self.name = name
+        self.types = set(PROFILES[name])
+        # 统计 / 广告域名在所有档位 (除了 full) 下都拦
+        patterns = LOAD_PROFILE_PATTERNS if name != "full" else ()
+        self.pattern = re.compile("|".join(re.escape(p) for p in patterns)) if patterns else None
+        self.blocked = {}
+        self.allowed = 0
+
+    def should_block(self, url, resource_type):
+        if resource_type == "document":
+            return False
+        if resource_type in self.types:
+            return True
+        return bool(self.pattern and self.pattern.search(url))
+
+    def apply(self, context):
+        """full 档位不注册路由 (路由本身每个请求都要和 Python 往返一次)"""
+        if self.types or self.pattern:
+            context.route("**/*", self._handle)
+        return self
+
+    def _handle(self, route):
+        request = route.request
+        if self.should_block(request.url, request.resource_type):
+            self.blocked[request.resource_type] = self.blocked.get(request.resource_type, 0) + 1
+            route.abort("blockedbyclient")
+        else:
+            self.allowed += 1
+            route.continue_()
+
+    def stats(self):
+        saved = sum(ESTIMATED_BYTES.get(t, DEFAULT_ESTIMATED_BYTES) * n for t, n in self.blocked.items())
+        return {
+            "load_profile": self.name,
+            "blocked_requests": sum(self.blocked.values()),
+            "allowed_requests": self.allowed,
+            "blocked_bytes_est": saved,
+        }
+
+    def summary(self):
+        s = self.stats()
+        detail = ", ".join(f"{t} {n}" for t, n in sorted(self.blocked.items(), key=lambda kv: -kv[1]))
+        return (f"加载档位 {self.name}: 拦截 {s['blocked_requests']} 个请求 ({detail or '无'})，"
+                f"约省 {s['blocked_bytes_est'] / 1024:.0f} KB，放行 {s['allowed_requests']} 个")
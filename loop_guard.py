@@ -0,0 +1,138 @@
+# loop_guard.py
+"""
+打转检测：给每一步的页面状态 (cleaner.state_fingerprint，和模型分流、决策缓存同一个指纹) 和动作算指纹，发现以下情况就按策略处理:
+  - revisit: 同一个页面状态反复出现 (例如搜索成功后又 goto 回首页，再搜一遍)
+  - no-op:   动作执行成功，但页面状态连续几次纹丝不动 (点了没反应的元素)
+  - repeat:  在完全相同的页面状态下，又给出了以前做过的动作 (结果只会一样)
+
+策略 (LOOP_POLICY):
+  "hint":     在"上一步操作"后面附上纠正提示，重新决策
+  "escalate": 同上，并且这一次用强模型
+  "abort":    立刻结束任务，status = "loop_detected"
+提示给了 LOOP_MAX_HINTS 次还在打转，同样以 loop_detected 结束，剩下的步数和 token 就省下来了。
+
+    guard = LoopGuard()
+    state = state_fingerprint(url, elements, observation)
+    verdict, hint = guard.start_step(state)
+    decision = guard.decide(state, lambda hint, tier: ..., verdict, hint, rollback=session.rollback)
+    ... 执行 ...
+    guard.record(state, steps, ok)
+"""
+from agent import ABORT, STRONG
+from config import LOOP_POLICY, LOOP_MAX_VISITS, LOOP_MAX_NOOPS, LOOP_MAX_HINTS
+
+LOOP_DETECTED = "loop_detected"
+LOOP_POLICIES = ("off", "hint", "escalate", "abort")
+# 滚动本来就不改变元素列表 (除非窗口模式下带了滚动位置)，不算没效果、也不算重复的动作
+SCROLL_ACTIONS = ("scroll", "scroll_to")
+
+LOOP_HINT = "⚠️ 检测到原地打转: {reason}。不要重复之前的操作 (尤其不要 goto 回已经去过的页面)，换一个元素或换一种做法；如果任务其实已经完成，输出 finish。"
+
+
+def action_key(steps):
+    return tuple((s.get('action'), str(s.get('id') or ""), str(s.get('value') or "")) for s in steps)
+
+def describe_actions(key):
+    return " → ".join(" ".join(part for part in step if part) for step in key)
+
+
+class LoopGuard:
+    """一个任务一个。只记指纹和计数，不碰页面"""
+
+    def __init__(self, policy=LOOP_POLICY, max_visits=LOOP_MAX_VISITS, max_noops=LOOP_MAX_NOOPS,
+                 max_hints=LOOP_MAX_HINTS):
+        if policy not in LOOP_POLICIES:
+            raise ValueError(f"未知的打转处理策略: {policy} (可选: {', '.join(LOOP_POLICIES)})")
+        self.policy = policy
+        self.max_visits = max_visits
+        self.max_noops = max_noops
+        self.max_hints = max_hints
+        self.visits = {}  # 状态 -> 出现次数
+        self.tried = set()  # 做过的 (状态, 动作)
+        self.last = None  # 上一步的 (状态, 动作, 是否执行成功)
+        self.noops = 0  # 连续没效果的动作数
+        self.hints = 0
+        self.detections = 0
+
+    def start_step(self, state):
+        """新一步观测之后、决策之前调用 -> (对策, 提示)；没发现打转时是 (None, None)"""
+        if self.policy == "off":
+            return None, None
+        self.visits[state] = self.visits.get(state, 0) + 1
+
+        reason = None
+        if self.last:
+            last_state, last_key, ok = self.last
+            moved = not ok or last_state != state or all(action in SCROLL_ACTIONS for action, _, _ in last_key)
+            self.noops = 0 if moved else self.noops + 1
+            if self.noops >= self.max_noops:
+                reason = f"动作 {describe_actions(last_key)} 连续 {self.noops} 次没有让页面发生任何变化"
+        if not reason and self.visits[state] >= self.max_visits:
+            reason = f"当前页面状态已经第 {self.visits[state]} 次出现，你在几个页面之间来回打转"
+        return self._respond(reason)
+
+    def decide(self, state, decide, verdict=None, hint=None, rollback=None):
+        """
+        用 decide(hint, tier) 拿决策 (hint 为 None 表示不用提示，tier 为 None 表示正常分流)。
+        决策在同一个页面状态下重复了以前做过的动作时，先 rollback() 撤销被否决的那次决策
+        (AgentSession.rollback：它没有执行，不能留在模型的历史里)，再按策略带着提示重新决策一次；
+        还在重复、或者策略是 abort，就返回 status = loop_detected 的 abort 决策。
+        """
+        if verdict == "abort":
+            return self._abort(hint)
+        decision = decide(hint, self._tier(verdict))
+        repeat = self._repeat(state, decision)
+        if not repeat:
+            return decision
+
+        verdict, hint = self._respond(repeat)
+        if verdict == "abort":
+            return self._abort(hint)
+        if rollback:
+            rollback()
+        decision = decide(hint, self._tier(verdict))
+        repeat = self._repeat(state, decision)
+        if repeat:
+            return self._abort(repeat)  # 同一次打转，_respond 已经计过数
+        return decision
+
+    def record(self, state, steps, ok):
+        """动作执行完调用；ok: 执行是否成功 (失败的动作不算没效果，由上一步描述告诉模型)"""
+        if self.policy == "off":
+            return
+        key = action_key(steps)
+        if ok:
+            self.tried.add((state, key))  # 执行失败的动作允许在同一状态下再试一次
+        self.last = (state, key, ok)
+
+    def stats(self):
+        return {"loop_detections": self.detections, "loop_hints": self.hints}
+
+    def _repeat(self, state, decision):
+        if self.policy == "off" or decision.get('action') == ABORT:
+            return None
+        key = action_key(decision.get('plan') or [decision])
+        actions = [action for action, _, _ in key]
+        if not actions or "finish" in actions or all(action in SCROLL_ACTIONS for action in actions):
+            return None
+        if (state, key) in self.tried:
+            return f"动作 {describe_actions(key)} 在完全相同的页面状态下已经做过，没有推进任务"
+        return None
+
+    def _respond(self, reason):
+        """按策略决定怎么处理 -> (对策, 提示或原因)"""
+        if not reason:
+            return None, None
+        self.detections += 1
+        if self.policy == "abort" or self.hints >= self.max_hints:
+            return "abort", reason
+        self.hints += 1
+        print(f"🔁 {reason}，{'升级到强模型并' if self.policy == 'escalate' else ''}附上纠正提示 ({self.hints}/{self.max_hints})")
+        return self.policy, LOOP_HINT.format(reason=reason)
+
+    def _tier(self, verdict):
+        return STRONG if verdict == "escalate" else None
+
+    def _abort(self, reason):
+        print(f"🛑 放弃任务: {reason}")
+        return {"action": ABORT, "status": LOOP_DETECTED, "reasoning": reason}
@@ -0,0 +1,187 @@
+# mock_llm_server.py
+"""
+本地的 OpenAI 兼容 mock 服务，用来在不花钱、不联网的情况下测试决策客户端：
+按脚本返回决策、注入延迟、注入故障 (429 / 500 / 卡住不返回 / 非 JSON 内容)，支持流式 (SSE)。
+
+命令行:
+    python mock_llm_server.py --port 8765 --latency 0.5 --fault-rate 0.1
+    AGENT_BASE_URL=http://127.0.0.1:8765/v1 python run_experiment.py
+
+代码里:
+    server = MockLLMServer(responses=[{"action": "finish"}], faults=["429", None])
+    base_url = server.start()
+    ...
+    server.stop()
+"""
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+DEFAULT_RESPONSE = {"action": "finish", "reasoning": "mock"}
+FAULTS = ("429", "500", "hang", "garbage")
+STREAM_PIECE = 8  # 流式输出时每个 chunk 的字符数
+
+
+class MockLLMServer:
+    """
+    responses: 依次 (循环) 返回的决策，dict 或 JSON 字符串；
+               也可以是 callable(请求体) -> dict/str，按 model / messages 决定回复
+    latency / jitter: 每个请求先等 latency + uniform(0, jitter) 秒
+    faults: 按顺序给前几个请求注入的故障 (None 表示正常)，用完之后按 fault_rate 随机注入
+    """
+
+    def __init__(self, responses=None, latency=0.0, jitter=0.0, faults=None, fault_rate=0.0, hang_seconds=30,
+                 host="127.0.0.1", port=0):
+        self.responses = responses or [DEFAULT_RESPONSE]
+        self.latency = latency
+        self.jitter = jitter
+        self.faults = list(faults or [])
+        self.fault_rate = fault_rate
+        self.hang_seconds = hang_seconds
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.fault_counts = {}
+        self.httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self.httpd.daemon_threads = True
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self.base_url
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _next(self, body):
+        """返回 (故障名或 None, 回复内容)"""
+        with self.lock:
+            index = self.request_count
+            self.request_count += 1
+            if self.faults:
+                fault = self.faults.pop(0)
+            elif self.fault_rate and random.random() < self.fault_rate:
+                fault = random.choice(FAULTS)
+            else:
+                fault = None
+            if fault:
+                self.fault_counts[fault] = self.fault_counts.get(fault, 0) + 1
+
+        if callable(self.responses):
+            content = self.responses(body)
+        else:
+            content = self.responses[index % len(self.responses)]
+        if not isinstance(content, str):
+            content = json.dumps(content, ensure_ascii=False)
+        return fault, content
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                if not self.path.rstrip("/").endswith("/chat/completions"):
+                    return self._json(404, {"error": {"message": "not found"}})
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                fault, content = server._next(body)
+
+                time.sleep(server.latency + random.uniform(0, server.jitter))
+                if fault == "429":
+                    return self._json(429, {"error": {"message": "rate limited", "type": "rate_limit"}},
+                                      {"Retry-After": "0.1"})
+                if fault == "500":
+                    return self._json(500, {"error": {"message": "internal error"}})
+                if fault == "hang":
+                    time.sleep(server.hang_seconds)
+                if fault == "garbage":
+                    content = "I think the next action is to click the button."
+
+                usage = _usage(body.get("messages", []), content)
+                if body.get("stream"):
+                    include_usage = (body.get("stream_options") or {}).get("include_usage")
+                    return self._stream(body.get("model", "mock"), content, usage if include_usage else None)
+                self._json(200, {
+                    "id": "mock-%d" % server.request_count,
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": body.get("model", "mock"),
+                    "choices": [{"index": 0, "finish_reason": "stop",
+                                 "message": {"role": "assistant", "content": content}}],
+                    "usage": usage,
+                })
+
+            def _json(self, code, payload, headers=None):
+                data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, model, content, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.end_headers()
+                base = {"id": "mock-stream", "object": "chat.completion.chunk", "created": int(time.time()),
+                        "model": model}
+                for i in range(0, len(content), STREAM_PIECE):
+                    delta = {"content": content[i:i + STREAM_PIECE]}
+                    self._event(dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}]))
+                self._event(dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}]))
+                if usage:
+                    self._event(dict(base, choices=[], usage=usage))
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _event(self, payload):
+                self.wfile.write(b"data: " + json.dumps(payload, ensure_ascii=False).encode("utf-8") + b"\n\n")
+                self.wfile.flush()
+
+        return Handler
+
+
+def _usage(messages, content):
+    # 按 4 个字符 1 个 token 粗略估算，够统计用
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4 + 1
+    completion = len(content) // 4 + 1
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion,
+            "prompt_tokens_details": {"cached_tokens": 0}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI 兼容的 mock LLM 服务")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的固定延迟 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="额外的随机延迟上限 (秒)")
+    parser.add_argument("--fault-rate", type=float, default=0.0, help="随机注入故障的概率")
+    parser.add_argument("--responses", help="JSONL 文件，每行一个决策，循环返回")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as f:
+            responses = [json.loads(line) for line in f if line.strip()]
+
+    server = MockLLMServer(responses, args.latency, args.jitter, fault_rate=args.fault_rate, port=args.port)
+    print(f"🧪 Mock LLM 服务已启动: {server.base_url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+if __name__ == "__main__":
+    main()
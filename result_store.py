@@ -0,0 +1,218 @@
+# result_store.py
+"""
+批量实验的结果库 (SQLite，只追加)。每一步、每个任务完成时立刻写入，进程中途崩溃也不丢已完成的部分。
+
+    store = ResultStore("experiment_results.db")
+    done = store.completed_ids()                      # 断点续跑：已有结果的任务跳过
+    store.record_step(task_id, round_index, {...})    # 每一轮决策 + 执行之后
+    store.record_task(task_data)                      # 任务结束
+    store.summary()                                   # 成功率、token、耗时分位数 (SQL 里算，不整表读进内存)
+    store.export_csv("experiment_results.csv")        # 逐行流式导出，列和以前的 CSV 一致
+
+命令行: python result_store.py [experiment_results.db] [--csv 导出路径] [--merge 分片1.db 分片2.db ...]
+"""
+import csv
+import math
+import json
+import time
+import sqlite3
+import argparse
+import threading
+from config import RESULT_DB, RESULT_FILE
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    task_id TEXT PRIMARY KEY,
+    task_name TEXT,
+    success INTEGER,
+    status TEXT,
+    steps_taken INTEGER,
+    total_tokens INTEGER,
+    total_latency REAL,
+    data TEXT,              -- 完整的 task_data (JSON)，统计字段随功能增加而增加
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS tasks_latency ON tasks (total_latency);
+CREATE INDEX IF NOT EXISTS tasks_tokens ON tasks (total_tokens);
+CREATE TABLE IF NOT EXISTS steps (
+    task_id TEXT,
+    round INTEGER,          -- 第几次决策 (计划模式下一轮可能执行多个动作)
+    url TEXT,
+    actions TEXT,           -- 这一轮执行的动作列表 (JSON)
+    executed INTEGER,
+    status TEXT,
+    description TEXT,
+    error TEXT,
+    replayed INTEGER,
+    tokens_so_far INTEGER,  -- 到这一轮为止任务累计的 token (流式模式下最后一轮的 token 可能还没记上)
+    elapsed REAL,           -- 这一轮的耗时 (秒)
+    at REAL
+);
+CREATE INDEX IF NOT EXISTS steps_task ON steps (task_id, round);
+"""
+
+# 旧版 CSV 的前几列，导出时放在最前面
+CSV_COLUMNS = ["task_id", "task_name", "success", "status", "steps_taken", "total_tokens", "total_latency"]
+
+
+class ResultStore:
+    """多个 worker 线程共用一个连接，写入加锁；每次写入单独提交"""
+
+    def __init__(self, path=RESULT_DB):
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+    def reset(self):
+        """清空所有结果 (重新开始一轮实验)"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM steps")
+            self.conn.execute("DELETE FROM tasks")
+
+    # --- 写入 ---
+
+    def completed_ids(self):
+        """已经有结果的任务 id (字符串)"""
+        with self.lock:
+            return {row[0] for row in self.conn.execute("SELECT task_id FROM tasks")}
+
+    def record_step(self, task_id, round_index, step):
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT INTO steps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (str(task_id), round_index, step.get("url"), json.dumps(step.get("actions", []), ensure_ascii=False),
+                 step.get("executed", 0), step.get("status"), step.get("desc"), step.get("error"),
+                 int(bool(step.get("replayed"))), step.get("tokens_so_far"), step.get("elapsed"), time.time()))
+
+    def record_task(self, task_data):
+        """同一个任务再跑一次 (例如上次崩在中途) 时覆盖旧结果；它的步骤记录只保留最后一次"""
+        task_id = str(task_data["task_id"])
+        with self.lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (task_id, task_data.get("task_name"), int(bool(task_data.get("success"))), task_data.get("status"),
+                 task_data.get("steps_taken"), task_data.get("total_tokens"), task_data.get("total_latency"),
+                 json.dumps(task_data, ensure_ascii=False, default=str), time.time()))
+
+    def discard_steps(self, task_id):
+        """任务重新开始前，删掉它上次没跑完留下的步骤记录"""
+        with self.lock, self.conn:
+            self.conn.execute("DELETE FROM steps WHERE task_id = ?", (str(task_id),))
+
+    def merge(self, other_path):
+        """
+        把另一个结果库 (例如另一个分片) 并进来，返回并入的任务数。
+        只并有结果的任务和它们的步骤；同一个任务两边都有时以对方为准。
+        """
+        with self.lock:
+            self.conn.execute("ATTACH DATABASE ? AS other", (other_path,))
+            try:
+                with self.conn:
+                    count = self.conn.execute("SELECT COUNT(*) FROM other.tasks").fetchone()[0]
+                    self.conn.execute("DELETE FROM steps WHERE task_id IN (SELECT task_id FROM other.tasks)")
+                    self.conn.execute("INSERT OR REPLACE INTO tasks SELECT * FROM other.tasks")
+                    self.conn.execute("INSERT INTO steps SELECT * FROM other.steps "
+                                      "WHERE task_id IN (SELECT task_id FROM other.tasks)")
+            finally:
+                self.conn.execute("DETACH DATABASE other")
+        return count
+
+    # --- 查询 (都在 SQLite 里算，不把整表读进内存) ---
+
+    def _percentile(self, column, q):
+        # 最近秩法：按列排序后取第 ceil(q * n) 行，走索引
+        count = self.conn.execute(f"SELECT COUNT({column}) FROM tasks").fetchone()[0]
+        if not count:
+            return None
+        offset = min(count - 1, max(0, math.ceil(q * count) - 1))
+        return self.conn.execute(
+            f"SELECT {column} FROM tasks WHERE {column} IS NOT NULL ORDER BY {column} LIMIT 1 OFFSET ?",
+            (offset,)).fetchone()[0]
+
+    def summary(self):
+        with self.lock:
+            count, successes, tokens, avg_tokens, avg_latency, steps = self.conn.execute(
+                "SELECT COUNT(*), SUM(success), SUM(total_tokens), AVG(total_tokens), AVG(total_latency), "
+                "SUM(steps_taken) FROM tasks").fetchone()
+            if not count:
+                return {"tasks": 0}
+            statuses = dict(self.conn.execute("SELECT status, COUNT(*) FROM tasks GROUP BY status"))
+            summary = {
+                "tasks": count,
+                "success_rate": (successes or 0) / count,
+                "total_tokens": tokens or 0,
+                "avg_tokens": avg_tokens or 0,
+                "total_steps": steps or 0,
+                "avg_latency": avg_latency or 0,
+                "statuses": statuses,
+            }
+            for q in (0.5, 0.95):
+                summary[f"latency_p{int(q * 100)}"] = self._percentile("total_latency", q)
+                summary[f"tokens_p{int(q * 100)}"] = self._percentile("total_tokens", q)
+            return summary
+
+    def iter_tasks(self):
+        """逐行产出 task_data (dict)；游标边读边产出，大表也不占内存。单独开一个只读连接，不挡 worker 写入"""
+        conn = sqlite3.connect(self.path)
+        try:
+            for (data,) in conn.execute("SELECT data FROM tasks ORDER BY finished_at"):
+                yield json.loads(data)
+        finally:
+            conn.close()
+
+    def export_csv(self, path=RESULT_FILE):
+        """
+        导出成以前的 CSV 格式 (旧列在前，其余统计列按第一次出现的顺序排在后面)。
+        先扫一遍收集列名 (只看键)，再扫一遍逐行写出。
+        """
+        columns = list(CSV_COLUMNS)
+        for data in self.iter_tasks():
+            columns += [key for key in data if key not in columns]
+        rows = 0
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.DictWriter(f, fieldnames=columns, extrasaction="ignore")
+            writer.writeheader()
+            for data in self.iter_tasks():
+                writer.writerow(data)
+                rows += 1
+        return rows
+
+
+def format_summary(summary):
+    if not summary.get("tasks"):
+        return "结果库里还没有任务"
+    lines = [
+        f"任务 {summary['tasks']} 个 | 成功率 {summary['success_rate']:.0%} | 步数 {summary['total_steps']} | "
+        f"token 合计 {summary['total_tokens']} (平均 {summary['avg_tokens']:.0f})",
+        "状态: " + ", ".join(f"{status} {n}" for status, n in sorted(summary["statuses"].items(), key=lambda kv: -kv[1])),
+    ]
+    if summary.get("latency_p50") is not None:
+        lines.append(f"LLM 耗时 平均 {summary['avg_latency']:.1f}s | p50 {summary['latency_p50']:.1f}s | "
+                     f"p95 {summary['latency_p95']:.1f}s | token p50 {summary['tokens_p50']} / p95 {summary['tokens_p95']}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="查看 / 导出实验结果库")
+    parser.add_argument("path", nargs="?", default=RESULT_DB)
+    parser.add_argument("--csv", help="导出成 CSV 的路径")
+    parser.add_argument("--merge", nargs="+", metavar="DB", help="先把这些结果库 (各个分片) 合并进 path")
+    args = parser.parse_args()
+
+    store = ResultStore(args.path)
+    for other in args.merge or []:
+        print(f"📥 合并 {other}: {store.merge(other)} 个任务")
+    print(format_summary(store.summary()))
+    if args.csv:
+        print(f"✅ 已导出 {store.export_csv(args.csv)} 行: {args.csv}")
+
+
+if __name__ == "__main__":
+    main()
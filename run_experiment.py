@@ -1,9 +1,22 @@
 # run_experiment.py
 import time
-import pandas as pd
+import queue
+import argparse
+import threading
 from playwright.sync_api import sync_playwright
-from agent import get_ai_decision
-from config import HEADLESS_MODE, RESULT_FILE, ACTION_TIMEOUT
+from agent import start_ai_decision, AgentSession, ABORT, llm
+from settle import PageSettler
+from injector import build_inject_js, observe, ObservationCache
+from executor import execute_plan, plan_steps, describe_step, OK
+from cleaner import observation_elements, state_fingerprint
+from trajectory import TrajectoryStore, TrajectoryRecorder
+from load_profile import LoadProfile
+from tracing import span, tracer
+from loop_guard import LoopGuard
+from result_store import ResultStore, format_summary
+from task_suite import load_tasks, parse_shard, shard_of
+from config import (HEADLESS_MODE, RESULT_FILE, RESULT_DB, MAX_CONCURRENCY, TRAJECTORY_MODE, EXPERIMENT_LOAD_PROFILE,
+                    TRACE_FILE, NAVIGATION_TIMEOUT)
 
 # === 🔥 升级版复杂任务集 ===
 EXPERIMENT_TASKS = [
@@ -32,150 +45,251 @@ EXPERIMENT_TASKS = [
     }
 ]
 
-# JS 注入逻辑保持不变
-INJECT_JS = """
-() => {
-    let id_counter = 0;
-    const elements = document.querySelectorAll('a, button, input, textarea, select, [role="button"], [role="link"], .inventory_item_name'); 
-    // .inventory_item_name 是专门为 SauceDemo 加的，方便 AI 识别商品名
-    
-    elements.forEach(el => {
-        const rect = el.getBoundingClientRect();
-        const style = window.getComputedStyle(el);
-        if (rect.width > 0 && rect.height > 0 && style.visibility !== 'hidden' && style.display !== 'none') {
-            
-            el.setAttribute('data-agent-id', id_counter.toString());
-            
-            if (el.tagName === 'INPUT' || el.tagName === 'TEXTAREA') {
-                el.setAttribute('value', el.value);
-            }
-
-            el.style.border = "2px solid red";
-            el.setAttribute('title', `ID: ${id_counter}`);
-            id_counter++;
-        }
-    });
-    return id_counter;
-}
-"""
-
-def execute_task(task, browser_context):
-    print(f"\n🚀 开始任务: {task['name']}")
+# 成功的任务录成轨迹，同类任务 (同站点、同目标模板) 下次直接回放
+trajectory_store = TrajectoryStore() if TRAJECTORY_MODE != "off" else None
+
+# 注入脚本：.inventory_item_name 是专门为 SauceDemo 加的，方便 AI 识别商品名
+INJECT_JS = build_inject_js('a, button, input, textarea, select, [role="button"], [role="link"], .inventory_item_name')
+
+def execute_task(task, browser_context, store=None):
+    """store: 传入 ResultStore 时每一轮结束就写一条步骤记录"""
+    # 并行运行时多个任务的日志会交错，统一加上任务 ID 前缀
+    tag = f"[{task['id']}]"
+    print(f"\n🚀 {tag} 开始任务: {task['name']}")
+    # 批量实验只读文本 DOM，图片/字体/统计脚本都不用下载
+    load_profile = LoadProfile(EXPERIMENT_LOAD_PROFILE).apply(browser_context)
     page = browser_context.new_page()
+    settler = PageSettler(page)
+    observation_cache = ObservationCache()
     
     try:
-        page.goto(task['url'], timeout=30000)
-        page.wait_for_load_state("domcontentloaded")
+        page.goto(task['url'], timeout=NAVIGATION_TIMEOUT)
+        settler.wait("goto")
     except Exception as e:
-        print(f"  ❌ 加载失败: {e}")
+        print(f"  ❌ {tag} 加载失败: {e}")
         page.close()
         return None
 
     task_data = {
+        "task_id": task['id'],
         "task_name": task['name'],
         "success": False,
+        "status": "incomplete",  # success / incomplete (步数用完) / llm_* / replay_miss / loop_detected
         "steps_taken": 0,
         "total_tokens": 0,
-        "total_latency": 0
+        "total_latency": 0,
+        "replayed_steps": 0
     }
     
-    last_action_desc = "None (Start)"
+    last_action_desc, last_status = "None (Start)", None
+    session = AgentSession()
+    guard = LoopGuard()
+    if store:
+        store.discard_steps(task['id'])  # 上次跑到一半崩掉留下的步骤
+    recorder = TrajectoryRecorder(task['url'], task['goal']) if trajectory_store else None
+    replayer = trajectory_store.replayer(task['url'], task['goal']) if TRAJECTORY_MODE == "replay" else None
 
-    for step in range(task['max_steps']):
-        print(f"  Step {step+1}...", end="", flush=True)
+    # max_steps 限制的是动作数；计划模式下一次 LLM 调用可能执行多步，调用次数单独记在 llm_calls
+    for round_index in range(task['max_steps']):
+        if task_data['steps_taken'] >= task['max_steps']:
+            break
+        with span("step", step=task_data['steps_taken'] + 1, round=round_index + 1) as step_span:
+            print(f"  {tag} Step {task_data['steps_taken']+1}...")
+            round_start = time.time()
         
-        try:
-            page.evaluate(INJECT_JS)
-            time.sleep(0.5)
-        except:
-            pass
+            observation = observe(page, INJECT_JS, settler, observation_cache)
+            url, elements = observation_elements(page, observation)
+            # 页面状态反复出现、动作连续没效果：按 LOOP_POLICY 附上纠正提示 / 升级强模型 / 直接放弃
+            state = state_fingerprint(url, elements, observation)
+            verdict, hint = guard.start_step(state)
 
-        html = page.content()
-        decision, tokens, latency, _ = get_ai_decision(task['goal'], page, html, last_action_desc)
-        
-        task_data['total_tokens'] += tokens
-        task_data['total_latency'] += latency
+            # 有匹配的轨迹就先回放，页面和录制时对不上再交给 LLM
+            decision = replayer.next_decision(url, elements) if replayer and not verdict else None
+            replayed = bool(decision)
+            if decision:
+                print(f"  {tag} ⏩ 回放轨迹 (不调用 LLM)")
+                task_data['replayed_steps'] += 1
+                step_span.set(replayed=True)
+            else:
+                # 流式模式下 action/id/value 一到就开始执行，reasoning 和 token 统计在后台收尾
+                def decide(hint, tier):
+                    desc = f"{last_action_desc}\n{hint}" if hint else last_action_desc
+                    return start_ai_decision(task['goal'], page, observation, desc, session, tier=tier,
+                                             last_status=last_status).head()
+                decision = guard.decide(state, decide, verdict, hint, rollback=session.rollback)
+            if decision.get('action') == ABORT:
+                print(f"  ❌ {tag} 决策失败 ({decision['status']}): {decision.get('reasoning')}")
+                task_data['status'] = decision['status']
+                step_span.set(status=decision['status'])
+                if store:
+                    store.record_step(task['id'], round_index + 1, {
+                        "url": url, "status": decision['status'], "error": decision.get('reasoning'),
+                        "tokens_so_far": session.total_tokens, "elapsed": time.time() - round_start})
+                break
+            steps = plan_steps(decision)[:task['max_steps'] - task_data['steps_taken']]
         
-        action = decision.get('action')
-        target_id = decision.get('id')
-        val = decision.get('value')
+            print(f"  {tag} 🤖 决策: " + " → ".join(describe_step(s) for s in steps))
         
-        print(f" 🤖 决策: {action} | ID: {target_id} | Val: {val}")
-        last_action_desc = f"{action} {target_id} val={val}"
-        
-        if action == "finish":
-            print("  ✅ 任务完成")
-            task_data['success'] = True
-            break
-            
-        try:
-            # === 新增：滚动操作 ===
-            if action == "scroll":
-                if val == "up":
-                    page.evaluate("window.scrollBy(0, -500)")
-                else: # 默认向下滚
-                    page.evaluate("window.scrollBy(0, 500)")
-                print("  📜 滚动页面...")
-                time.sleep(2)
-                
-            # === 键盘操作 ===
-            elif action == "key":
-                if target_id: # 如果给了ID，先聚焦再按键
-                    selector = f'[data-agent-id="{target_id}"]'
-                    if page.locator(selector).count() > 0:
-                         page.locator(selector).first.press(val)
-                    else:
-                        page.keyboard.press(val)
-                else:
-                    page.keyboard.press(val)
-                print(f"  ⌨️ 按键: {val}")
-                time.sleep(3) 
-                
-            # === 点击与输入 ===
-            elif target_id:
-                selector = f'[data-agent-id="{target_id}"]'
-                if page.locator(selector).count() == 0:
-                    print("  ❌ 元素丢失")
-                    continue
-                
-                loc = page.locator(selector).first
-                
-                if action == "click":
-                    loc.click(timeout=ACTION_TIMEOUT)
-                elif action == "type":
-                    tag_name = loc.evaluate("el => el.tagName.toLowerCase()")
-                    if tag_name not in ['input', 'textarea']:
-                        print("  ⚠️ 不是输入框，尝试点击...")
-                        loc.click(timeout=ACTION_TIMEOUT)
-                    else:
-                        loc.fill(val, timeout=ACTION_TIMEOUT)
-                
-                time.sleep(2)
-                
-        except Exception as e:
-            print(f"  ❌ 执行出错: {str(e).splitlines()[0]}")
-            
-        task_data['steps_taken'] += 1
+            result = execute_plan(page, steps, settler)
+            task_data['steps_taken'] += result['executed']
+            last_action_desc, last_status = result['desc'], result['status']
+            guard.record(state, steps[:result['executed'] + result['finished']], result['status'] == OK)
+            step_span.set(actions=[s.get('action') for s in steps], executed=result['executed'],
+                          status=result['status'], finished=result['finished'])
+
+            if recorder:
+                # 计划遇到失败就停，所以只有最后一步可能失败
+                succeeded = result['executed'] - (0 if result['status'] == OK else 1)
+                recorder.record(url, elements, steps[:succeeded])
+            if store:
+                store.record_step(task['id'], round_index + 1, {
+                    "url": url, "actions": steps[:result['executed'] + result['finished']],
+                    "executed": result['executed'], "status": result['status'], "desc": result['desc'],
+                    "error": result['error'], "replayed": replayed,
+                    "tokens_so_far": session.total_tokens, "elapsed": time.time() - round_start})
         
+            if result['finished']:
+                if recorder:
+                    recorder.finish(url)
+                    trajectory_store.save(recorder)
+                print(f"  ✅ {tag} 任务完成")
+                task_data['success'] = True
+                task_data['status'] = "success"
+                break
+            if result['status'] != OK:
+                print(f"  ❌ {tag} {result['status']}: {result['desc']} {result['error'] or ''}")
+
     page.close()
+    task_data.update(session.stats())
+    task_data.update(guard.stats())
+    task_data.update(observation_cache.stats())
+    task_data.update(load_profile.stats())
+    print(f"  📉 {tag} {load_profile.summary()}")
     return task_data
 
-def main():
+def _worker(task_queue, on_result, store=None):
+    """
+    一个 worker 线程 = 一个独立的 Playwright 实例 + 浏览器。
+    sync API 的对象不能跨线程使用，所以每个线程必须自己启动 Playwright；
+    每个任务再开一个全新的 context，cookie / 登录状态互不干扰。
+    """
     with sync_playwright() as p:
-        # headless=False 非常重要，你要看着它登录和买东西！
-        browser = p.chromium.launch(headless=False)
-        context = browser.new_context()
-        results = []
-        for task in EXPERIMENT_TASKS:
-            data = execute_task(task, context)
-            if data: results.append(data)
+        browser = p.chromium.launch(headless=HEADLESS_MODE)
+        while True:
+            task = task_queue.get()
+            if task is None:  # 任务已经分发完
+                break
+
+            context = browser.new_context()
+            with span("task", task_id=task['id'], task_name=task['name']) as task_span:
+                try:
+                    data = execute_task(task, context, store)
+                except Exception as e:
+                    print(f"  ❌ [{task['id']}] 任务异常: {e}")
+                    data = None
+                finally:
+                    context.close()
+                if data:
+                    task_span.set(success=data['success'], status=data['status'], steps=data['steps_taken'],
+                                  tokens=data['total_tokens'])
+
+            if data: on_result(data)
         browser.close()
-    
-    if results:
-        df = pd.DataFrame(results)
-        df.to_csv(RESULT_FILE, index=False)
-        print(f"\n✅ 结果已保存: {RESULT_FILE}")
-        print(df)
+
+def _feed(task_queue, item, workers):
+    """队列满了就等 worker 取走；worker 全部异常退出时返回 False，免得永远卡在 put 上"""
+    while True:
+        try:
+            task_queue.put(item, timeout=1)
+            return True
+        except queue.Full:
+            if not any(w.is_alive() for w in workers):
+                return False
+
+def run_parallel(tasks, store, concurrency=MAX_CONCURRENCY):
+    """
+    用 N 个 worker 并行跑任务，每个任务一结束就写进结果库 (不在内存里攒结果)，返回完成的任务数。
+    时间主要花在等 LLM 和等页面上，所以线程池就能把吞吐量拉上去。
+    tasks 可以是列表，也可以是 task_suite.load_tasks() 这样的生成器：有界队列边读边分发，
+    内存里最多只有 2N 个待跑的任务。已经有结果的任务 (上次跑过) 直接跳过。
+    """
+    done = store.completed_ids()
+    task_queue = queue.Queue(maxsize=concurrency * 2)
+    collected = [0]
+    lock = threading.Lock()
+
+    def on_result(data):
+        store.record_task(data)
+        with lock:
+            collected[0] += 1
+            print(f"  📥 [{data['task_id']}] 结果已保存 (本次第 {collected[0]} 个)")
+
+    workers = [
+        threading.Thread(target=_worker, args=(task_queue, on_result, store), daemon=True)
+        for _ in range(max(1, concurrency))
+    ]
+    for w in workers:
+        w.start()
+
+    queued = skipped = 0
+    for task in tasks:
+        if str(task['id']) in done:
+            skipped += 1
+            continue
+        if not _feed(task_queue, task, workers):
+            print("❌ 所有 worker 都已退出，停止分发")
+            break
+        queued += 1
+    for _ in workers:
+        _feed(task_queue, None, workers)
+    if skipped:
+        print(f"⏭️ 跳过已有结果的任务 {skipped} 个，本次分发 {queued} 个")
+
+    for w in workers:
+        w.join()
+    return collected[0]
+
+def main():
+    parser = argparse.ArgumentParser(description="LightWeb Agent 批量实验")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY,
+                        help="并行 worker 数量 (1 = 串行)")
+    parser.add_argument("--suite", help="JSONL 任务套件 (一行一个任务)，不传就跑内置的 EXPERIMENT_TASKS")
+    parser.add_argument("--shard", help="只跑第 i 片 (i/N，i 从 0 开始)，按任务 id 的 crc32 划分")
+    parser.add_argument("--db", help=f"结果库路径 (已有结果的任务会跳过)，默认 {RESULT_DB}，分片时每片一个")
+    parser.add_argument("--fresh", action="store_true", help="清空结果库，所有任务重新跑")
+    args = parser.parse_args()
+
+    shard = parse_shard(args.shard)
+    suffix = f".shard{shard[0]}of{shard[1]}" if shard else ""
+    db = args.db or RESULT_DB.replace(".db", suffix + ".db")
+    csv_path = RESULT_FILE.replace(".csv", suffix + ".csv")
+    store = ResultStore(db)
+    if args.fresh:
+        store.reset()
+
+    if args.suite:
+        tasks = load_tasks(args.suite, shard)
+    else:
+        tasks = [t for t in EXPERIMENT_TASKS if not shard or shard_of(t['id'], shard[1]) == shard[0]]
+    if shard:
+        print(f"🧩 分片 {shard[0]}/{shard[1]} -> {db}")
+
+    start = time.time()
+    completed = run_parallel(tasks, store, args.concurrency)
+    print(f"\n⏱️ 总耗时: {time.time() - start:.1f}s | 并发: {args.concurrency} | 本次完成 {completed} 个任务")
+    llm_stats = llm.stats()
+    if any(llm_stats.values()):
+        print(f"🔁 LLM 重试 {llm_stats['llm_retries']} 次 | 对冲请求 {llm_stats['llm_hedges']} 次 (胜出 {llm_stats['llm_hedge_wins']})")
+    if tracer.enabled:
+        tracer.close()
+        print(f"🧵 追踪已写入 {TRACE_FILE}，各阶段耗时: python tracing.py {TRACE_FILE}")
+
+    # 汇总在 SQLite 里算；CSV 从结果库逐行导出，格式和以前一样
+    print(format_summary(store.summary()))
+    rows = store.export_csv(csv_path)
+    if rows:
+        print(f"\n✅ 结果已保存: {db} (导出 {rows} 行到 {csv_path})")
+    store.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
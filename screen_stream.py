@@ -0,0 +1,121 @@
+# screen_stream.py
+"""
+GUI 用的内存截图流。
+
+浏览器线程: stream = ScreenStream(page); stream.start()      (CDP screencast，页面有变化时浏览器主动推帧)
+            stream.poke()   在原来截图的位置调用；screencast 不可用时才真的截一张 (受帧率上限约束)
+UI 线程:    frame = stream.latest(after=seq)  -> (seq, jpeg 字节) 或 None
+
+帧只保存在内存里 (JPEG)，内容哈希相同的帧直接丢掉，超过帧率上限的帧也丢掉。
+Agent 的决策循环从不等截图：screencast 的帧在 Playwright 派发事件时顺手收下，只做解码和哈希。
+"""
+import time
+import base64
+import hashlib
+import threading
+from config import SCREEN_JPEG_QUALITY, SCREEN_MAX_FPS, SCREEN_MAX_WIDTH
+
+
+class ScreenStream:
+    def __init__(self, page, quality=SCREEN_JPEG_QUALITY, max_fps=SCREEN_MAX_FPS, max_width=SCREEN_MAX_WIDTH):
+        self.page = page
+        self.quality = quality
+        self.min_interval = 1.0 / max_fps if max_fps else 0
+        self.max_width = max_width
+        self.lock = threading.Lock()
+        self.cdp = None
+        self._frame = None
+        self._pending = None
+        self._seq = 0
+        self._hash = None
+        self._last_time = 0.0
+        # 统计
+        self.received = 0
+        self.skipped_same = 0
+        self.skipped_rate = 0
+
+    def start(self):
+        """开启 CDP screencast (只有 Chromium 支持)；失败时退回 poke() 里按需截图"""
+        try:
+            self.cdp = self.page.context.new_cdp_session(self.page)
+            self.cdp.on("Page.screencastFrame", self._on_frame)
+            self.cdp.send("Page.startScreencast", {
+                "format": "jpeg",
+                "quality": self.quality,
+                "maxWidth": self.max_width,
+                "everyNthFrame": 1,
+            })
+        except Exception as e:
+            print(f"⚠️ screencast 不可用，改为按需截图: {e}")
+            self.cdp = None
+        return self
+
+    def stop(self):
+        if self.cdp:
+            try:
+                self.cdp.send("Page.stopScreencast")
+                self.cdp.detach()
+            except:
+                pass
+            self.cdp = None
+
+    def _on_frame(self, params):
+        # 必须先 ack，否则浏览器停止推送后续帧
+        try:
+            self.cdp.send("Page.screencastFrameAck", {"sessionId": params["sessionId"]})
+        except:
+            pass
+        self.received += 1
+        self._offer(base64.b64decode(params["data"]))
+
+    def _offer(self, data):
+        """收下一帧。先放进待发布位置：太密的帧会被后来的帧覆盖，但最后一帧总会发布出去"""
+        with self.lock:
+            if self._pending is not None:
+                self.skipped_rate += 1
+            self._pending = data
+        self._publish()
+
+    def _publish(self):
+        """帧率上限允许、且内容和当前帧不同时，把待发布的帧换上去"""
+        with self.lock:
+            if self._pending is None:
+                return
+            now = time.monotonic()
+            if now - self._last_time < self.min_interval:
+                return
+            data, self._pending = self._pending, None
+            digest = hashlib.blake2b(data, digest_size=16).digest()
+            if digest == self._hash:
+                self.skipped_same += 1
+                return
+            self._hash = digest
+            self._frame = data
+            self._seq += 1
+            self._last_time = now
+
+    def poke(self):
+        """
+        浏览器线程在关键节点调用 (观测前后、动作之后)。
+        screencast 开着时帧由浏览器主动推送，这里什么都不做；否则截一张 JPEG (受帧率上限约束)。
+        """
+        if self.cdp:
+            return
+        if time.monotonic() - self._last_time < self.min_interval:
+            return
+        try:
+            self._offer(self.page.screenshot(type="jpeg", quality=self.quality))
+        except:
+            pass
+
+    def latest(self, after=0):
+        """UI 线程调用：有比 after 更新的帧就返回 (seq, jpeg 字节)，否则 None"""
+        self._publish()
+        with self.lock:
+            if self._frame is None or self._seq <= after:
+                return None
+            return self._seq, self._frame
+
+    def stats(self):
+        return {"frames_received": self.received, "frames_published": self._seq,
+                "skipped_same": self.skipped_same, "skipped_rate": self.skipped_rate}
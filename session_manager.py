@@ -0,0 +1,197 @@
+# session_manager.py
+"""
+GUI 的多会话后端：每个 Gradio 会话有自己的浏览器 context、页面和结果通道，
+会话调度到固定数量的浏览器 worker 线程上跑。
+
+    manager = SessionManager(handler).start()      # handler(session, message) 在 worker 线程里执行
+    session, ahead = manager.submit(session_id, message)
+    session.results.get()                          # UI 线程读 (status, 日志)
+    manager.stats()                                # 队列深度、排队时间、空闲回收
+
+sync API 的对象不能跨线程使用，所以一个会话的 context 建在哪个 worker 上，之后的指令就一直交给这个 worker
+(亲和性)；新会话分给当前负担最轻的 worker。空闲超过 idle_timeout 的会话由所属 worker 关闭 context 回收，
+之后再来指令就重新开一个。
+"""
+import time
+import queue
+import threading
+from playwright.sync_api import sync_playwright
+from settle import PageSettler
+from injector import ObservationCache
+from load_profile import LoadProfile
+from screen_stream import ScreenStream
+from config import GUI_WORKERS, GUI_SESSION_IDLE_TIMEOUT, GUI_LOAD_PROFILE, NAVIGATION_TIMEOUT
+
+RECLAIM_INTERVAL = 5  # worker 空闲时每隔几秒检查一次要回收的会话
+
+
+class GuiSession:
+    """一个 Gradio 会话。浏览器相关的字段只能在所属 worker 线程里碰"""
+
+    def __init__(self, session_id, worker):
+        self.session_id = session_id
+        self.worker = worker
+        self.results = queue.Queue()  # worker -> UI: (status, 日志)
+        self.pending = 0  # 已提交还没跑完的指令数，> 0 时不会被回收
+        self.last_active = time.monotonic()
+        self.last_action = "None (Start)"
+        self.last_status = None  # 上一步 execute_plan 的 status，模型分流时判断上一步是否失败
+        self.context = None
+        self.page = None
+        self.settler = None
+        self.cache = None
+        self.load_profile = None
+        self.screen = None
+
+    def report(self, status, text):
+        """worker 线程推送日志；没有 screencast 时顺便按帧率上限截一张"""
+        if self.screen:
+            self.screen.poke()
+        self.results.put((status, text))
+
+    def open(self, browser, home_url, load_profile):
+        self.context = browser.new_context()
+        self.load_profile = LoadProfile(load_profile).apply(self.context)
+        self.page = self.context.new_page()
+        self.page.set_viewport_size({"width": 1280, "height": 800})
+        self.settler = PageSettler(self.page)
+        self.cache = ObservationCache()
+        self.screen = ScreenStream(self.page).start()
+        if home_url:
+            try:
+                self.page.goto(home_url, timeout=NAVIGATION_TIMEOUT)
+                self.settler.wait("goto")
+            except:
+                pass
+
+    def close(self):
+        if self.screen:
+            self.screen.stop()
+        if self.context:
+            try:
+                self.context.close()
+            except:
+                pass
+        self.context = self.page = None
+
+
+class SessionManager:
+    """
+    handler(session, message): 在 worker 线程里执行一条指令，通过 session.report() 推送日志，
+    最后推一条 status="done"。
+    """
+
+    def __init__(self, handler, workers=GUI_WORKERS, idle_timeout=GUI_SESSION_IDLE_TIMEOUT,
+                 home_url="https://www.baidu.com", load_profile=GUI_LOAD_PROFILE, headless=False):
+        self.handler = handler
+        self.home_url = home_url
+        self.load_profile = load_profile
+        self.headless = headless
+        self.idle_timeout = idle_timeout
+        self.queues = [queue.Queue() for _ in range(max(1, workers))]
+        self.sessions = {}
+        self.lock = threading.Lock()
+        # 统计
+        self.jobs = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.reclaimed = 0
+
+    def start(self):
+        for index in range(len(self.queues)):
+            threading.Thread(target=self._worker, args=(index,), daemon=True, name=f"gui-worker-{index}").start()
+        return self
+
+    def _least_loaded(self):
+        """会话数 + 排队指令数最少的 worker"""
+        load = [q.qsize() for q in self.queues]
+        for session in self.sessions.values():
+            load[session.worker] += 1
+        return load.index(min(load))
+
+    def submit(self, session_id, message):
+        """UI 线程调用。返回 (会话, 同一个 worker 上排在前面的指令数)"""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session is None:
+                session = GuiSession(session_id, self._least_loaded())
+                self.sessions[session_id] = session
+            session.pending += 1
+            session.last_active = time.monotonic()
+            worker_queue = self.queues[session.worker]
+            ahead = worker_queue.qsize()
+            worker_queue.put((session, message, time.monotonic()))
+        return session, ahead
+
+    def get(self, session_id):
+        with self.lock:
+            return self.sessions.get(session_id)
+
+    def release(self, session_id):
+        """页面关闭时调用：标记为马上可回收 (context 仍由所属 worker 关闭)"""
+        with self.lock:
+            session = self.sessions.get(session_id)
+            if session:
+                session.last_active = float("-inf")
+
+    def _worker(self, index):
+        """一个 worker = 一个 Playwright 实例 + 浏览器，只处理分给自己的会话"""
+        jobs = self.queues[index]
+        with sync_playwright() as p:
+            browser = p.chromium.launch(headless=self.headless)
+            print(f"🚀 浏览器 worker {index} 已启动...")
+            while True:
+                try:
+                    session, message, enqueued = jobs.get(timeout=RECLAIM_INTERVAL)
+                except queue.Empty:
+                    self._reclaim(index)
+                    continue
+
+                wait = time.monotonic() - enqueued
+                with self.lock:
+                    self.jobs += 1
+                    self.total_wait += wait
+                    self.max_wait = max(self.max_wait, wait)
+                try:
+                    if session.context is None:
+                        session.open(browser, self.home_url, self.load_profile)
+                    self.handler(session, message)
+                except Exception as e:
+                    print(f"❌ 会话 {session.session_id[:8]} 执行异常: {e}")
+                    session.results.put(("done", f"❌ 执行异常: {e}"))
+                finally:
+                    with self.lock:
+                        session.pending -= 1
+                        session.last_active = time.monotonic()
+                self._reclaim(index)
+
+    def _reclaim(self, index):
+        """关闭本 worker 上空闲太久的会话"""
+        now = time.monotonic()
+        with self.lock:
+            idle = [s for s in self.sessions.values()
+                    if s.worker == index and s.pending == 0 and now - s.last_active > self.idle_timeout]
+            for session in idle:
+                del self.sessions[session.session_id]
+            self.reclaimed += len(idle)
+        for session in idle:
+            session.close()
+            print(f"♻️ 回收空闲会话 {session.session_id[:8]} (worker {index})")
+
+    def stats(self):
+        with self.lock:
+            return {
+                "workers": len(self.queues),
+                "sessions": len(self.sessions),
+                "busy_sessions": sum(1 for s in self.sessions.values() if s.pending),
+                "queue_depth": sum(q.qsize() for q in self.queues),
+                "avg_wait": self.total_wait / self.jobs if self.jobs else 0.0,
+                "max_wait": self.max_wait,
+                "reclaimed_sessions": self.reclaimed,
+            }
+
+    def summary(self):
+        s = self.stats()
+        return (f"会话 {s['sessions']} 个 (执行中 {s['busy_sessions']}) / worker {s['workers']} 个 | "
+                f"排队 {s['queue_depth']} 条 | 平均等待 {s['avg_wait']:.1f}s (最长 {s['max_wait']:.1f}s) | "
+                f"已回收 {s['reclaimed_sessions']} 个")
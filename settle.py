@@ -0,0 +1,167 @@
+# settle.py
+import time
+from tracing import span
+from config import ACTION_TIMEOUT, SETTLE_QUIET_MS, SETTLE_POLL_MS, SETTLE_MAX_INFLIGHT, SETTLE_BOUNDS, MAX_DIRTY_ROOTS
+
+# 每个文档装一次 MutationObserver，记录最后一次 DOM 变化的时间，
+# 以及累计增删的节点数 (批量计划用它判断页面是否发生了大的变化)。
+# 我们自己写的 data-agent-* 属性和高亮覆盖层都不算变化，否则注入本身会让页面永远"不安静"。
+# 同时充当注入脚本的脏区域记录：dirty (上次注入后有没有变化)、roots (变化发生在哪些子树)、
+# scrolled (有没有滚动过)。输入框的值变化不产生 DOM 变化，用 input/change 事件补上。
+MUTATION_JS = """
+() => {
+    if (window.__agentSettle) return;
+    const state = window.__agentSettle = {
+        last: Date.now(), nodes: 0, dirty: true, roots: new Set(), overflow: false, scrolled: false
+    };
+    const ours = node => {
+        const el = node && (node.nodeType === 1 ? node : node.parentElement);
+        return !!(el && el.closest('[data-agent-overlay]'));
+    };
+    const markDirty = node => {
+        const el = node && (node.nodeType === 1 ? node : node.parentElement);
+        state.dirty = true;
+        if (!el || state.overflow) return;
+        state.roots.add(el);
+        if (state.roots.size > __MAX_DIRTY_ROOTS__) { state.overflow = true; state.roots.clear(); }
+    };
+    state.handle = records => {
+        let relevant = false;
+        for (const r of records) {
+            if (r.type === 'attributes' && r.attributeName && r.attributeName.startsWith('data-agent')) continue;
+            if (ours(r.target)) continue;
+            if (r.type === 'childList' && [...r.addedNodes, ...r.removedNodes].every(ours)) continue;
+            relevant = true;
+            markDirty(r.target);
+            if (r.type === 'childList') state.nodes += r.addedNodes.length + r.removedNodes.length;
+        }
+        if (relevant) state.last = Date.now();
+    };
+    // 注入脚本开头调用：把还没派发的变化先记下来
+    state.flush = () => state.handle(state.observer.takeRecords());
+    // 注入脚本结尾调用：丢掉注入自己产生的变化，清空脏标记
+    state.clean = () => {
+        state.observer.takeRecords();
+        state.dirty = false; state.overflow = false; state.scrolled = false;
+        state.roots.clear();
+    };
+    state.observer = new MutationObserver(state.handle);
+    state.observer.observe(document, { childList: true, subtree: true, attributes: true, characterData: true });
+    for (const type of ['input', 'change']) {
+        document.addEventListener(type, e => markDirty(e.target), { capture: true, passive: true });
+    }
+    window.addEventListener('scroll', () => { state.dirty = true; state.scrolled = true; }, { capture: true, passive: true });
+    window.addEventListener('resize', () => { state.dirty = true; state.overflow = true; state.roots.clear(); });
+}
+""".replace("__MAX_DIRTY_ROOTS__", str(MAX_DIRTY_ROOTS))
+
+QUIET_JS = "() => window.__agentSettle ? Date.now() - window.__agentSettle.last : null"
+MUTATED_NODES_JS = "() => window.__agentSettle ? window.__agentSettle.nodes : 0"
+
+# 这些请求天生不会结束，不能算进 in-flight
+IGNORED_RESOURCE_TYPES = ("websocket", "eventsource")
+
+
+class PageSettler:
+    """
+    "等页面稳定"原语：导航事件 + 网络空闲 (in-flight 计数) + DOM 安静窗口。
+    用法: settler = PageSettler(page); ...; settler.wait("click")
+    必须在创建它的 Playwright 线程里使用。
+    """
+
+    def __init__(self, page):
+        self.page = page
+        self.inflight = {}  # request -> 开始时间
+        self.last_network = time.monotonic()
+        self.navigated = False
+
+        page.on("request", self._on_request)
+        page.on("requestfinished", self._on_request_done)
+        page.on("requestfailed", self._on_request_done)
+        page.on("framenavigated", self._on_navigated)
+
+        # 之后的每个新文档自动安装，当前文档手动补一次
+        page.add_init_script(script=f"({MUTATION_JS})()")
+        try:
+            page.evaluate(MUTATION_JS)
+        except:
+            pass
+
+    def _on_request(self, request):
+        if request.resource_type in IGNORED_RESOURCE_TYPES:
+            return
+        self.inflight[request] = time.monotonic()
+        self.last_network = time.monotonic()
+
+    def _on_request_done(self, request):
+        if self.inflight.pop(request, None) is not None:
+            self.last_network = time.monotonic()
+
+    def _on_navigated(self, frame):
+        if frame == self.page.main_frame:
+            self.navigated = True
+
+    def _network_idle(self, now):
+        # 超过最大等待上限还没结束的请求视为长轮询，不再计入
+        stale_after = max(SETTLE_BOUNDS.values()) / 1000
+        pending = [r for r, t in self.inflight.items() if now - t < stale_after]
+        if any(r.resource_type == "document" for r in pending):
+            return False
+        if len(pending) > SETTLE_MAX_INFLIGHT:
+            return False
+        return (now - self.last_network) * 1000 >= SETTLE_QUIET_MS
+
+    def _dom_quiet(self):
+        try:
+            quiet_ms = self.page.evaluate(QUIET_JS)
+        except:
+            # 导航中执行上下文被销毁，说明还没稳定
+            return False
+        if quiet_ms is None:
+            # 文档里没有观察器 (例如 about:blank 上 goto 之前)，补装后重新计时
+            try:
+                self.page.evaluate(MUTATION_JS)
+            except:
+                pass
+            return False
+        return quiet_ms >= SETTLE_QUIET_MS
+
+    def wait(self, action=None, timeout_ms=None):
+        """
+        阻塞到页面稳定或达到该动作的等待上限，返回实际等待秒数。
+        超时不报错：页面一直在动 (轮播图、长轮询) 时按上限放行。
+        """
+        bound = timeout_ms or SETTLE_BOUNDS.get(action, ACTION_TIMEOUT)
+        with span("settle", action=action, bound_ms=bound) as s:
+            waited = self._wait(bound)
+            s.set(hit_bound=waited * 1000 >= bound)
+        return waited
+
+    def _wait(self, bound):
+        start = time.monotonic()
+        deadline = start + bound / 1000
+        # 从现在开始算网络安静窗口，给动作触发的延迟请求/跳转一个出现的机会
+        self.last_network = max(self.last_network, start)
+        self.navigated = True
+
+        while True:
+            now = time.monotonic()
+            remaining_ms = int((deadline - now) * 1000)
+            if remaining_ms <= 0:
+                break
+
+            if self.navigated:
+                self.navigated = False
+                try:
+                    self.page.wait_for_load_state("domcontentloaded", timeout=remaining_ms)
+                except:
+                    pass
+                continue
+
+            if self._network_idle(now) and self._dom_quiet():
+                break
+
+            # 用 wait_for_timeout 而不是 time.sleep：sync API 只有在调用期间才会派发事件
+            self.page.wait_for_timeout(min(SETTLE_POLL_MS, remaining_ms))
+
+        return time.monotonic() - start
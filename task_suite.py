@@ -0,0 +1,98 @@
+# task_suite.py
+"""
+从 JSONL 文件流式读取实验任务，一行一个:
+    {"id": 17, "name": "Baidu Search", "url": "https://www.baidu.com", "goal": "在搜索框输入 ...", "max_steps": 4}
+
+    for task in load_tasks("suite.jsonl", shard=(0, 4)):   # 逐行读，几万条也不会一次读进内存
+        ...
+
+分片: --shard i/N (i 从 0 开始) 按 crc32(id) % N == i 划分，和文件里的行序、机器、Python 版本都无关，
+N 个进程各跑一片，互不重叠；每片写自己的结果库，最后用 python result_store.py 合并后的库.db --merge 各片.db 合并。
+
+跑一片: python run_experiment.py --suite suites/example.jsonl --shard 0/4
+命令行: python task_suite.py suite.jsonl [--shards 4]   (检查文件、统计每片的任务数)
+"""
+import json
+import zlib
+import argparse
+from config import TASK_MAX_STEPS
+
+REQUIRED_FIELDS = ("id", "url", "goal")
+
+
+def parse_shard(text):
+    """'i/N' -> (i, N)；None / 空字符串 -> None (不分片)"""
+    if not text:
+        return None
+    try:
+        index, count = (int(part) for part in text.split("/"))
+    except ValueError:
+        raise ValueError(f"分片格式应为 i/N，例如 0/4: {text!r}")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"分片编号要满足 0 <= i < N: {text!r}")
+    return index, count
+
+
+def shard_of(task_id, count):
+    """任务 id 落在哪一片 (id 按字符串算，1 和 "1" 是同一个任务)"""
+    return zlib.crc32(str(task_id).encode("utf-8")) % count
+
+
+def normalize_task(record):
+    """补全可选字段；不是 JSON 对象、缺必填字段时抛 ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError(f"每行应该是一个 JSON 对象，实际是 {type(record).__name__}")
+    missing = [field for field in REQUIRED_FIELDS if record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"缺少字段: {', '.join(missing)}")
+    task = dict(record)
+    task.setdefault("name", str(task["id"]))
+    task["max_steps"] = int(task.get("max_steps") or TASK_MAX_STEPS)
+    return task
+
+
+def load_tasks(path, shard=None, skip_ids=()):
+    """
+    逐行产出任务 dict。空行和 # 开头的行跳过；格式不对的行打印警告后跳过，不中断整个套件。
+    shard: (i, N) 只产出属于第 i 片的任务；skip_ids: 已经有结果的任务 id (字符串)
+    """
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            try:
+                task = normalize_task(json.loads(line))
+            except ValueError as e:
+                print(f"⚠️ {path}:{line_no} 跳过: {e}")
+                continue
+            task_id = str(task["id"])
+            if shard and shard_of(task_id, shard[1]) != shard[0]:
+                continue
+            if task_id in seen:
+                print(f"⚠️ {path}:{line_no} 任务 id 重复，跳过: {task_id}")
+                continue
+            seen.add(task_id)
+            if task_id in skip_ids:
+                continue
+            yield task
+
+
+def main():
+    parser = argparse.ArgumentParser(description="检查 JSONL 任务套件，统计分片大小")
+    parser.add_argument("path")
+    parser.add_argument("--shards", type=int, default=1, help="按几片统计")
+    args = parser.parse_args()
+
+    sizes = [0] * args.shards
+    for task in load_tasks(args.path):
+        sizes[shard_of(task["id"], args.shards)] += 1
+    print(f"✅ {args.path}: {sum(sizes)} 个有效任务")
+    if args.shards > 1:
+        for index, size in enumerate(sizes):
+            print(f"  分片 {index}/{args.shards}: {size} 个")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# tests/test_loop_guard.py
+# 打转检测 (loop_guard.LoopGuard)：revisit / no-op / repeat 三种打转，提示用完后以 loop_detected 结束
+# 运行: python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from agent import ABORT, STRONG
+from loop_guard import LoopGuard, LOOP_DETECTED
+
+HOME, RESULTS, DETAIL = "home", "results", "detail"
+TYPE = {"action": "type", "id": "1", "value": "DeepSeek"}
+CLICK = {"action": "click", "id": "5"}
+
+
+class Model:
+    """按顺序返回预先写好的决策，记下每次调用带的 hint / tier"""
+
+    def __init__(self, *decisions):
+        self.decisions = list(decisions)
+        self.calls = []
+
+    def __call__(self, hint, tier):
+        self.calls.append((hint, tier))
+        return dict(self.decisions.pop(0))
+
+
+def step(guard, state, model, ok=True, rollback=None):
+    verdict, hint = guard.start_step(state)
+    decision = guard.decide(state, model, verdict, hint, rollback=rollback)
+    if decision.get("action") != ABORT:
+        guard.record(state, [decision], ok)
+    return decision
+
+
+def test_normal_progress_is_not_flagged():
+    guard = LoopGuard(policy="hint")
+    for state, decision in ((HOME, TYPE), (RESULTS, CLICK), (DETAIL, {"action": "finish"})):
+        model = Model(decision)
+        assert step(guard, state, model) == decision
+        assert model.calls == [(None, None)]
+    assert guard.stats() == {"loop_detections": 0, "loop_hints": 0}
+
+
+def test_revisited_state_gets_a_hint():
+    guard = LoopGuard(policy="hint", max_visits=3)
+    step(guard, HOME, Model(TYPE))
+    step(guard, RESULTS, Model({"action": "goto", "value": "home"}))
+    step(guard, HOME, Model(CLICK))
+    step(guard, RESULTS, Model({"action": "key", "value": "Backspace"}))
+    model = Model({"action": "click", "id": "9"})
+    step(guard, HOME, model)
+    hint, tier = model.calls[0]
+    assert "第 3 次出现" in hint
+    assert tier is None
+    assert guard.stats() == {"loop_detections": 1, "loop_hints": 1}
+
+
+def test_repeated_noop_is_flagged_and_scrolls_are_exempt():
+    guard = LoopGuard(policy="abort", max_visits=100, max_noops=2)
+    step(guard, HOME, Model({"action": "scroll", "value": "down"}))
+    step(guard, HOME, Model({"action": "scroll", "value": "down"}))
+    step(guard, HOME, Model({"action": "click", "id": "1"}))
+    assert guard.stats()["loop_detections"] == 0
+    step(guard, HOME, Model({"action": "click", "id": "2"}))
+    decision = step(guard, HOME, Model(CLICK))
+    assert decision["action"] == ABORT
+    assert decision["status"] == LOOP_DETECTED
+    assert "连续 2 次" in decision["reasoning"]
+
+
+def test_failed_action_is_not_a_noop_and_may_be_retried():
+    guard = LoopGuard(policy="abort", max_noops=1)
+    step(guard, HOME, Model(CLICK), ok=False)
+    assert step(guard, HOME, Model(CLICK)) == CLICK
+
+
+def test_repeat_is_redecided_with_hint_and_rollback():
+    guard = LoopGuard(policy="escalate")
+    step(guard, HOME, Model(TYPE), ok=True)
+    rollbacks = []
+    model = Model(TYPE, CLICK)
+    decision = guard.decide(HOME, model, rollback=lambda: rollbacks.append(True))
+    assert decision == CLICK
+    assert rollbacks == [True]
+    assert model.calls[0] == (None, None)
+    hint, tier = model.calls[1]
+    assert "已经做过" in hint
+    assert tier == STRONG
+    assert guard.stats() == {"loop_detections": 1, "loop_hints": 1}
+
+
+def test_repeat_twice_aborts_as_one_detection():
+    guard = LoopGuard(policy="hint")
+    step(guard, HOME, Model(TYPE))
+    decision = guard.decide(HOME, Model(TYPE, TYPE))
+    assert decision["status"] == LOOP_DETECTED
+    assert guard.stats() == {"loop_detections": 1, "loop_hints": 1}
+
+
+def test_hints_run_out_then_loop_detected():
+    guard = LoopGuard(policy="hint", max_hints=2)
+    step(guard, HOME, Model(TYPE))
+    assert guard.decide(HOME, Model(TYPE, CLICK)) == CLICK
+    guard.record(HOME, [CLICK], True)
+    assert guard.decide(HOME, Model(CLICK, {"action": "click", "id": "6"}))["id"] == "6"
+    model = Model(TYPE)
+    decision = guard.decide(HOME, model)
+    assert decision["status"] == LOOP_DETECTED
+    assert len(model.calls) == 1  # 提示已经用完，不再多花一次调用
+    assert guard.stats() == {"loop_detections": 3, "loop_hints": 2}
+
+
+def test_abort_policy_before_calling_the_model():
+    guard = LoopGuard(policy="abort", max_visits=2)
+    step(guard, HOME, Model(TYPE))
+    model = Model(CLICK)
+    decision = step(guard, HOME, model)
+    assert decision["status"] == LOOP_DETECTED
+    assert model.calls == []
+
+
+def test_off_policy_never_flags():
+    guard = LoopGuard(policy="off", max_visits=1, max_noops=1)
+    for _ in range(5):
+        assert step(guard, HOME, Model(TYPE)) == TYPE
+    assert guard.stats() == {"loop_detections": 0, "loop_hints": 0}
+
+
+def test_unknown_policy_is_rejected():
+    with pytest.raises(ValueError):
+        LoopGuard(policy="retry")
@@ -0,0 +1,92 @@
+# tests/test_observation_tracker.py
+# 增量观测 (cleaner.ObservationTracker / get_observation)：只有 DOM 真正变化才算新增 / 消失 / 变化
+# 运行: python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cleaner import ObservationTracker, get_observation
+
+
+class FakePage:
+    url = "https://example.com/"
+
+
+def element(id, text="link", tag="a", value=""):
+    return {"id": str(id), "tag": tag, "type": "", "role": "", "name": "", "text": text, "value": value,
+            "placeholder": "", "aria": "", "y": int(id) * 20}
+
+
+def payload(elements, url="https://example.com/list"):
+    return {"url": url, "title": "列表", "elements": elements, "viewport_height": 800}
+
+
+def render(tracker, elements, url="https://example.com/list", kept=None):
+    return tracker.render(url, "列表", elements, kept)
+
+
+def test_first_render_is_full_snapshot():
+    lines, full = render(ObservationTracker("verbose"), [element(1), element(2)])
+    assert full
+    assert lines[0].startswith("PAGE_INFO")
+
+
+def test_unchanged_page_reports_no_changes():
+    tracker = ObservationTracker("verbose")
+    elements = [element(i) for i in range(20)]
+    render(tracker, elements)
+    lines, full = render(tracker, elements)
+    assert not full
+    assert "(元素没有变化)" in lines
+
+
+def test_real_dom_changes_are_reported():
+    tracker = ObservationTracker("verbose")
+    render(tracker, [element(i, text=f"item {i}") for i in range(20)])
+    elements = [element(i, text=f"item {i}") for i in range(1, 20)] + [element(20, text="item 20")]
+    elements[0] = element(1, text="changed")
+    lines, full = render(tracker, elements)
+    assert not full
+    assert lines[0] == "PAGE_DIFF: +1 新增 | -1 消失 | ~1 变化"
+    assert "- ID: 0" in lines
+
+
+def test_navigation_falls_back_to_full_snapshot():
+    tracker = ObservationTracker("verbose")
+    render(tracker, [element(1)])
+    _, full = render(tracker, [element(1)], url="https://example.com/other")
+    assert full
+
+
+def test_ranking_change_on_unchanged_page_is_not_a_removal():
+    # 400 个一模一样的链接，第二步 recent_ids 给 350 加分，把它挤进预算；页面本身没有变化
+    elements = [element(i) for i in range(400)]
+    tracker = ObservationTracker("verbose")
+    first, _, _, full = get_observation(FakePage(), payload(elements), tracker, "goal")
+    assert full
+    assert "ID: 350 " not in first
+
+    text, _, _, full = get_observation(FakePage(), payload(elements), tracker, "goal", recent_ids=("350",))
+    assert not full
+    lines = text.splitlines()
+    assert lines[0] == "PAGE_DIFF: +0 新增 | -0 消失 | ~0 变化 | =1 补充列出"
+    assert not any(line.startswith("- ") for line in lines)
+    assert any(line.startswith("= ID: 350 ") for line in lines)
+
+
+def test_element_leaving_budget_is_not_listed_as_removed():
+    tracker = ObservationTracker("verbose")
+    elements = [element(i) for i in range(10)]
+    render(tracker, elements)
+    lines, full = render(tracker, elements, kept=elements[:5])
+    assert not full
+    assert "(元素没有变化)" in lines
+
+
+def test_removal_of_unlisted_element_is_not_reported():
+    tracker = ObservationTracker("verbose")
+    elements = [element(i) for i in range(10)]
+    render(tracker, elements, kept=elements[:5])
+    lines, _ = render(tracker, elements[:9], kept=elements[:5])
+    assert "(元素没有变化)" in lines
@@ -0,0 +1,102 @@
+# tests/test_result_store.py
+# 实验结果库 (result_store.ResultStore)：断点续跑、分位数、分片合并、CSV 导出
+# 运行: python -m pytest -q tests
+import os
+import csv
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from result_store import ResultStore
+
+
+def task_data(task_id, success=True, latency=1.0, tokens=100, **extra):
+    return dict({"task_id": task_id, "task_name": f"任务 {task_id}", "success": success,
+                 "status": "success" if success else "incomplete", "steps_taken": 2,
+                 "total_tokens": tokens, "total_latency": latency}, **extra)
+
+
+def step_count(store, task_id):
+    return store.conn.execute("SELECT COUNT(*) FROM steps WHERE task_id = ?", (str(task_id),)).fetchone()[0]
+
+
+def test_completed_ids_are_strings(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.record_task(task_data(1))
+    store.record_task(task_data("b"))
+    assert store.completed_ids() == {"1", "b"}
+
+
+def test_rerun_replaces_task_and_discards_old_steps(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.record_step(1, 1, {"url": "https://example.com/", "status": "ok"})
+    store.record_step(1, 2, {"url": "https://example.com/", "status": "timeout"})
+    store.discard_steps(1)
+    store.record_step(1, 1, {"url": "https://example.com/", "status": "ok"})
+    store.record_task(task_data(1, success=False))
+    store.record_task(task_data(1, success=True))
+    assert step_count(store, 1) == 1
+    summary = store.summary()
+    assert summary["tasks"] == 1
+    assert summary["success_rate"] == 1
+
+
+def test_percentiles_use_nearest_rank(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    for i in range(1, 21):
+        store.record_task(task_data(i, latency=float(i), tokens=i * 10))
+    assert store._percentile("total_latency", 0.5) == 10
+    assert store._percentile("total_latency", 0.95) == 19
+    assert store._percentile("total_tokens", 1.0) == 200
+    assert store._percentile("total_tokens", 0) == 10
+
+
+def test_percentile_of_empty_store_is_none(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    assert store._percentile("total_latency", 0.5) is None
+    assert store.summary() == {"tasks": 0}
+
+
+def test_summary_counts_statuses(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.record_task(task_data(1))
+    store.record_task(task_data(2, success=False))
+    store.record_task(task_data(3, success=False, status="loop_detected"))
+    summary = store.summary()
+    assert summary["success_rate"] == 1 / 3
+    assert summary["statuses"] == {"success": 1, "incomplete": 1, "loop_detected": 1}
+    assert summary["total_tokens"] == 300
+
+
+def test_merge_shards(tmp_path):
+    main = ResultStore(str(tmp_path / "main.db"))
+    main.record_task(task_data(1, success=False))
+    main.record_step(1, 1, {"status": "timeout"})
+
+    shard = ResultStore(str(tmp_path / "shard.db"))
+    shard.record_task(task_data(1, success=True))
+    shard.record_step(1, 1, {"status": "ok"})
+    shard.record_step(1, 2, {"status": "ok"})
+    shard.record_task(task_data(2))
+    shard.record_step(3, 1, {"status": "ok"})  # 没跑完的任务 (没有 tasks 行) 不并入
+    shard.close()
+
+    assert main.merge(str(tmp_path / "shard.db")) == 2
+    assert main.completed_ids() == {"1", "2"}
+    assert main.summary()["success_rate"] == 1
+    assert step_count(main, 1) == 2
+    assert step_count(main, 3) == 0
+
+
+def test_export_csv_keeps_old_columns_first(tmp_path):
+    store = ResultStore(str(tmp_path / "results.db"))
+    store.record_task(task_data(1, llm_calls=3))
+    store.record_task(task_data(2, loop_hints=1))
+    path = str(tmp_path / "results.csv")
+    assert store.export_csv(path) == 2
+    with open(path, encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    assert list(rows[0])[:7] == ["task_id", "task_name", "success", "status", "steps_taken", "total_tokens",
+                                 "total_latency"]
+    assert rows[0]["llm_calls"] == "3" and rows[0]["loop_hints"] == ""
+    assert rows[1]["loop_hints"] == "1"
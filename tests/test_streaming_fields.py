@@ -0,0 +1,67 @@
+# tests/test_streaming_fields.py
+# 流式决策的增量解析 (agent.StreamingFields)：头部字段什么时候算到齐
+# 运行: python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent import StreamingFields, HEAD_FIELDS
+
+
+def feed_chunks(text, size):
+    """按 size 个字符一块喂给解析器，返回 (解析器, 头部第一次到齐时的 fields)"""
+    parser = StreamingFields()
+    head = None
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+        if head is None and parser.head_complete(HEAD_FIELDS):
+            head = dict(parser.fields)
+    return parser, head
+
+
+def test_reasoning_before_action_waits_for_id_and_value():
+    text = '{"reasoning": "填用户名", "action": "type", "id": "0", "value": "standard_user"}'
+    for size in (1, 3, 7, len(text)):
+        _, head = feed_chunks(text, size)
+        assert head["action"] == "type"
+        assert head["id"] == "0"
+        assert head["value"] == "standard_user"
+
+
+def test_head_first_completes_before_reasoning():
+    text = '{"action": "click", "id": "12", "value": "", "reasoning": "点登录按钮，这段还没输出完'
+    parser, head = feed_chunks(text, 4)
+    assert head == {"action": "click", "id": "12", "value": ""}
+    assert "reasoning" not in parser.fields
+
+
+def test_field_after_action_means_head_fields_skipped():
+    # finish 不带 id / value，模型接着输出 reasoning
+    text = '{"action": "finish", "reasoning": "已经完成'
+    _, head = feed_chunks(text, 2)
+    assert head == {"action": "finish"}
+
+
+def test_reasoning_first_then_action_only_is_not_complete():
+    parser = StreamingFields()
+    parser.feed('{"reasoning": "先想一想", "action": "type", "id": "3"')
+    assert not parser.head_complete(HEAD_FIELDS)
+    parser.feed(', "value": "DeepSeek"}')
+    assert parser.head_complete(HEAD_FIELDS)
+
+
+def test_partial_action_string_is_not_complete():
+    parser = StreamingFields()
+    parser.feed('{"action": "cli')
+    assert not parser.head_complete(HEAD_FIELDS)
+    assert parser.partial["action"] == "cli"
+
+
+def test_plan_completes_when_array_closes():
+    parser = StreamingFields()
+    parser.feed('{"reasoning": "登录", "plan": [{"action": "type", "id": "1", "value": "a"}')
+    assert not parser.head_complete(HEAD_FIELDS)
+    parser.feed(', {"action": "click", "id": "3"}]')
+    assert parser.head_complete(HEAD_FIELDS)
+    assert len(parser.fields["plan"]) == 2
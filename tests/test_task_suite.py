@@ -0,0 +1,69 @@
+# tests/test_task_suite.py
+# 任务套件 (task_suite.py)：逐行读取、分片互不重叠、坏行跳过
+# 运行: python -m pytest -q tests
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+from task_suite import load_tasks, parse_shard, shard_of, normalize_task
+from config import TASK_MAX_STEPS
+
+
+def write_suite(path, records):
+    with open(path, "w", encoding="utf-8") as f:
+        for record in records:
+            f.write((record if isinstance(record, str) else json.dumps(record, ensure_ascii=False)) + "\n")
+    return str(path)
+
+
+def task(id, **extra):
+    return dict({"id": id, "url": "https://example.com/", "goal": f"任务 {id}"}, **extra)
+
+
+def test_shards_are_disjoint_and_cover_everything(tmp_path):
+    path = write_suite(tmp_path / "suite.jsonl", [task(i) for i in range(200)])
+    shards = [{t["id"] for t in load_tasks(path, shard=(i, 4))} for i in range(4)]
+    assert sum(len(s) for s in shards) == 200
+    assert set().union(*shards) == set(range(200))
+    for i in range(4):
+        for j in range(i + 1, 4):
+            assert not shards[i] & shards[j]
+
+
+def test_int_and_string_ids_are_the_same_task():
+    for count in (2, 3, 7):
+        assert shard_of(1, count) == shard_of("1", count)
+
+
+def test_duplicate_id_across_types_is_skipped(tmp_path):
+    path = write_suite(tmp_path / "suite.jsonl", [task(1), task("1")])
+    assert [t["id"] for t in load_tasks(path)] == [1]
+
+
+def test_skip_ids_use_string_form(tmp_path):
+    path = write_suite(tmp_path / "suite.jsonl", [task(1), task(2)])
+    assert [t["id"] for t in load_tasks(path, skip_ids={"1"})] == [2]
+
+
+def test_bad_lines_are_skipped(tmp_path, capsys):
+    path = write_suite(tmp_path / "suite.jsonl", [
+        "# 注释", "", task(1), "[1]", '"just a string"', {"id": 2, "url": "https://example.com/"}, "{bad json", task(3)])
+    assert [t["id"] for t in load_tasks(path)] == [1, 3]
+    assert capsys.readouterr().out.count("跳过") == 4
+
+
+def test_defaults_are_filled():
+    normalized = normalize_task(task(5))
+    assert normalized["name"] == "5"
+    assert normalized["max_steps"] == TASK_MAX_STEPS
+
+
+def test_parse_shard():
+    assert parse_shard("") is None
+    assert parse_shard("1/4") == (1, 4)
+    for bad in ("4/4", "-1/4", "1", "a/b", "0/0"):
+        with pytest.raises(ValueError):
+            parse_shard(bad)
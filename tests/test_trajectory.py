@@ -0,0 +1,69 @@
+# tests/test_trajectory.py
+# 轨迹录制与回放 (trajectory.py)：目标参数不同时，依赖参数的元素 (例如搜索结果) 也要能匹配上
+# 运行: python -m pytest -q tests
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from trajectory import TrajectoryStore, TrajectoryRecorder
+
+
+def element(id, tag, text="", **attrs):
+    el = {"id": str(id), "tag": tag, "text": text, "type": "", "role": "", "name": "", "placeholder": "", "aria": ""}
+    el.update(attrs)
+    return el
+
+
+def home_page():
+    return [element(1, "input", type="text", name="q", placeholder="搜索"), element(2, "button", "搜索")]
+
+
+def results_page(term):
+    return [element(7, "a", "首页"), element(8, "a", f"{term} 的搜索结果"), element(9, "a", f"{term} 官网")]
+
+
+def record(store, goal):
+    recorder = TrajectoryRecorder("https://search.example.com/", goal)
+    recorder.record("https://search.example.com/", home_page(),
+                    [{"action": "type", "id": "1", "value": "DeepSeek"}, {"action": "key", "value": "Enter"}])
+    recorder.record("https://search.example.com/s?wd=DeepSeek", results_page("DeepSeek"),
+                    [{"action": "click", "id": "9"}])
+    recorder.finish("https://deepseek.example.com/")
+    store.save(recorder)
+
+
+def test_replay_with_different_parameter(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.json"))
+    record(store, "搜索 'DeepSeek' 并打开它的官网")
+
+    replayer = store.replayer("https://search.example.com/", "搜索 'Kimi' 并打开它的官网")
+    assert replayer is not None
+    assert replayer.next_decision("https://search.example.com/", home_page())["value"] == "Kimi"
+    assert replayer.next_decision("https://search.example.com/", home_page())["value"] == "Enter"
+    # 结果链接的文字里带着搜索词，录制时是 "DeepSeek 官网"，回放时应该匹配 "Kimi 官网"
+    decision = replayer.next_decision("https://search.example.com/s?wd=Kimi", results_page("Kimi"))
+    assert decision == {"action": "click", "id": "9", "reasoning": "Replayed from trajectory"}
+    assert replayer.next_decision("https://deepseek.example.com/", [])["action"] == "finish"
+
+
+def test_replay_with_same_parameter(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.json"))
+    record(store, "搜索 'DeepSeek' 并打开它的官网")
+
+    replayer = store.replayer("https://search.example.com/", "搜索 'DeepSeek' 并打开它的官网")
+    replayer.next_decision("https://search.example.com/", home_page())
+    replayer.next_decision("https://search.example.com/", home_page())
+    decision = replayer.next_decision("https://search.example.com/s?wd=DeepSeek", results_page("DeepSeek"))
+    assert decision["id"] == "9"
+
+
+def test_replay_diverges_when_element_is_missing(tmp_path):
+    store = TrajectoryStore(str(tmp_path / "trajectories.json"))
+    record(store, "搜索 'DeepSeek' 并打开它的官网")
+
+    replayer = store.replayer("https://search.example.com/", "搜索 'Kimi' 并打开它的官网")
+    replayer.next_decision("https://search.example.com/", home_page())
+    replayer.next_decision("https://search.example.com/", home_page())
+    assert replayer.next_decision("https://search.example.com/s?wd=Kimi", results_page("Kimi")[:2]) is None
+    assert replayer.diverged
@@ -0,0 +1,175 @@
+# tracing.py
+"""
+轻量的分阶段计时 (span)。配置了 TRACE_FILE 时，每个 span 结束就往文件里追加一行 JSON:
+    {"name": "inject", "trace": 1, "span": 7, "parent": 3, "start": 墙钟时间, "ms": 耗时, "thread": ..., "attrs": {...}}
+
+    with span("inject") as s:
+        ...
+        s.set(elements=42)
+
+trace 是根 span (通常是 task) 的编号，同一个任务里所有 span 的 trace 相同；parent 默认是本线程当前的 span，
+跨线程 (流式决策的后台线程) 时显式传 parent=current_span()。
+没开 (TRACE_FILE 为空) 时 span() 直接返回同一个什么都不做的对象，调用处只多一次函数调用。
+
+汇总: python tracing.py trace.jsonl [--name llm]   -> 每个阶段的次数、p50、p95、最大、合计
+"""
+import sys
+import math
+import json
+import time
+import argparse
+import itertools
+import threading
+from config import TRACE_FILE
+
+
+class _NullSpan:
+    """关闭追踪时的占位 span：所有操作都是空的"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+
+class Span:
+    def __init__(self, tracer, name, parent, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.parent = parent
+        self.attrs = attrs
+        self.id = next(tracer.ids)
+        self.trace = parent.trace if parent else self.id
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        self.tracer._stack().append(self)
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        stack = self.tracer._stack()
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer._emit({
+            "name": self.name,
+            "trace": self.trace,
+            "span": self.id,
+            "parent": self.parent.id if self.parent else None,
+            "start": round(self.wall, 3),
+            "ms": round(duration * 1000, 2),
+            "thread": threading.current_thread().name,
+            "attrs": self.attrs,
+        })
+        return False
+
+
+class Tracer:
+    """所有线程共用一个 tracer；每个线程有自己的 span 栈，写文件时加锁，一行一个 span"""
+
+    def __init__(self, path=TRACE_FILE):
+        self.path = path
+        self.enabled = bool(path)
+        self.ids = itertools.count(1)
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.file = None
+
+    def span(self, name, /, parent=None, **attrs):
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, parent or self.current(), attrs)
+
+    def current(self):
+        """本线程当前的 span (没开追踪或不在任何 span 里时是 None)"""
+        if not self.enabled:
+            return None
+        stack = self._stack()
+        return stack[-1] if stack else None
+
+    def _stack(self):
+        if not hasattr(self.local, "stack"):
+            self.local.stack = []
+        return self.local.stack
+
+    def _emit(self, record):
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self.lock:
+            if self.file is None:
+                # 行缓冲：进程中途被杀也只丢最后一行
+                self.file = open(self.path, "a", encoding="utf-8", buffering=1)
+            self.file.write(line + "\n")
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+
+tracer = Tracer()
+span = tracer.span
+current_span = tracer.current
+
+
+# === 汇总 ===
+
+def percentile(sorted_values, q):
+    """最近秩法，sorted_values 已排好序"""
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+def load_spans(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # 被截断的最后一行
+
+def summarize(spans):
+    """-> {阶段名: {"count", "p50", "p95", "max", "total"}} (毫秒)"""
+    durations = {}
+    for record in spans:
+        durations.setdefault(record["name"], []).append(record["ms"])
+    summary = {}
+    for name, values in durations.items():
+        values.sort()
+        summary[name] = {"count": len(values), "p50": percentile(values, 0.5), "p95": percentile(values, 0.95),
+                         "max": values[-1], "total": sum(values)}
+    return summary
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="汇总 JSONL 追踪文件：每个阶段的 p50 / p95")
+    parser.add_argument("path", nargs="?", default=TRACE_FILE or "trace.jsonl")
+    parser.add_argument("--name", action="append", help="只看这些阶段 (可重复)")
+    args = parser.parse_args(argv)
+
+    spans = load_spans(args.path)
+    if args.name:
+        spans = (s for s in spans if s["name"] in args.name)
+    summary = summarize(spans)
+    if not summary:
+        print(f"⚠️ {args.path} 里没有 span")
+        return
+    print(f"{'阶段':<12}{'次数':>8}{'p50(ms)':>11}{'p95(ms)':>11}{'max(ms)':>11}{'合计(s)':>10}")
+    for name, s in sorted(summary.items(), key=lambda kv: -kv[1]["total"]):
+        print(f"{name:<12}{s['count']:>8}{s['p50']:>11.1f}{s['p95']:>11.1f}{s['max']:>11.1f}{s['total'] / 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
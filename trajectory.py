@@ -0,0 +1,177 @@
+# trajectory.py
+import os
+import re
+import json
+import threading
+from urllib.parse import urlsplit
+from config import TRAJECTORY_FILE
+
+# 元素指纹里参与匹配的字段 (id 每次注入都可能不同，不能用)
+FINGERPRINT_FIELDS = ('tag', 'text', 'type', 'role', 'name', 'placeholder', 'aria')
+# 指纹里可能包含目标参数的字段 (例如搜索结果的标题就是搜索词)，录制时模板化，回放时代入新参数
+TEMPLATED_FIELDS = ('text', 'placeholder', 'aria')
+
+# 目标里引号括起来的部分视为参数: "在搜索框输入 'DeepSeek'" -> "在搜索框输入 '{0}'"
+_PARAM_RE = re.compile(r"(['\"‘“「])(.+?)(['\"’”」])")
+
+
+def goal_template(goal):
+    """返回 (模板, 参数列表)"""
+    params = []
+
+    def repl(match):
+        params.append(match.group(2))
+        return f"{match.group(1)}{{{len(params) - 1}}}{match.group(3)}"
+
+    return _PARAM_RE.sub(repl, goal), params
+
+
+def site_of(url):
+    return urlsplit(url).netloc
+
+
+def page_of(url):
+    """同一个页面: 域名 + 路径相同 (查询参数里常带搜索词，不参与比较)"""
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
+
+
+def fingerprint(element):
+    return {k: element.get(k, '') for k in FINGERPRINT_FIELDS}
+
+
+def match_element(fp, elements):
+    """
+    在当前页面里找和指纹最像的元素。
+    标签必须相同；录制时有文字的，文字也必须相同；其余属性每相同一个加一分。
+    返回匹配到的元素，找不到返回 None。
+    """
+    best, best_score = None, 0
+    for el in elements:
+        if el.get('tag') != fp['tag']:
+            continue
+        if fp['text'] and el.get('text', '') != fp['text']:
+            continue
+        score = 3 if fp['text'] else 0
+        score += sum(1 for k in FINGERPRINT_FIELDS[2:] if fp[k] and el.get(k, '') == fp[k])
+        if score > best_score:
+            best, best_score = el, score
+    return best if best_score >= 2 else None
+
+
+class TrajectoryRecorder:
+    """录制一次任务执行过的步骤，任务成功后交给 TrajectoryStore 保存"""
+
+    def __init__(self, start_url, goal):
+        self.site = site_of(start_url)
+        self.template, self.params = goal_template(goal)
+        self.steps = []
+
+    def _templated(self, value):
+        value = value or ""
+        for i, param in enumerate(self.params):
+            value = value.replace(param, f"{{{i}}}")
+        return value
+
+    def _templated_fingerprint(self, element):
+        fp = fingerprint(element)
+        for k in TEMPLATED_FIELDS:
+            fp[k] = self._templated(fp[k])
+        return fp
+
+    def record(self, url, elements, steps):
+        """steps: 本轮真正执行成功的动作 (在 url 页面、基于 elements 观测做出的)"""
+        by_id = {el['id']: el for el in elements}
+        for step in steps:
+            target = by_id.get(step.get('id')) if step.get('id') else None
+            self.steps.append({
+                "page": page_of(url),
+                "action": step.get('action'),
+                "value": self._templated(step.get('value')),
+                "fingerprint": self._templated_fingerprint(target) if target else None,
+            })
+
+    def finish(self, url):
+        self.steps.append({"page": page_of(url), "action": "finish", "value": "", "fingerprint": None})
+
+
+class TrajectoryReplayer:
+    """
+    按录制的轨迹逐步给出决策。页面对不上 (URL 不同或找不到指纹匹配的元素) 就宣布分叉，
+    之后一直返回 None，交还给 LLM。
+    """
+
+    def __init__(self, trajectory, params):
+        self.steps = trajectory["steps"]
+        self.params = params
+        self.index = 0
+        self.diverged = False
+
+    def next_decision(self, url, elements):
+        if self.diverged or self.index >= len(self.steps):
+            return None
+        step = self.steps[self.index]
+        if step["page"] != page_of(url):
+            self.diverged = True
+            return None
+
+        decision = {"action": step["action"], "reasoning": "Replayed from trajectory"}
+        if step["value"]:
+            decision["value"] = self._fill(step["value"])
+        if step["fingerprint"]:
+            fp = dict(step["fingerprint"])
+            for k in TEMPLATED_FIELDS:
+                fp[k] = self._fill(fp.get(k, ''))
+            el = match_element(fp, elements)
+            if el is None:
+                self.diverged = True
+                return None
+            decision["id"] = el["id"]
+        self.index += 1
+        return decision
+
+    def _fill(self, value):
+        for i, param in enumerate(self.params):
+            value = value.replace(f"{{{i}}}", param)
+        return value
+
+
+class TrajectoryStore:
+    """轨迹文件 (JSON)，key = 站点 + 目标模板。多个 worker 线程共用，加锁读写。"""
+
+    def __init__(self, path=TRAJECTORY_FILE):
+        self.path = path
+        self.lock = threading.Lock()
+        self.trajectories = {}
+        if os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as f:
+                    self.trajectories = json.load(f)
+            except Exception as e:
+                print(f"⚠️ 轨迹文件读取失败，忽略: {e}")
+
+    @staticmethod
+    def _key(site, template):
+        return f"{site}::{template}"
+
+    def replayer(self, start_url, goal):
+        template, params = goal_template(goal)
+        with self.lock:
+            trajectory = self.trajectories.get(self._key(site_of(start_url), template))
+        if not trajectory or trajectory.get("params", 0) != len(params):
+            return None
+        return TrajectoryReplayer(trajectory, params)
+
+    def save(self, recorder):
+        trajectory = {
+            "site": recorder.site,
+            "template": recorder.template,
+            "params": len(recorder.params),
+            "steps": recorder.steps,
+        }
+        with self.lock:
+            self.trajectories[self._key(recorder.site, recorder.template)] = trajectory
+            tmp = self.path + ".tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(self.trajectories, f, ensure_ascii=False, indent=2)
+            os.replace(tmp, self.path)